@@ -0,0 +1,100 @@
+"""Expansion of mobile application archives (APK, XAPK, IPA) received as files."""
+
+import io
+import logging
+import pathlib
+import zipfile
+import zlib
+from collections.abc import Iterator
+
+from agent import utils
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FILE_TYPES = ("apk", "xapk", "ipa")
+NESTED_ARCHIVE_EXTENSIONS = (".apk", ".xapk", ".ipa")
+MAX_NESTED_ARCHIVE_DEPTH = 1
+MAX_ENTRY_SIZE = 64 * 1024 * 1024
+NESTED_ENTRY_SEPARATOR = "!/"
+
+
+def iter_entries(
+    content: bytes,
+    depth: int = 0,
+    max_entry_size: int = MAX_ENTRY_SIZE,
+    exclude_path_regexes: list[str] | None = None,
+    path_prefix: str = "",
+) -> Iterator[tuple[str, bytes]]:
+    """Iterate over the files of a zip based archive without extracting it.
+
+    Entries under irrelevant or excluded paths are skipped before being decompressed, nested archives like the APKs of
+    an XAPK are expanded in place and their entries are prefixed with the nested archive path. The size limit applies to
+    nested archives as well as to the files they contain. Entries that cannot be read, encrypted, corrupted or
+    compressed with an unsupported method, are skipped.
+
+    Args:
+        content: The archive bytes.
+        depth: Nesting depth of the archive.
+        max_entry_size: Entries larger than this number of bytes are skipped.
+        exclude_path_regexes: Patterns of the entry paths that are skipped, matched against the prefixed path.
+        path_prefix: Prefix of the entry paths, the path of the nested archive.
+
+    Yields:
+        Tuples of the entry path and the entry content.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(content))
+    except zipfile.BadZipFile as e:
+        logger.warning("Could not open archive: %s", e)
+        return
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir() is True or utils.is_irrelevant_path(info.filename):
+                continue
+            entry_path = f"{path_prefix}{info.filename}"
+            if utils.should_exclude_path(entry_path, exclude_path_regexes) is True:
+                continue
+            is_nested_archive = (
+                info.filename.endswith(NESTED_ARCHIVE_EXTENSIONS)
+                and depth < MAX_NESTED_ARCHIVE_DEPTH
+            )
+            if info.file_size > max_entry_size:
+                logger.warning(
+                    "Skipping archive entry %s of %d bytes, larger than %d bytes.",
+                    entry_path,
+                    info.file_size,
+                    max_entry_size,
+                )
+                continue
+            try:
+                entry_content = archive.read(info)
+            except (
+                RuntimeError,
+                NotImplementedError,
+                zipfile.BadZipFile,
+                zlib.error,
+            ) as e:
+                logger.warning(
+                    "Skipping unreadable archive entry %s: %s", entry_path, e
+                )
+                continue
+            if is_nested_archive is True:
+                yield from iter_entries(
+                    entry_content,
+                    depth + 1,
+                    max_entry_size=max_entry_size,
+                    exclude_path_regexes=exclude_path_regexes,
+                    path_prefix=f"{entry_path}{NESTED_ENTRY_SEPARATOR}",
+                )
+                continue
+            yield entry_path, entry_content
+
+
+def safe_relative_path(entry_path: str) -> pathlib.Path:
+    """Relative path under which an archive entry can be written without escaping the target directory."""
+    parts = [
+        part
+        for part in pathlib.PurePosixPath(entry_path).parts
+        if part not in ("", "/", ".", "..")
+    ]
+    return pathlib.Path(*parts)
@@ -0,0 +1,89 @@
+"""Persisted checkpoints of the jobs that did not complete before the agent stopped."""
+
+import base64
+import json
+import logging
+import uuid
+
+import redis
+from ostorlab.agent.message import message as m
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTS_KEY = "trufflehog_job_checkpoints"
+# Seconds the checkpoints are kept after the last saved one, and after the scan is done.
+CHECKPOINTS_TTL = 24 * 3600
+SCAN_DONE_CHECKPOINTS_TTL = 3600
+
+
+class JobCheckpoints:
+    """Job descriptors stored in a Redis hash, shared between the agent replicas of a scan.
+
+    A job is checkpointed with the message it processes before it starts and released once it completes. Jobs that are
+    still checkpointed when an agent stops, because they were queued or interrupted, are resumed by the next agent
+    that starts. Releasing deletes the checkpoint atomically, so a checkpoint is resumed by a single replica and the
+    hash only holds the jobs that did not complete.
+    """
+
+    def __init__(self, client: redis.Redis) -> None:
+        """Construct the checkpoints.
+
+        Args:
+            client: The Redis client shared by the replicas.
+        """
+        self._client = client
+
+    def save(self, message: m.Message) -> str:
+        """Checkpoint a job.
+
+        Args:
+            message: The message processed by the job.
+
+        Returns:
+            The job identifier to release once the job completes.
+        """
+        job_id = uuid.uuid4().hex
+        descriptor = json.dumps(
+            {
+                "selector": message.selector,
+                "raw": base64.b64encode(message.raw).decode(),
+            }
+        )
+        with self._client.pipeline() as pipeline:
+            pipeline.hset(CHECKPOINTS_KEY, job_id, descriptor)
+            pipeline.expire(CHECKPOINTS_KEY, CHECKPOINTS_TTL)
+            pipeline.execute()
+        return job_id
+
+    def release(self, job_id: str) -> bool:
+        """Release the checkpoint of a completed or resumed job.
+
+        Returns:
+            True if the checkpoint was not already released.
+        """
+        return bool(self._client.hdel(CHECKPOINTS_KEY, job_id) == 1)
+
+    def expire(self, ttl: int = SCAN_DONE_CHECKPOINTS_TTL) -> None:
+        """Expire the checkpoints once the scan is done, the jobs that did not complete are resumed until then."""
+        self._client.expire(CHECKPOINTS_KEY, ttl)
+
+    def pending(self) -> list[tuple[str, m.Message]]:
+        """Jobs that are checkpointed and were not released, with their message."""
+        jobs = []
+        for job_id, descriptor in self._client.hgetall(CHECKPOINTS_KEY).items():
+            job_id = _to_str(job_id)
+            try:
+                data = json.loads(descriptor)
+                message = m.Message.from_raw(
+                    data["selector"], base64.b64decode(data["raw"])
+                )
+            except (ValueError, KeyError) as e:
+                logger.error("Dropping invalid job checkpoint %s: %s", job_id, e)
+                self.release(job_id)
+                continue
+            jobs.append((job_id, message))
+        return jobs
+
+
+def _to_str(value: str | bytes) -> str:
+    return value.decode() if isinstance(value, bytes) else value
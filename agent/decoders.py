@@ -0,0 +1,177 @@
+"""Pre-scan decoding of binary file formats into compact text."""
+
+import datetime
+import logging
+import plistlib
+import struct
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+AXML_STRING_POOL_TYPE = 0x0001
+AXML_UTF8_FLAG = 1 << 8
+AXML_HEADER_SIZE = 8
+
+
+class DecodingError(Exception):
+    """Raised when a binary file does not match its detected format."""
+
+
+def decode_android_binary_xml(content: bytes) -> bytes:
+    """Extract the string pool of an Android binary XML file, one string per line.
+
+    The string pool holds the element and attribute names as well as every string attribute value, which is where
+    API keys and URLs of manifests and resources end up.
+
+    Args:
+        content: The binary XML bytes.
+
+    Returns:
+        The pool strings separated by new lines.
+
+    Raises:
+        DecodingError: if the file has no valid string pool.
+    """
+    offset = AXML_HEADER_SIZE
+    while offset + 8 <= len(content):
+        chunk_type, header_size, chunk_size = struct.unpack_from(
+            "<HHI", content, offset
+        )
+        if chunk_size == 0:
+            break
+        if chunk_type == AXML_STRING_POOL_TYPE:
+            strings = _read_string_pool(content, offset, header_size)
+            return "\n".join(strings).encode("utf-8", errors="ignore")
+        offset += chunk_size
+    raise DecodingError("No string pool found in Android binary XML.")
+
+
+def _read_string_pool(content: bytes, chunk_offset: int, header_size: int) -> list[str]:
+    try:
+        string_count, _, flags, strings_start, _ = struct.unpack_from(
+            "<IIIII", content, chunk_offset + 8
+        )
+        string_offsets = struct.unpack_from(
+            f"<{string_count}I", content, chunk_offset + header_size
+        )
+    except struct.error as e:
+        raise DecodingError(f"Truncated string pool: {e}") from e
+    data_offset = chunk_offset + strings_start
+    is_utf8 = flags & AXML_UTF8_FLAG != 0
+    strings = []
+    for string_offset in string_offsets:
+        position = data_offset + string_offset
+        try:
+            if is_utf8 is True:
+                strings.append(_read_utf8_string(content, position))
+            else:
+                strings.append(_read_utf16_string(content, position))
+        except (IndexError, struct.error, UnicodeDecodeError):
+            continue
+    return [string for string in strings if string != ""]
+
+
+def _read_utf8_string(content: bytes, position: int) -> str:
+    # The UTF-16 length comes first and is skipped, then the UTF-8 length in bytes.
+    position += 2 if content[position] & 0x80 else 1
+    length = content[position]
+    if length & 0x80:
+        length = ((length & 0x7F) << 8) | content[position + 1]
+        position += 2
+    else:
+        position += 1
+    return content[position : position + length].decode("utf-8")
+
+
+def _read_utf16_string(content: bytes, position: int) -> str:
+    (length,) = struct.unpack_from("<H", content, position)
+    position += 2
+    if length & 0x8000:
+        (low,) = struct.unpack_from("<H", content, position)
+        length = ((length & 0x7FFF) << 16) | low
+        position += 2
+    return content[position : position + length * 2].decode("utf-16-le")
+
+
+def decode_binary_plist(content: bytes) -> bytes:
+    """Flatten a binary property list into `key: value` lines.
+
+    Args:
+        content: The binary plist bytes.
+
+    Returns:
+        One line per scalar value, prefixed with its key path.
+
+    Raises:
+        DecodingError: if the content is not a valid property list.
+    """
+    try:
+        root = plistlib.loads(content)
+    except (plistlib.InvalidFileException, ValueError, OverflowError) as e:
+        raise DecodingError(f"Invalid binary plist: {e}") from e
+    lines: list[str] = []
+    _flatten_plist_value("", root, lines, set())
+    return "\n".join(lines).encode("utf-8", errors="ignore")
+
+
+def _flatten_plist_value(
+    key: str, value: Any, lines: list[str], ancestors: set[int]
+) -> None:
+    """Append the scalar values of a plist value to the lines.
+
+    Binary plists reference their objects, a container can hold itself. Containers already being flattened are
+    skipped.
+    """
+    if isinstance(value, (dict, list)):
+        if id(value) in ancestors:
+            return
+        ancestors.add(id(value))
+        if isinstance(value, dict):
+            for child_key, child_value in value.items():
+                child_path = f"{key}.{child_key}" if key != "" else str(child_key)
+                _flatten_plist_value(child_path, child_value, lines, ancestors)
+        else:
+            for index, child_value in enumerate(value):
+                _flatten_plist_value(f"{key}[{index}]", child_value, lines, ancestors)
+        ancestors.remove(id(value))
+    elif isinstance(value, bytes):
+        text = value.decode("utf-8", errors="ignore")
+        if text.isprintable() is True and text != "":
+            lines.append(f"{key}: {text}")
+    elif isinstance(value, (str, int, float, datetime.datetime, plistlib.UID)):
+        lines.append(f"{key}: {value}")
+
+
+DECODERS: dict[str, Callable[[bytes], bytes]] = {
+    "android_binary_xml": decode_android_binary_xml,
+    "android_manifest": decode_android_binary_xml,
+    "binary_plist": decode_binary_plist,
+}
+
+
+def decode(file_type: str, content: bytes) -> bytes:
+    """Convert a binary file to the text form that is scanned, based on its detected type.
+
+    Args:
+        file_type: The type returned by `utils.get_file_type`.
+        content: The file content.
+
+    Returns:
+        The decoded text, or the original content if the type has no decoder or decoding failed.
+    """
+    decoder = DECODERS.get(file_type)
+    if decoder is None:
+        return content
+    try:
+        decoded_content = decoder(content)
+    except DecodingError as e:
+        logger.debug("Scanning raw %s content: %s", file_type, e)
+        return content
+    except Exception:
+        logger.exception("Could not decode %s content, scanning it raw.", file_type)
+        return content
+    logger.debug(
+        "Decoded %s from %d to %d bytes.", file_type, len(content), len(decoded_content)
+    )
+    return decoded_content
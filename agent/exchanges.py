@@ -0,0 +1,248 @@
+"""Extraction of the scannable parts of captured HTTP request/response exchanges."""
+
+import collections
+import hashlib
+import heapq
+import logging
+import re
+import threading
+import urllib.parse
+from collections.abc import Callable
+from typing import Any
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+TEXT_CONTENT_TYPE_PREFIXES = ("text/",)
+TEXT_CONTENT_TYPE_MARKERS = (
+    "json",
+    "xml",
+    "javascript",
+    "ecmascript",
+    "x-www-form-urlencoded",
+    "graphql",
+    "yaml",
+)
+DEFAULT_MAX_BODY_SIZE = 5 * 1024 * 1024
+DEFAULT_SIMILARITY_THRESHOLD = 0.5
+DEFAULT_MAX_ENDPOINTS = 1000
+SHINGLE_SIZE = 3
+SKETCH_SIZE = 256
+DELTA_CONTEXT_LINES = 1
+# Path segments holding identifiers, replaced so that captures of the same route share their history.
+IDENTIFIER_SEGMENT_PATTERN = re.compile(
+    r"^([0-9]+|[0-9a-fA-F]{16,}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})$"
+)
+
+# Receives the digest of a part and returns True the first time it is seen.
+IsSeenPart = Callable[[str], bool]
+
+
+def is_text_content_type(content_type: str | None) -> bool:
+    """Report whether a body of the content type is text, bodies without a content type are assumed to be text."""
+    if content_type is None or content_type.strip() == "":
+        return True
+    media_type = content_type.split(";")[0].strip().lower()
+    return media_type.startswith(TEXT_CONTENT_TYPE_PREFIXES) or any(
+        marker in media_type for marker in TEXT_CONTENT_TYPE_MARKERS
+    )
+
+
+def _header_value(headers: list[dict[str, Any]], name: str) -> str | None:
+    for header in headers:
+        if str(header.get("name", "")).lower() == name:
+            return str(header.get("value", ""))
+    return None
+
+
+def _headers_content(headers: list[dict[str, Any]]) -> bytes:
+    return b"\n".join(
+        f"{header.get('name', '')}: {header.get('value', '')}".encode(
+            "utf-8", errors="ignore"
+        )
+        for header in headers
+    )
+
+
+def _body_content(
+    body: bytes, headers: list[dict[str, Any]], max_body_size: int | None
+) -> bytes:
+    if body == b"":
+        return b""
+    if is_text_content_type(_header_value(headers, "content-type")) is False:
+        metrics.COUNTERS.increment("exchanges.skipped_binary_bodies")
+        return b""
+    if max_body_size is not None and len(body) > max_body_size:
+        metrics.COUNTERS.increment("exchanges.skipped_large_bodies")
+        logger.debug("Skipping body of %d bytes.", len(body))
+        return b""
+    return body
+
+
+def scannable_content(
+    request: dict[str, Any],
+    response: dict[str, Any],
+    is_seen_part: IsSeenPart,
+    max_body_size: int | None = DEFAULT_MAX_BODY_SIZE,
+) -> tuple[bytes, list[str]]:
+    """Build the content to scan from the headers and bodies of a captured exchange.
+
+    Crawlers replay the same static responses many times, so every part is hashed separately and only parts that
+    were not seen before in the scan are kept. Bodies with a non-text content type or above the size cap are dropped.
+    Parts are not marked as seen here, the caller marks their digests once the content is scanned.
+
+    Args:
+        request: The request data of the exchange.
+        response: The response data of the exchange.
+        is_seen_part: Callback reporting whether the digest of a part was already scanned.
+        max_body_size: Maximum size of a scanned body in bytes, None for no limit.
+
+    Returns:
+        The new parts separated by new lines, empty if there is nothing left to scan, and the digests of the new
+        parts.
+    """
+    parts = []
+    for data in (request, response):
+        headers = list(data.get("headers") or [])
+        parts.append(_headers_content(headers))
+        parts.append(_body_content(data.get("body") or b"", headers, max_body_size))
+    new_parts = []
+    new_part_digests = []
+    for part in parts:
+        if part == b"":
+            continue
+        digest = hashlib.sha256(part).hexdigest()
+        if is_seen_part(digest) is True:
+            metrics.COUNTERS.increment("exchanges.duplicate_parts")
+            continue
+        new_parts.append(part)
+        new_part_digests.append(digest)
+    return b"\n".join(new_parts), new_part_digests
+
+
+def endpoint_key(request: dict[str, Any]) -> str:
+    """Key of the endpoint of a request: its method and normalized URL without query nor identifier segments."""
+    method = str(request.get("method") or "GET").upper()
+    url = urllib.parse.urlsplit(str(request.get("url") or ""))
+    segments = [
+        "{id}" if IDENTIFIER_SEGMENT_PATTERN.match(segment) is not None else segment
+        for segment in url.path.rstrip("/").split("/")
+    ]
+    return f"{method} {url.scheme.lower()}://{url.netloc.lower()}{'/'.join(segments)}"
+
+
+def _line_hash(line: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(line, digest_size=8).digest(), "big")
+
+
+def _sketch(line_hashes: list[int]) -> list[int]:
+    """Bottom-k sketch of the shingles of consecutive lines, used to estimate the similarity of two contents."""
+    shingles = {
+        hash(tuple(line_hashes[index : index + SHINGLE_SIZE]))
+        for index in range(max(len(line_hashes) - SHINGLE_SIZE + 1, 1))
+    }
+    return heapq.nsmallest(SKETCH_SIZE, shingles)
+
+
+def similarity(sketch: list[int], other_sketch: list[int]) -> float:
+    """Estimate the Jaccard similarity of the shingles of two contents from their sketches."""
+    union_sketch = heapq.nsmallest(SKETCH_SIZE, set(sketch) | set(other_sketch))
+    if len(union_sketch) == 0:
+        return 1.0
+    common_shingles = set(sketch) & set(other_sketch)
+    return sum(1 for shingle in union_sketch if shingle in common_shingles) / len(
+        union_sketch
+    )
+
+
+class _Fingerprint:
+    __slots__ = ("line_hashes", "sketch")
+
+    def __init__(self, line_hashes: set[int], sketch: list[int]) -> None:
+        self.line_hashes = line_hashes
+        self.sketch = sketch
+
+
+class EndpointHistory:
+    """Rolling fingerprint of the last capture of every endpoint, used to only scan what changed since then.
+
+    Crawlers capture the same endpoints over and over with bodies that only differ by timestamps or nonces. When the
+    new capture of an endpoint is similar enough to the previous one, only the changed lines and their neighbours are
+    scanned; below the similarity threshold the whole content is scanned. The history is kept in memory, bounded to
+    the most recently captured endpoints.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        max_endpoints: int = DEFAULT_MAX_ENDPOINTS,
+    ) -> None:
+        """Construct the history.
+
+        Args:
+            similarity_threshold: Minimum estimated similarity with the previous capture to only scan the delta.
+            max_endpoints: Maximum number of endpoints whose fingerprint is kept.
+
+        Raises:
+            ValueError: if the threshold is not in [0, 1] or the endpoint count is not positive.
+        """
+        if similarity_threshold < 0 or similarity_threshold > 1:
+            raise ValueError(
+                f"Similarity threshold must be in [0, 1], got {similarity_threshold}."
+            )
+        if max_endpoints < 1:
+            raise ValueError(f"Max endpoints must be positive, got {max_endpoints}.")
+        self._similarity_threshold = similarity_threshold
+        self._max_endpoints = max_endpoints
+        self._lock = threading.Lock()
+        self._fingerprints: collections.OrderedDict[str, _Fingerprint] = (
+            collections.OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def delta(self, endpoint: str, content: bytes) -> bytes:
+        """Record the content as the last capture of the endpoint and return the part of it to scan.
+
+        Args:
+            endpoint: The endpoint key, see `endpoint_key`.
+            content: The scannable content of the capture.
+
+        Returns:
+            The whole content for the first or a dissimilar capture, the changed regions otherwise.
+        """
+        lines = content.split(b"\n")
+        line_hashes = [_line_hash(line) for line in lines]
+        fingerprint = _Fingerprint(set(line_hashes), _sketch(line_hashes))
+        with self._lock:
+            previous = self._fingerprints.pop(endpoint, None)
+            self._fingerprints[endpoint] = fingerprint
+            if len(self._fingerprints) > self._max_endpoints:
+                self._fingerprints.popitem(last=False)
+        if (
+            previous is None
+            or similarity(previous.sketch, fingerprint.sketch)
+            < self._similarity_threshold
+        ):
+            metrics.COUNTERS.increment("exchanges.full_scans")
+            return content
+        changed = [
+            index
+            for index, line_hash in enumerate(line_hashes)
+            if line_hash not in previous.line_hashes
+        ]
+        kept: set[int] = set()
+        for index in changed:
+            kept.update(
+                range(
+                    max(index - DELTA_CONTEXT_LINES, 0),
+                    min(index + DELTA_CONTEXT_LINES + 1, len(lines)),
+                )
+            )
+        metrics.COUNTERS.increment("exchanges.delta_scans")
+        metrics.COUNTERS.increment(
+            "exchanges.skipped_unchanged_lines", len(lines) - len(kept)
+        )
+        return b"\n".join(lines[index] for index in sorted(kept))
@@ -0,0 +1,105 @@
+"""Compact record of the trufflehog finding fields used by the agent."""
+
+import pathlib
+from typing import Any
+
+
+class Finding:
+    """Projection of a trufflehog JSON finding on the fields the agent reads.
+
+    Findings are projected once when the scanner output is parsed, the unused trufflehog fields like `ExtraData`
+    and `StructuredData` are dropped, and the values derived from the finding are computed then.
+    """
+
+    __slots__ = (
+        "dedup_key",
+        "detector_name",
+        "file_path",
+        "line",
+        "raw",
+        "raw_v2",
+        "redacted",
+        "score",
+        "verified",
+    )
+
+    def __init__(
+        self,
+        raw: str | None = None,
+        raw_v2: str | None = None,
+        redacted: str | None = None,
+        detector_name: str | None = None,
+        verified: bool = False,
+        file_path: str | None = None,
+        line: int | None = None,
+    ) -> None:
+        self.raw = raw
+        self.raw_v2 = raw_v2
+        self.redacted = redacted
+        self.detector_name = detector_name
+        self.verified = verified
+        self.file_path = file_path
+        self.line = line
+        self.dedup_key = raw if raw is not None else ""
+        # Likelihood of being a real secret, set when findings are scored.
+        self.score: float | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any], base_path: str | None = None) -> "Finding":
+        """Project a decoded trufflehog finding.
+
+        Args:
+            data: The decoded trufflehog finding.
+            base_path: The scanned directory the file path of the finding is made relative to.
+        """
+        source_metadata = data.get("SourceMetadata") or {}
+        source_data = source_metadata.get("Data") or {}
+        filesystem_source = source_data.get("Filesystem")
+        file_path = None
+        line = None
+        if isinstance(filesystem_source, dict):
+            file_path = relative_file_path(filesystem_source.get("file"), base_path)
+            line = filesystem_source.get("line")
+        return cls(
+            raw=data.get("Raw"),
+            raw_v2=data.get("RawV2") or None,
+            redacted=data.get("Redacted"),
+            detector_name=data.get("DetectorName"),
+            verified=data.get("Verified") is True,
+            file_path=file_path,
+            line=line,
+        )
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Finding):
+            return NotImplemented
+        return all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        return (
+            f"Finding(detector_name={self.detector_name!r}, redacted={self.redacted!r}, "
+            f"verified={self.verified!r}, file_path={self.file_path!r})"
+        )
+
+
+def relative_file_path(file_path: Any, base_path: str | None) -> str | None:
+    """Path of a scanned file relative to the scanned directory.
+
+    Args:
+        file_path: The file path reported by trufflehog.
+        base_path: The scanned directory, None to keep the reported path.
+
+    Returns:
+        The relative path, the reported path if it is not under the scanned directory, None if there is no path.
+    """
+    if isinstance(file_path, str) is False or file_path == "":
+        return None
+    path = pathlib.Path(file_path)
+    if base_path is not None and path.is_absolute() is True:
+        try:
+            return str(path.relative_to(base_path))
+        except ValueError:
+            return str(file_path)
+    return str(file_path)
@@ -0,0 +1,89 @@
+"""Index of known third-party library builds that are skipped instead of scanned."""
+
+import hashlib
+import logging
+import pathlib
+import re
+import threading
+from collections.abc import Iterable
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+KNOWN_LIBRARIES_PATH = pathlib.Path(__file__).parent / "data" / "known_libraries.sha256"
+FINGERPRINTED_FILE_TYPES = ("js",)
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def fingerprint(content: bytes) -> str:
+    """Fingerprint of a file content, the hex SHA-256 digest."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class FingerprintIndex:
+    """Set of fingerprints of files known to never hold customer secrets, like minified library builds."""
+
+    def __init__(self, digests: Iterable[str] = ()) -> None:
+        self._lock = threading.Lock()
+        self._digests: set[str] = set()
+        for digest in digests:
+            self.add(digest)
+
+    @classmethod
+    def from_file(cls, path: pathlib.Path) -> "FingerprintIndex":
+        """Load the index from a file holding one digest per line, followed by an optional library name.
+
+        Raises:
+            ValueError: if a line does not start with a SHA-256 hex digest.
+        """
+        index = cls()
+        with path.open() as digests_file:
+            for line_number, line in enumerate(digests_file, start=1):
+                line = line.strip()
+                if line == "" or line.startswith("#"):
+                    continue
+                digest = line.split()[0]
+                if SHA256_PATTERN.match(digest.lower()) is None:
+                    raise ValueError(
+                        f"Invalid fingerprint {digest!r} at {path}:{line_number}."
+                    )
+                index.add(digest)
+        logger.info("Loaded %d known library fingerprints from %s.", len(index), path)
+        return index
+
+    def add(self, digest: str) -> None:
+        """Add the SHA-256 hex digest of a known file.
+
+        Raises:
+            ValueError: if the digest is not a SHA-256 hex digest.
+        """
+        digest = digest.lower()
+        if SHA256_PATTERN.match(digest) is None:
+            raise ValueError(f"Invalid fingerprint {digest!r}.")
+        with self._lock:
+            self._digests.add(digest)
+
+    def add_content(self, content: bytes) -> None:
+        """Add the fingerprint of a known file content."""
+        self.add(fingerprint(content))
+
+    def is_known(self, content: bytes) -> bool:
+        """Report whether the content is a known file, always False on an empty index."""
+        if len(self._digests) == 0:
+            return False
+        return fingerprint(content) in self._digests
+
+    def should_skip(self, file_type: str, content: bytes) -> bool:
+        """Report whether a file is a known library build that does not need to be scanned.
+
+        Only file types listed in `FINGERPRINTED_FILE_TYPES` are hashed, skipped files and bytes are counted.
+        """
+        if file_type not in FINGERPRINTED_FILE_TYPES or self.is_known(content) is False:
+            return False
+        metrics.COUNTERS.increment("fingerprints.skipped_files")
+        metrics.COUNTERS.increment("fingerprints.skipped_bytes", len(content))
+        return True
+
+    def __len__(self) -> int:
+        return len(self._digests)
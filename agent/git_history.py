@@ -0,0 +1,224 @@
+"""Bounded and per-branch parallel scans of the history of git links."""
+
+import concurrent.futures
+import dataclasses
+import datetime
+import logging
+import subprocess
+import tempfile
+from collections.abc import Callable
+from typing import Any
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GIT_TIMEOUT = 1800.0
+
+# Runs trufflehog's git source on the target with the extra flags, returns the scanner output.
+RunScanner = Callable[[str, list[str]], bytes | None]
+
+
+class GitError(Exception):
+    """Raised when a git command run to prepare a scan fails."""
+
+
+@dataclasses.dataclass(frozen=True)
+class HistoryBounds:
+    """Limits of the history scanned for git links and parallelism of the scan."""
+
+    max_depth: int | None = None
+    since_date: str | None = None
+    branches: tuple[str, ...] = ()
+    parallel_branches: int = 1
+
+    def __post_init__(self) -> None:
+        if self.max_depth is not None and self.max_depth < 1:
+            raise ValueError(f"Git max depth must be positive, got {self.max_depth}.")
+        if self.since_date is not None:
+            try:
+                datetime.date.fromisoformat(self.since_date)
+            except ValueError as e:
+                raise ValueError(
+                    f"Git since date must be an ISO date like 2024-01-31, got {self.since_date!r}."
+                ) from e
+        if any(branch == "" for branch in self.branches):
+            raise ValueError("Git branches must not be empty.")
+        if self.parallel_branches < 1:
+            raise ValueError(
+                f"Parallel branch scans must be positive, got {self.parallel_branches}."
+            )
+
+    @classmethod
+    def from_args(cls, args: dict[str, Any]) -> "HistoryBounds":
+        """Build and validate the bounds from the agent arguments.
+
+        Raises:
+            ValueError: if an argument value is invalid.
+        """
+        max_depth = args.get("git_max_depth")
+        return cls(
+            max_depth=int(max_depth) if max_depth else None,
+            since_date=args.get("git_since_date") or None,
+            branches=tuple(args.get("git_branches") or ()),
+            parallel_branches=int(args.get("git_parallel_branches") or 1),
+        )
+
+    def requires_clone(self, link_type: str) -> bool:
+        """Report whether scanning the link needs a local clone, rather than passing the link to trufflehog.
+
+        Trufflehog scans a single branch of a remote link and only knows commit based bounds, a local clone is used to
+        resolve the since date, list the branches and scan them in parallel. Gitlab links are scanned through the git
+        source of the clone, the gitlab source has no history bounds.
+        """
+        if (
+            self.since_date is not None
+            or len(self.branches) > 1
+            or self.parallel_branches > 1
+        ):
+            return True
+        return link_type != "git" and (
+            self.max_depth is not None or len(self.branches) > 0
+        )
+
+    def flags(self) -> list[str]:
+        """Trufflehog flags applying the bounds to a scan of the remote link."""
+        flags = []
+        if self.max_depth is not None:
+            flags.append(f"--max-depth={self.max_depth}")
+        if len(self.branches) == 1:
+            flags.append(f"--branch={self.branches[0]}")
+        return flags
+
+
+def _git(arguments: list[str], timeout: float | None = DEFAULT_GIT_TIMEOUT) -> str:
+    try:
+        completed = subprocess.run(
+            ["git", *arguments],
+            capture_output=True,
+            check=True,
+            timeout=timeout,
+            text=True,
+        )
+    except subprocess.CalledProcessError as e:
+        raise GitError(f"git {arguments[0]} failed: {e.stderr.strip()}") from e
+    except subprocess.TimeoutExpired as e:
+        raise GitError(f"git {arguments[0]} timed out after {timeout} seconds.") from e
+    return completed.stdout
+
+
+def clone(
+    url: str,
+    directory: str,
+    since_date: str | None = None,
+    timeout: float | None = DEFAULT_GIT_TIMEOUT,
+) -> None:
+    """Clone the repository with all its branches and without a working tree.
+
+    Args:
+        url: The repository URL.
+        directory: The directory the repository is cloned to.
+        since_date: Only fetch the history after the date, when set.
+        timeout: Wall-clock timeout of the clone in seconds, None to wait forever.
+
+    Raises:
+        GitError: if the clone failed.
+    """
+    arguments = ["clone", "--bare", "--quiet"]
+    if since_date is not None:
+        # Shallow clones only fetch the default branch unless told otherwise.
+        arguments += [f"--shallow-since={since_date}", "--no-single-branch"]
+    # The URL is never read as an option, even when it starts with a dash.
+    _git([*arguments, "--", url, directory], timeout=timeout)
+
+
+def list_branches(repository: str) -> list[str]:
+    """Names of the branches of a local repository."""
+    return [
+        branch
+        for branch in _git(
+            [
+                "-C",
+                repository,
+                "for-each-ref",
+                "--format=%(refname:short)",
+                "refs/heads",
+            ]
+        ).splitlines()
+        if branch != ""
+    ]
+
+
+def last_commit_before(repository: str, branch: str, date: str) -> str | None:
+    """Hash of the last commit of the branch before the date, None if the whole branch is more recent."""
+    commit = _git(
+        ["-C", repository, "rev-list", "-1", f"--before={date}", branch, "--"]
+    ).strip()
+    return commit or None
+
+
+def scan(
+    url: str,
+    bounds: HistoryBounds,
+    run_scanner: RunScanner,
+    clone_timeout: float | None = DEFAULT_GIT_TIMEOUT,
+) -> bytes | None:
+    """Clone the repository once and scan its branches in parallel scanner processes.
+
+    Args:
+        url: The repository URL.
+        bounds: The history bounds, and the number of branches scanned in parallel.
+        run_scanner: Runs trufflehog's git source on the clone.
+        clone_timeout: Wall-clock timeout of the clone in seconds.
+
+    Returns:
+        The merged output of the branch scans, None if the repository could not be cloned or every scan failed.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            clone(url, directory, bounds.since_date, timeout=clone_timeout)
+            branches = list(bounds.branches) or list_branches(directory)
+        except GitError as e:
+            logger.error("Could not prepare the scan of %s: %s", url, e)
+            return None
+        logger.info(
+            "Scanning %d branches of %s, %d in parallel.",
+            len(branches),
+            url,
+            bounds.parallel_branches,
+        )
+        branch_flags = []
+        for branch in branches:
+            flags = [f"--branch={branch}"]
+            if bounds.max_depth is not None:
+                flags.append(f"--max-depth={bounds.max_depth}")
+            if bounds.since_date is not None:
+                try:
+                    since_commit = last_commit_before(
+                        directory, branch, bounds.since_date
+                    )
+                except GitError as e:
+                    logger.error("Skipping branch %s: %s", branch, e)
+                    continue
+                if since_commit is not None:
+                    flags.append(f"--since-commit={since_commit}")
+            branch_flags.append(flags)
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=bounds.parallel_branches,
+            thread_name_prefix="trufflehog-git-branch",
+        ) as executor:
+            outputs = list(
+                executor.map(
+                    lambda flags: run_scanner(f"file://{directory}", flags),
+                    branch_flags,
+                )
+            )
+    metrics.COUNTERS.increment("git_history.scanned_branches", len(branch_flags))
+    completed_outputs = [output for output in outputs if output is not None]
+    if len(completed_outputs) == 0:
+        return None
+    # Branches share their common history, the duplicated findings are pruned when the output is parsed.
+    return b"".join(
+        output if output.endswith(b"\n") or output == b"" else output + b"\n"
+        for output in completed_outputs
+    )
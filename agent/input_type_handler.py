@@ -2,9 +2,14 @@
 
 import re
 
+# Links are passed to git and trufflehog as arguments, other schemes and option-like links are rejected.
+ALLOWED_LINK_PREFIXES = ("https://", "http://", "ssh://", "git://", "git@")
+
 
 def get_link_type(link: str) -> str | None:
     link_type: str
+    if link.startswith(ALLOWED_LINK_PREFIXES) is False:
+        return None
     if (
         re.search(
             r"((git|ssh|http(s)?)|(git@[\w\.]+))(:(//)?)(github.com)([\w\.@\:/\-~]+)(\.git)(/)?",
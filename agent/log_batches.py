@@ -0,0 +1,88 @@
+"""Batching of captured logs in Redis, shared by the agent replicas."""
+
+import logging
+
+import redis
+import tenacity
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+REDIS_RETRIES = 4
+REDIS_RETRY_INITIAL_WAIT = 0.05
+REDIS_RETRY_MAX_WAIT = 2.0
+
+_retry_transient_errors = tenacity.retry(
+    retry=tenacity.retry_if_exception_type(
+        (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+    ),
+    stop=tenacity.stop_after_attempt(REDIS_RETRIES),
+    wait=tenacity.wait_random_exponential(
+        multiplier=REDIS_RETRY_INITIAL_WAIT, max=REDIS_RETRY_MAX_WAIT
+    ),
+    reraise=True,
+)
+
+
+class LogBatches:
+    """Accumulates logs in a Redis set until a batch is full, then hands the batch to a single replica.
+
+    Every interaction is a single MULTI/EXEC transaction: adding a log and reading the batch size is one round trip,
+    and reading the batch and emptying the set is another one. Emptying happens in the same transaction as the read, so
+    concurrent replicas never take the same logs and no lock is needed.
+    """
+
+    def __init__(self, client: redis.Redis, key: str) -> None:
+        """Construct the batches.
+
+        Args:
+            client: The Redis client.
+            key: Key of the Redis set holding the pending logs.
+        """
+        self._client = client
+        self._key = key
+
+    @_retry_transient_errors
+    def add(self, log: bytes, batch_size: int) -> list[bytes]:
+        """Add a log and take the pending logs if the batch is full.
+
+        Args:
+            log: The log content.
+            batch_size: Number of pending logs from which the batch is taken.
+
+        Returns:
+            The logs of the full batch, empty if the batch is not full or was taken by another replica.
+        """
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.sadd(self._key, log)
+        pipeline.scard(self._key)
+        metrics.COUNTERS.increment("log_batches.round_trips")
+        _, pending_logs = pipeline.execute()
+        if pending_logs < batch_size:
+            return []
+        return self.take()
+
+    @_retry_transient_errors
+    def take(self) -> list[bytes]:
+        """Atomically read and remove all the pending logs."""
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.smembers(self._key)
+        pipeline.delete(self._key)
+        metrics.COUNTERS.increment("log_batches.round_trips")
+        logs, _ = pipeline.execute()
+        return sorted(logs)
+
+    @_retry_transient_errors
+    def pending(self) -> int:
+        """Number of logs waiting for the batch to be full."""
+        metrics.COUNTERS.increment("log_batches.round_trips")
+        return int(self._client.scard(self._key))
+
+    @_retry_transient_errors
+    def restore(self, logs: list[bytes]) -> None:
+        """Put back logs that were taken but could not be scanned."""
+        if len(logs) == 0:
+            return
+        metrics.COUNTERS.increment("log_batches.round_trips")
+        self._client.sadd(self._key, *logs)
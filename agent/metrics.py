@@ -0,0 +1,74 @@
+"""In-process counters of the agent activity."""
+
+import collections
+import itertools
+import threading
+import time
+
+
+class Counters:
+    """Thread-safe named counters."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: collections.Counter[str] = collections.Counter()
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Add `value` to the counter `name`."""
+        with self._lock:
+            self._values[name] += value
+
+    def get(self, name: str) -> int:
+        """Current value of the counter `name`, 0 if it was never incremented."""
+        with self._lock:
+            return self._values[name]
+
+    def snapshot(self) -> dict[str, int]:
+        """Copy of all the counters."""
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self) -> None:
+        """Reset all the counters."""
+        with self._lock:
+            self._values.clear()
+
+
+class BusyTime:
+    """Thread-safe total time spent in concurrent activities, including the time of the running ones so far."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._tokens = itertools.count()
+        self._started_at: dict[int, float] = {}
+        self._finished_seconds = 0.0
+
+    def start(self) -> int:
+        """Record the start of an activity, returns the token to finish it with."""
+        with self._lock:
+            token = next(self._tokens)
+            self._started_at[token] = time.monotonic()
+        return token
+
+    def finish(self, token: int) -> None:
+        """Record the end of the activity started with `token`."""
+        with self._lock:
+            self._finished_seconds += time.monotonic() - self._started_at.pop(token)
+
+    def seconds(self) -> float:
+        """Total time of the finished activities and of the running ones up to now."""
+        with self._lock:
+            now = time.monotonic()
+            return self._finished_seconds + sum(
+                now - started_at for started_at in self._started_at.values()
+            )
+
+    def running(self) -> int:
+        """Number of running activities."""
+        with self._lock:
+            return len(self._started_at)
+
+
+COUNTERS = Counters()
+# Time spent by scanner processes, sampled for the scanner utilization.
+SCANNER_BUSY_TIME = BusyTime()
@@ -0,0 +1,204 @@
+"""Partitioning of repository scans between the agent replicas of a scan."""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+
+import redis
+from ostorlab.agent.message import message as m
+
+from agent import finding
+
+logger = logging.getLogger(__name__)
+
+SHARD_CLAIMS_KEY_PREFIX = "trufflehog_repository_shards"
+FINDINGS_KEY_PREFIX = "trufflehog_repository_findings"
+HASH_SPACE_BITS = 64
+SHARD_LEASE_TIME = 60.0
+SHARD_CLAIM_POLL_INTERVAL = 1.0
+# Seconds the scanned shards and the claimed findings of a repository scan are kept after their last update.
+CLAIMS_TTL = 24 * 3600
+# Extends the lease of a shard only if it is still held by the replica, in a single atomic step.
+RENEW_LEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class ShardScanError(Exception):
+    """A repository shard could not be scanned."""
+
+
+def repository_key(message: m.Message) -> str:
+    """Key identifying a repository scan, identical for all the replicas receiving the same message."""
+    return hashlib.sha256(message.selector.encode() + message.raw).hexdigest()
+
+
+def shard_of(relative_path: str, shard_count: int) -> int:
+    """Shard of a file, the path hash space is split in `shard_count` contiguous ranges."""
+    path_hash = int.from_bytes(
+        hashlib.sha256(
+            relative_path.encode("utf-8", errors="surrogateescape")
+        ).digest()[: HASH_SPACE_BITS // 8],
+        "big",
+    )
+    return (path_hash * shard_count) >> HASH_SPACE_BITS
+
+
+def partition(root: pathlib.Path, shard_count: int) -> list[list[pathlib.Path]]:
+    """Split the files under `root` in shards by the hash of their path relative to `root`.
+
+    Returns:
+        The files of every shard, indexed by shard.
+    """
+    shards: list[list[pathlib.Path]] = [[] for _ in range(shard_count)]
+    for directory, _, file_names in os.walk(root):
+        for file_name in file_names:
+            path = pathlib.Path(directory) / file_name
+            shards[shard_of(str(path.relative_to(root)), shard_count)].append(path)
+    return shards
+
+
+class ShardClaims:
+    """Shards of a repository claimed by the replicas through expiring leases in Redis.
+
+    Every replica receiving the repository message claims shards until all of them are scanned, so the shards are
+    spread between the replicas and a replica alone still scans the whole repository. A claimed shard is leased with
+    `SET NX PX` and the lease is renewed while the shard is scanned: the shards of a replica that dies expire and are
+    claimed again, like by the agent resuming its checkpointed job. Findings are claimed with set additions, so a
+    finding is only reported by the first replica that finds it. The scanned shards and the claimed findings expire
+    `CLAIMS_TTL` seconds after their last update.
+    """
+
+    def __init__(
+        self,
+        client: redis.Redis,
+        key: str,
+        shard_count: int,
+        lease_time: float = SHARD_LEASE_TIME,
+        poll_interval: float = SHARD_CLAIM_POLL_INTERVAL,
+        claims_ttl: int = CLAIMS_TTL,
+    ) -> None:
+        """Construct the claims.
+
+        Args:
+            client: The Redis client shared by the replicas.
+            key: Key of the repository scan, see `repository_key`.
+            shard_count: Number of shards of the repository.
+            lease_time: Seconds a shard stays claimed by a replica that stopped renewing its lease.
+            poll_interval: Seconds between two claims while the remaining shards are leased by other replicas.
+            claims_ttl: Seconds the scanned shards and the claimed findings are kept after their last update.
+        """
+        self._client = client
+        self._shard_count = shard_count
+        self._lease_milliseconds = int(lease_time * 1000)
+        self._poll_interval = poll_interval
+        self._claims_ttl = claims_ttl
+        self._renew_lease_script = client.register_script(RENEW_LEASE_SCRIPT)
+        self._owner = uuid.uuid4().hex.encode()
+        self._shards_key = f"{SHARD_CLAIMS_KEY_PREFIX}:{key}"
+        self._findings_key = f"{FINDINGS_KEY_PREFIX}:{key}"
+
+    def claim_next(self, skipped: set[int] | None = None) -> int | None:
+        """Claim the next shard that is neither scanned nor leased, None once all shards are scanned.
+
+        Waits while the remaining shards are leased by other replicas, until they are scanned or their lease expires.
+
+        Args:
+            skipped: Shards this replica does not claim again, like the shards it failed to scan.
+        """
+        while True:
+            scanned = {int(shard) for shard in self._client.smembers(self._shards_key)}
+            remaining = [
+                shard
+                for shard in range(self._shard_count)
+                if shard not in scanned and shard not in (skipped or set())
+            ]
+            if len(remaining) == 0:
+                return None
+            for shard in remaining:
+                if (
+                    self._client.set(
+                        self._lease_key(shard),
+                        self._owner,
+                        nx=True,
+                        px=self._lease_milliseconds,
+                    )
+                    is True
+                ):
+                    return shard
+            time.sleep(self._poll_interval)
+
+    @contextlib.contextmanager
+    def scanning(self, shard: int) -> Iterator[None]:
+        """Renew the lease of a claimed shard while it is scanned, and mark it as scanned once the block completes.
+
+        The lease is released if the block raises, like with a `ShardScanError`, so the shard is claimed again.
+        """
+        stopped = threading.Event()
+        renewer = threading.Thread(
+            target=self._renew_lease,
+            args=(shard, stopped),
+            name="trufflehog-shard-lease",
+            daemon=True,
+        )
+        renewer.start()
+        try:
+            yield
+        except BaseException:
+            stopped.set()
+            renewer.join()
+            self._client.delete(self._lease_key(shard))
+            raise
+        stopped.set()
+        renewer.join()
+        with self._client.pipeline() as pipeline:
+            pipeline.sadd(self._shards_key, str(shard))
+            pipeline.expire(self._shards_key, self._claims_ttl)
+            pipeline.delete(self._lease_key(shard))
+            pipeline.execute()
+
+    def claim_finding(self, secret: finding.Finding) -> bool:
+        """Report whether the finding was not reported yet by any replica, marking it as reported."""
+        finding_key = json.dumps(
+            [
+                secret.detector_name,
+                secret.raw or secret.redacted,
+                secret.file_path,
+                secret.line,
+            ]
+        )
+        with self._client.pipeline() as pipeline:
+            pipeline.sadd(
+                self._findings_key, hashlib.sha256(finding_key.encode()).hexdigest()
+            )
+            pipeline.expire(self._findings_key, self._claims_ttl)
+            added, _ = pipeline.execute()
+        return bool(added == 1)
+
+    def _lease_key(self, shard: int) -> str:
+        return f"{self._shards_key}:{shard}"
+
+    def _renew_lease(self, shard: int, stopped: threading.Event) -> None:
+        while stopped.wait(self._lease_milliseconds / 3000) is False:
+            try:
+                if (
+                    self._renew_lease_script(
+                        keys=[self._lease_key(shard)],
+                        args=[self._owner, self._lease_milliseconds],
+                    )
+                    != 1
+                ):
+                    logger.warning("Lost the lease of repository shard %d.", shard)
+                    return
+            except redis.exceptions.RedisError as e:
+                logger.warning("Could not renew the lease of shard %d: %s", shard, e)
@@ -0,0 +1,174 @@
+"""Staged processing pipeline overlapping the preparation of a message with the scan of the previous ones."""
+
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from typing import Generic, TypeVar
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+Item = TypeVar("Item")
+Prepared = TypeVar("Prepared")
+Output = TypeVar("Output")
+
+JOIN_POLL_INTERVAL = 0.05
+DEFAULT_QUEUE_SIZE = 4
+
+
+class Pipeline(Generic[Item, Prepared, Output]):
+    """Runs items through a preparation, a scan and a reporting stage, each on its own threads.
+
+    The preparation stage runs on a thread pool, file type detection and hashing release the GIL so several items are
+    prepared in parallel. Prepared items are handed off to the scan stage through a bounded queue, and scan outputs to
+    a single reporting thread, so the scan threads go back to scanning while the output is parsed. Submitting blocks
+    once enough items are in flight, which applies back pressure on the message thread.
+    """
+
+    def __init__(
+        self,
+        prepare: Callable[[Item], Prepared | None],
+        scan: Callable[[Prepared], Output],
+        report: Callable[[Prepared, Output], None],
+        discard: Callable[[Prepared], None],
+        prepare_workers: int,
+        scan_workers: int = 1,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ) -> None:
+        """Construct the pipeline and start its threads.
+
+        Args:
+            prepare: Prepares an item for the scan, returns None if the item is not scanned.
+            scan: Scans a prepared item.
+            report: Reports the scan output of a prepared item.
+            discard: Releases the resources of a prepared item that is not scanned because the pipeline stopped.
+            prepare_workers: Number of preparation threads.
+            scan_workers: Number of scan threads.
+            queue_size: Maximum number of prepared items waiting for a scan thread.
+
+        Raises:
+            ValueError: if a worker count or the queue size is not positive.
+        """
+        if prepare_workers < 1 or scan_workers < 1:
+            raise ValueError(
+                f"Pipeline workers must be positive, got {prepare_workers} and {scan_workers}."
+            )
+        if queue_size < 1:
+            raise ValueError(f"Pipeline queue size must be positive, got {queue_size}.")
+        self._prepare = prepare
+        self._scan = scan
+        self._report = report
+        self._discard = discard
+        self._prepare_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=prepare_workers, thread_name_prefix="trufflehog-prepare"
+        )
+        # Bounds the items submitted but not yet handed off to the scan stage.
+        self._preparing = threading.BoundedSemaphore(prepare_workers + queue_size)
+        self._scan_queue: queue.Queue[tuple[Prepared, float]] = queue.Queue(
+            maxsize=queue_size
+        )
+        self._report_queue: queue.Queue[tuple[Prepared, Output]] = queue.Queue()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stopping = threading.Event()
+        self._threads = [
+            threading.Thread(
+                target=self._scan_forever,
+                name=f"trufflehog-scan-{index}",
+                daemon=True,
+            )
+            for index in range(scan_workers)
+        ]
+        self._threads.append(
+            threading.Thread(
+                target=self._report_forever, name="trufflehog-report", daemon=True
+            )
+        )
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, item: Item) -> None:
+        """Queue the item for preparation, blocking while the pipeline is full."""
+        self._preparing.acquire()
+        with self._lock:
+            self._in_flight += 1
+        self._prepare_pool.submit(self._prepare_and_hand_off, item)
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait for the submitted items to be reported.
+
+        Args:
+            timeout: Maximum number of seconds to wait, None waits forever.
+
+        Returns:
+            True if all items were reported, False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.in_flight() > 0:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(JOIN_POLL_INTERVAL)
+        return True
+
+    def stop(self) -> None:
+        """Stop scanning new items, running scans complete and waiting items are discarded."""
+        self._stopping.set()
+
+    def in_flight(self) -> int:
+        """Number of submitted items that were not reported yet."""
+        with self._lock:
+            return self._in_flight
+
+    def _done(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def _prepare_and_hand_off(self, item: Item) -> None:
+        try:
+            prepared = self._prepare(item)
+        except Exception:
+            logger.exception("Preparing item failed.")
+            prepared = None
+        if prepared is None:
+            self._preparing.release()
+            self._done()
+            return
+        self._scan_queue.put((prepared, time.monotonic()))
+        self._preparing.release()
+
+    def _scan_forever(self) -> None:
+        while True:
+            prepared, queued_at = self._scan_queue.get()
+            if self._stopping.is_set() is True:
+                logger.info("Discarding prepared item, the pipeline is stopping.")
+                try:
+                    self._discard(prepared)
+                finally:
+                    self._done()
+                continue
+            metrics.COUNTERS.increment("pipeline.scanned_items")
+            metrics.COUNTERS.increment(
+                "pipeline.wait_milliseconds",
+                int((time.monotonic() - queued_at) * 1000),
+            )
+            try:
+                output = self._scan(prepared)
+            except Exception:
+                logger.exception("Scanning item failed.")
+                self._done()
+                continue
+            self._report_queue.put((prepared, output))
+
+    def _report_forever(self) -> None:
+        while True:
+            prepared, output = self._report_queue.get()
+            try:
+                self._report(prepared, output)
+            except Exception:
+                logger.exception("Reporting item failed.")
+            finally:
+                self._done()
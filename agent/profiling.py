@@ -0,0 +1,181 @@
+"""Sampling profiler of the message processing, for diagnosing slow scans in production.
+
+Stacks of the thread processing a message are sampled at a fixed interval. When the message took longer than the
+latency threshold, the samples are written in the collapsed stack format read by flamegraph tools, one
+`frame;frame;frame count` line per distinct stack, so the time can be attributed to libmagic, temporary file I/O,
+output parsing or scanner waits.
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import pathlib
+import random
+import re
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from types import FrameType
+from typing import Any
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILING_DIRECTORY_ENV = "TRUFFLEHOG_PROFILING_DIRECTORY"
+DEFAULT_LATENCY_THRESHOLD = 1.0
+DEFAULT_SAMPLING_INTERVAL = 0.005
+DEFAULT_MAX_PROFILES = 100
+PROFILE_SUFFIX = ".folded"
+UNSAFE_FILENAME_CHARACTERS = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _frame_name(frame: FrameType) -> str:
+    path = pathlib.PurePath(frame.f_code.co_filename)
+    return f"{frame.f_code.co_name} ({'/'.join(path.parts[-2:])}:{frame.f_lineno})".replace(
+        ";", ","
+    )
+
+
+class _Sampler:
+    """Samples the stack of a single thread from a background thread."""
+
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stopped = threading.Event()
+        self.stacks: collections.Counter[str] = collections.Counter()
+        self._thread = threading.Thread(
+            target=self._sample_forever, name="trufflehog-profiler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _sample_forever(self) -> None:
+        while self._stopped.wait(self._interval) is False:
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+
+class MessageProfiler:
+    """Profiles a sample of the processed messages and keeps the profiles of the slow ones."""
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        latency_threshold: float = DEFAULT_LATENCY_THRESHOLD,
+        sample_rate: float = 1.0,
+        interval: float = DEFAULT_SAMPLING_INTERVAL,
+        max_profiles: int = DEFAULT_MAX_PROFILES,
+    ) -> None:
+        """Construct the profiler.
+
+        Args:
+            directory: Directory the profiles are written to, created if missing.
+            latency_threshold: Minimum processing time in seconds of a message to keep its profile.
+            sample_rate: Fraction of the messages that are profiled.
+            interval: Seconds between two stack samples.
+            max_profiles: Number of profiles kept in the directory, the oldest ones are deleted.
+
+        Raises:
+            ValueError: if an argument value is out of range.
+        """
+        if sample_rate < 0 or sample_rate > 1:
+            raise ValueError(f"Sample rate must be in [0, 1], got {sample_rate}.")
+        if interval <= 0:
+            raise ValueError(f"Sampling interval must be positive, got {interval}.")
+        if max_profiles < 1:
+            raise ValueError(f"Max profiles must be positive, got {max_profiles}.")
+        self._directory = directory
+        self._latency_threshold = latency_threshold
+        self._sample_rate = sample_rate
+        self._interval = interval
+        self._max_profiles = max_profiles
+        self._lock = threading.Lock()
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_args(cls, args: dict[str, Any]) -> "MessageProfiler | None":
+        """Build the profiler from the agent arguments, None if profiling is disabled.
+
+        The `TRUFFLEHOG_PROFILING_DIRECTORY` environment variable enables profiling without changing the agent
+        arguments, it takes precedence over the `profiling_directory` argument.
+        """
+        directory = os.environ.get(PROFILING_DIRECTORY_ENV) or args.get(
+            "profiling_directory"
+        )
+        if not directory:
+            return None
+        latency_threshold = args.get("profiling_latency_threshold")
+        sample_rate = args.get("profiling_sample_rate")
+        return cls(
+            pathlib.Path(directory),
+            latency_threshold=float(latency_threshold)
+            if latency_threshold is not None
+            else DEFAULT_LATENCY_THRESHOLD,
+            sample_rate=float(sample_rate) if sample_rate is not None else 1.0,
+            max_profiles=int(
+                args.get("profiling_max_profiles") or DEFAULT_MAX_PROFILES
+            ),
+        )
+
+    @contextlib.contextmanager
+    def profile(self, label: str) -> Iterator[None]:
+        """Sample the stacks of the calling thread while the block runs and keep them if it was slow.
+
+        Args:
+            label: Label of the profiled block, like the message selector, included in the profile name.
+        """
+        if self._sample_rate < 1 and random.random() >= self._sample_rate:
+            yield
+            return
+        sampler = _Sampler(threading.get_ident(), self._interval)
+        started_at = time.monotonic()
+        sampler.start()
+        try:
+            yield
+        finally:
+            sampler.stop()
+            elapsed = time.monotonic() - started_at
+            metrics.COUNTERS.increment("profiling.profiled_messages")
+            if elapsed >= self._latency_threshold and len(sampler.stacks) > 0:
+                self._write(label, elapsed, sampler.stacks)
+
+    def _write(
+        self, label: str, elapsed: float, stacks: collections.Counter[str]
+    ) -> None:
+        name = UNSAFE_FILENAME_CHARACTERS.sub("_", label)
+        path = self._directory / (
+            f"{time.time_ns()}-{name}-{int(elapsed * 1000)}ms{PROFILE_SUFFIX}"
+        )
+        try:
+            path.write_text(
+                "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+            )
+        except OSError as e:
+            logger.warning("Could not write profile %s: %s", path, e)
+            return
+        metrics.COUNTERS.increment("profiling.written_profiles")
+        logger.info(
+            "Message %s took %.1f seconds, profile written to %s.", label, elapsed, path
+        )
+        self._rotate()
+
+    def _rotate(self) -> None:
+        with self._lock:
+            profiles = sorted(self._directory.glob(f"*{PROFILE_SUFFIX}"))
+            for profile in profiles[: max(len(profiles) - self._max_profiles, 0)]:
+                profile.unlink(missing_ok=True)
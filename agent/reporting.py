@@ -0,0 +1,273 @@
+"""Buffered emission of vulnerability reports."""
+
+import dataclasses
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from ostorlab.agent.kb import kb
+from ostorlab.agent.message import message as m
+from ostorlab.agent.mixins import agent_report_vulnerability_mixin as vuln_mixin
+
+from agent import finding
+from agent import utils
+
+logger = logging.getLogger(__name__)
+
+SENDER_POLL_INTERVAL = 0.1
+VULNERABILITY_SELECTOR = "v3.report.vulnerability"
+VERIFIED_ONLY_POLICY = "verified_only"
+VERIFIED_AND_UNVERIFIED_POLICY = "verified_and_unverified"
+REPORTING_POLICIES = (VERIFIED_ONLY_POLICY, VERIFIED_AND_UNVERIFIED_POLICY)
+DEFAULT_UNVERIFIED_SECRETS_PER_REPORT = 20
+DEFAULT_UNVERIFIED_REPORTS_PER_MINUTE = 10
+
+
+@dataclasses.dataclass(frozen=True)
+class PendingReport:
+    """A vulnerability waiting to be emitted on the bus."""
+
+    entry: kb.Entry
+    risk_rating: vuln_mixin.RiskRating
+    technical_detail: str
+    vulnerability_location: vuln_mixin.VulnerabilityLocation | None
+    dna: str
+    # Control message of the reported message, the report is emitted with its list of agents.
+    control_message: m.Message | None = None
+
+
+def vulnerability_message(report: PendingReport, agent_name: str) -> bytes:
+    """Raw control message of a report, as `report_vulnerability` emits it.
+
+    Args:
+        report: The report to emit.
+        agent_name: Name of the emitting agent, appended to the agents of the reported message.
+
+    Returns:
+        The `v3.control` message wrapping the `v3.report.vulnerability` message of the report.
+    """
+    entry = report.entry
+    data: dict[str, Any] = {
+        "title": entry.title,
+        "technical_detail": report.technical_detail,
+        "risk_rating": report.risk_rating.name,
+        "short_description": entry.short_description,
+        "description": entry.description,
+        "recommendation": entry.recommendation,
+        "references": [
+            {"title": title, "url": url} for title, url in entry.references.items()
+        ],
+        "security_issue": entry.security_issue,
+        "privacy_issue": entry.privacy_issue,
+        "has_public_exploit": entry.has_public_exploit,
+        "targeted_by_malware": entry.targeted_by_malware,
+        "targeted_by_ransomware": entry.targeted_by_ransomware,
+        "targeted_by_nation_state": entry.targeted_by_nation_state,
+        "cvss_v3_vector": entry.cvss_v3_vector,
+        "cvss_v4_vector": entry.cvss_v4_vector,
+        "dna": report.dna,
+        "category_groups": entry.category_groups,
+    }
+    if report.vulnerability_location is not None:
+        data["vulnerability_location"] = report.vulnerability_location.to_dict()
+    agents = [agent_name]
+    if report.control_message is not None:
+        agents = [*report.control_message.data["control"]["agents"], agent_name]
+    return m.Message.from_data(
+        "v3.control",
+        {
+            "control": {"agents": agents},
+            "message": m.Message.from_data(VULNERABILITY_SELECTOR, data).raw,
+        },
+    ).raw
+
+
+class ReportBuffer:
+    """Accumulates vulnerability reports and emits them in bulk.
+
+    Reports sharing the same DNA while pending are emitted only once. In the default synchronous mode, reports are
+    emitted from the calling thread whenever `max_pending` reports are buffered or on `flush`. In background mode, a
+    sender thread drains a bounded queue so the caller only blocks when the queue is full. Either way, the pending
+    reports are handed to `emit` as a single batch.
+    """
+
+    def __init__(
+        self,
+        emit: Callable[[list[PendingReport]], None],
+        max_pending: int,
+        background: bool = False,
+    ) -> None:
+        """Construct the buffer.
+
+        Args:
+            emit: Callback emitting a batch of reports on the bus, a report failing to be emitted does not prevent the
+                others from being emitted.
+            max_pending: Number of buffered reports triggering a flush, or the bound of the sender queue.
+            background: Emit reports from a dedicated sender thread.
+        """
+        self._emit = emit
+        self._max_pending = max(max_pending, 1)
+        self._background = background
+        self._lock = threading.Lock()
+        self._pending: list[PendingReport] = []
+        self._pending_dnas: set[str] = set()
+        self._queue: queue.Queue[PendingReport] = queue.Queue(maxsize=self._max_pending)
+        self._sender: threading.Thread | None = None
+        if background is True:
+            self._sender = threading.Thread(
+                target=self._send_forever, name="trufflehog-report-sender", daemon=True
+            )
+            self._sender.start()
+
+    @property
+    def background(self) -> bool:
+        """Whether reports are emitted from the sender thread."""
+        return self._background
+
+    def add(self, report: PendingReport) -> None:
+        """Buffer a report, dropping it if a report with the same DNA is already pending."""
+        should_flush = False
+        with self._lock:
+            if report.dna in self._pending_dnas:
+                return
+            self._pending_dnas.add(report.dna)
+            if self._background is False:
+                self._pending.append(report)
+                should_flush = len(self._pending) >= self._max_pending
+        if self._background is True:
+            self._queue.put(report)
+        elif should_flush is True:
+            self.flush()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Emit all pending reports.
+
+        Args:
+            timeout: In background mode, maximum number of seconds to wait for the sender thread.
+
+        Returns:
+            True if all pending reports were emitted, False if the timeout expired first.
+        """
+        if self._background is True:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self._queue.unfinished_tasks > 0:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return False
+                time.sleep(SENDER_POLL_INTERVAL)
+            return True
+
+        with self._lock:
+            reports = self._pending
+            self._pending = []
+            self._pending_dnas.clear()
+        if len(reports) > 0:
+            self._emit_batch(reports)
+        return True
+
+    def _emit_batch(self, reports: list[PendingReport]) -> None:
+        try:
+            self._emit(reports)
+        except Exception:
+            logger.exception("Failed to emit %d vulnerability reports.", len(reports))
+
+    def _send_forever(self) -> None:
+        while True:
+            reports = [self._queue.get()]
+            while len(reports) < self._max_pending:
+                try:
+                    reports.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._emit_batch(reports)
+            finally:
+                with self._lock:
+                    self._pending_dnas.difference_update(
+                        report.dna for report in reports
+                    )
+                for _ in reports:
+                    self._queue.task_done()
+
+
+@dataclasses.dataclass(frozen=True)
+class ReportingPolicy:
+    """Which findings are reported besides the verified ones, and how unverified findings are reported."""
+
+    mode: str = VERIFIED_ONLY_POLICY
+    unverified_detectors: tuple[str, ...] = ()
+    unverified_min_entropy: float = 0.0
+    unverified_secrets_per_report: int = DEFAULT_UNVERIFIED_SECRETS_PER_REPORT
+    unverified_reports_per_minute: float = DEFAULT_UNVERIFIED_REPORTS_PER_MINUTE
+
+    def __post_init__(self) -> None:
+        if self.mode not in REPORTING_POLICIES:
+            raise ValueError(
+                f"Reporting policy must be one of {REPORTING_POLICIES}, got {self.mode!r}."
+            )
+        if self.unverified_secrets_per_report < 1:
+            raise ValueError(
+                f"Unverified secrets per report must be positive, got {self.unverified_secrets_per_report}."
+            )
+
+    @classmethod
+    def from_args(cls, args: dict[str, Any]) -> "ReportingPolicy":
+        """Build and validate the policy from the agent arguments.
+
+        Raises:
+            ValueError: if an argument value is invalid.
+        """
+        return cls(
+            mode=args.get("reporting_policy") or VERIFIED_ONLY_POLICY,
+            unverified_detectors=tuple(args.get("unverified_detectors") or ()),
+            unverified_min_entropy=float(args.get("unverified_min_entropy") or 0),
+            unverified_secrets_per_report=int(
+                args.get("unverified_secrets_per_report")
+                or DEFAULT_UNVERIFIED_SECRETS_PER_REPORT
+            ),
+            unverified_reports_per_minute=float(
+                args.get("unverified_reports_per_minute")
+                or DEFAULT_UNVERIFIED_REPORTS_PER_MINUTE
+            ),
+        )
+
+    def accepts_unverified(self, secret: finding.Finding) -> bool:
+        """Report whether an unverified finding is reported."""
+        if self.mode == VERIFIED_ONLY_POLICY:
+            return False
+        if (
+            len(self.unverified_detectors) > 0
+            and secret.detector_name not in self.unverified_detectors
+        ):
+            return False
+        return utils.shannon_entropy(secret.raw or "") >= self.unverified_min_entropy
+
+
+class DetectorRateLimiter:
+    """Token bucket per detector, refilled continuously at the given rate."""
+
+    def __init__(
+        self,
+        reports_per_minute: float,
+        burst: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._rate = reports_per_minute / 60
+        self._burst = burst if burst is not None else max(reports_per_minute, 1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def allow(self, detector: str) -> bool:
+        """Consume a token of the detector bucket, False if the bucket is empty."""
+        with self._lock:
+            now = self._clock()
+            tokens, updated_at = self._buckets.get(detector, (self._burst, now))
+            tokens = min(self._burst, tokens + (now - updated_at) * self._rate)
+            if tokens < 1:
+                self._buckets[detector] = (tokens, now)
+                return False
+            self._buckets[detector] = (tokens - 1, now)
+            return True
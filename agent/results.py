@@ -0,0 +1,180 @@
+"""Scan-level store of the reported findings, backed by SQLite."""
+
+import dataclasses
+import json
+import logging
+import pathlib
+import sqlite3
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS findings (
+    id INTEGER PRIMARY KEY,
+    scan TEXT NOT NULL,
+    dna TEXT NOT NULL,
+    secret_hash TEXT NOT NULL,
+    detector TEXT,
+    asset TEXT NOT NULL,
+    path TEXT,
+    line INTEGER,
+    verified INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS findings_scan_dna ON findings (scan, dna);
+CREATE INDEX IF NOT EXISTS findings_secret_hash ON findings (secret_hash);
+CREATE INDEX IF NOT EXISTS findings_detector ON findings (detector);
+CREATE INDEX IF NOT EXISTS findings_asset ON findings (asset);
+CREATE INDEX IF NOT EXISTS findings_path ON findings (path);
+"""
+INSERT_FINDING = """
+INSERT OR IGNORE INTO findings (scan, dna, secret_hash, detector, asset, path, line, verified)
+VALUES (:scan, :dna, :secret_hash, :detector, :asset, :path, :line, :verified)
+"""
+FINDING_COLUMNS = (
+    "dna",
+    "secret_hash",
+    "detector",
+    "asset",
+    "path",
+    "line",
+    "verified",
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class StoredFinding:
+    """A reported finding, the secret itself is only stored as a hash."""
+
+    dna: str
+    secret_hash: str
+    detector: str | None
+    asset: str
+    path: str | None
+    line: int | None
+    verified: bool
+
+
+class ResultStore:
+    """Findings reported during the scan, queryable by secret hash, detector, asset and path.
+
+    Findings are stored for the current scan, a finding of a previous scan is not seen by the queries and is stored
+    again when found by the next scan. Adding a finding is a single insert ignoring known DNAs, so concurrent reports
+    of a finding store it once. The database uses WAL journaling so that it can be read by other processes while the
+    agent writes to it.
+    """
+
+    def __init__(
+        self,
+        path: str | pathlib.Path,
+        scan: str | None = None,
+    ) -> None:
+        """Open or create the store.
+
+        Args:
+            path: The SQLite database file.
+            scan: Identifier of the current scan, a new one is generated if missing.
+        """
+        self._lock = threading.Lock()
+        self._scan = scan or uuid.uuid4().hex
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def add(self, stored_finding: StoredFinding) -> bool:
+        """Add a finding, findings with an already stored DNA are ignored.
+
+        Returns:
+            True if the finding was added, False if its DNA was already stored during the current scan.
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                INSERT_FINDING,
+                {**dataclasses.asdict(stored_finding), "scan": self._scan},
+            )
+        return cursor.rowcount == 1
+
+    def start_scan(self, scan: str | None = None) -> None:
+        """Store the next findings for a new scan.
+
+        Args:
+            scan: Identifier of the new scan, a new one is generated if missing.
+        """
+        with self._lock:
+            self._scan = scan or uuid.uuid4().hex
+
+    def contains_dna(self, dna: str) -> bool:
+        """Report whether a finding with the DNA was already added during the current scan."""
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "SELECT 1 FROM findings WHERE scan = ? AND dna = ? LIMIT 1",
+                    (self._scan, dna),
+                ).fetchone()
+                is not None
+            )
+
+    def find(
+        self,
+        secret_hash: str | None = None,
+        detector: str | None = None,
+        asset: str | None = None,
+        path: str | None = None,
+    ) -> list[StoredFinding]:
+        """Findings of the current scan matching all the given criteria."""
+        criteria = {
+            "secret_hash": secret_hash,
+            "detector": detector,
+            "asset": asset,
+            "path": path,
+        }
+        conditions = ["scan = :scan"] + [
+            f"{column} = :{column}"
+            for column, value in criteria.items()
+            if value is not None
+        ]
+        query = (
+            f"SELECT {', '.join(FINDING_COLUMNS)} FROM findings"
+            f" WHERE {' AND '.join(conditions)} ORDER BY id"
+        )
+        with self._lock:
+            rows = self._connection.execute(
+                query, {**criteria, "scan": self._scan}
+            ).fetchall()
+        return [_to_stored_finding(row) for row in rows]
+
+    def export(self, destination: str | pathlib.Path) -> int:
+        """Write the findings of the current scan as JSON lines.
+
+        Returns:
+            The number of exported findings.
+        """
+        stored_findings = self.find()
+        with pathlib.Path(destination).open("w") as export_file:
+            export_file.writelines(
+                json.dumps(dataclasses.asdict(stored_finding)) + "\n"
+                for stored_finding in stored_findings
+            )
+        logger.info("Exported %d findings to %s.", len(stored_findings), destination)
+        return len(stored_findings)
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._connection.close()
+
+
+def _to_stored_finding(
+    row: tuple[str, str, str | None, str, str | None, int | None, int],
+) -> StoredFinding:
+    return StoredFinding(
+        dna=row[0],
+        secret_hash=row[1],
+        detector=row[2],
+        asset=row[3],
+        path=row[4],
+        line=row[5],
+        verified=row[6] == 1,
+    )
@@ -0,0 +1,155 @@
+"""Saturation signals of the agent, published for autoscalers.
+
+The agent mostly waits on scanner processes and network verification, so its CPU usage says little about its load.
+The signals describe the work waiting for the agent and how busy its scanner slots are, they are written periodically
+to a JSON file that a metrics sidecar or a KEDA metrics API scaler reads to right-size the replicas.
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 15.0
+# Counters summed to compute the average time messages waited in a queue before being processed.
+WAIT_COUNTERS = (
+    ("scheduler.started_jobs", "scheduler.wait_milliseconds"),
+    ("pipeline.scanned_items", "pipeline.wait_milliseconds"),
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class Gauges:
+    """Instant state of the agent queues, sampled when the signals are published."""
+
+    queue_depths: dict[str, int]
+    pending_logs: int | None = None
+
+
+class SaturationPublisher:
+    """Periodically writes the saturation signals of the agent to a JSON file.
+
+    Rates and averages are computed over the interval since the previous publication from the agent counters. The file
+    is replaced atomically, readers never see a partially written file.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        gauges: Callable[[], Gauges],
+        scanner_slots: int,
+        interval: float = DEFAULT_INTERVAL,
+    ) -> None:
+        """Construct the publisher.
+
+        Args:
+            path: The JSON file the signals are written to, its directory is created if missing.
+            gauges: Samples the queues of the agent.
+            scanner_slots: Number of scanner processes the agent runs at once when fully busy.
+            interval: Seconds between two publications.
+
+        Raises:
+            ValueError: if the slots or the interval are not positive.
+        """
+        if scanner_slots < 1:
+            raise ValueError(f"Scanner slots must be positive, got {scanner_slots}.")
+        if interval <= 0:
+            raise ValueError(f"Publication interval must be positive, got {interval}.")
+        self._path = path
+        self._gauges = gauges
+        self._scanner_slots = scanner_slots
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._previous_counters = metrics.COUNTERS.snapshot()
+        self._previous_busy_seconds = metrics.SCANNER_BUSY_TIME.seconds()
+        self._previous_at = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._publish_forever, name="trufflehog-saturation", daemon=True
+        )
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+
+    def start(self) -> None:
+        """Start publishing in the background."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop publishing, after a last publication."""
+        self._stopped.set()
+        if self._thread.is_alive() is True:
+            self._thread.join()
+        self.publish()
+
+    def signals(self) -> dict[str, Any]:
+        """Compute the signals over the interval since the previous computation.
+
+        The scanner utilization counts the time of the scans running when the signals are sampled, a long scan makes
+        the agent busy from its start and not only once it completes.
+        """
+        gauges = self._gauges()
+        with self._lock:
+            now = time.monotonic()
+            counters = metrics.COUNTERS.snapshot()
+            total_busy_seconds = metrics.SCANNER_BUSY_TIME.seconds()
+            elapsed = max(now - self._previous_at, 1e-6)
+            deltas = {
+                name: value - self._previous_counters.get(name, 0)
+                for name, value in counters.items()
+            }
+            busy_seconds = total_busy_seconds - self._previous_busy_seconds
+            self._previous_counters = counters
+            self._previous_busy_seconds = total_busy_seconds
+            self._previous_at = now
+        waits = sum(deltas.get(count, 0) for count, _ in WAIT_COUNTERS)
+        wait_milliseconds = sum(deltas.get(total, 0) for _, total in WAIT_COUNTERS)
+        queued_messages = sum(gauges.queue_depths.values())
+        return {
+            "timestamp": time.time(),
+            "interval_seconds": round(elapsed, 3),
+            "queue_depths": gauges.queue_depths,
+            "queued_messages": queued_messages,
+            "scanner_slots": self._scanner_slots,
+            "running_scans": metrics.SCANNER_BUSY_TIME.running(),
+            "scanner_utilization": round(
+                min(busy_seconds / (elapsed * self._scanner_slots), 1.0), 3
+            ),
+            "average_wait_seconds": round(wait_milliseconds / waits / 1000, 3)
+            if waits > 0
+            else 0.0,
+            "pending_logs": gauges.pending_logs,
+            "messages_per_second": round(
+                deltas.get("messages.received", 0) / elapsed, 3
+            ),
+            "bytes_per_second": round(
+                deltas.get("messages.received_bytes", 0) / elapsed, 3
+            ),
+        }
+
+    def publish(self) -> None:
+        """Write the current signals to the file."""
+        try:
+            signals = self.signals()
+        except Exception:
+            logger.exception("Could not compute the saturation signals.")
+            return
+        temporary_path = self._path.with_name(f".{self._path.name}.tmp")
+        try:
+            temporary_path.write_text(json.dumps(signals, sort_keys=True))
+            os.replace(temporary_path, self._path)
+        except OSError as e:
+            logger.warning(
+                "Could not write saturation signals to %s: %s", self._path, e
+            )
+
+    def _publish_forever(self) -> None:
+        while self._stopped.wait(self._interval) is False:
+            self.publish()
@@ -0,0 +1,252 @@
+"""Supervised execution of the trufflehog scanner process."""
+
+import dataclasses
+import logging
+import os
+import re
+import signal
+import subprocess
+import time
+from typing import Any
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUTS: dict[str, float] = {"filesystem": 600, "git": 3600, "gitlab": 3600}
+# Timeout key of the scans of the shared repository volume, they run as filesystem scans but are unbounded by default.
+REPOSITORY_TIMEOUT_KEY = "repository"
+DEFAULT_KILL_GRACE_PERIOD = 10.0
+MEGABYTE = 1024 * 1024
+ARCHIVE_SIZE_PATTERN = re.compile(r"^[0-9]+(B|KB|MB|GB)$")
+MAX_SHANNON_ENTROPY = 8.0
+
+
+@dataclasses.dataclass(frozen=True)
+class ScannerSettings:
+    """Execution limits and trufflehog options applied to every scanner process."""
+
+    timeouts: dict[str, float] = dataclasses.field(
+        default_factory=lambda: dict(DEFAULT_TIMEOUTS)
+    )
+    kill_grace_period: float = DEFAULT_KILL_GRACE_PERIOD
+    memory_limit: int | None = None
+    cpu_time_limit: int | None = None
+    concurrency: int | None = None
+    include_detectors: tuple[str, ...] = ()
+    exclude_detectors: tuple[str, ...] = ()
+    only_verified: bool = False
+    archive_max_depth: int | None = None
+    archive_max_size: str | None = None
+    filter_entropy: float | None = None
+    verify: bool = True
+
+    def __post_init__(self) -> None:
+        if self.concurrency is not None and self.concurrency < 1:
+            raise ValueError(
+                f"Scanner concurrency must be positive, got {self.concurrency}."
+            )
+        if any(detector == "" for detector in self.include_detectors):
+            raise ValueError("Included detectors must not be empty.")
+        if any(detector == "" for detector in self.exclude_detectors):
+            raise ValueError("Excluded detectors must not be empty.")
+        conflicting_detectors = set(self.include_detectors) & set(
+            self.exclude_detectors
+        )
+        if len(conflicting_detectors) > 0:
+            raise ValueError(
+                f"Detectors both included and excluded: {sorted(conflicting_detectors)}."
+            )
+        if self.archive_max_depth is not None and self.archive_max_depth < 1:
+            raise ValueError(
+                f"Archive max depth must be positive, got {self.archive_max_depth}."
+            )
+        if (
+            self.archive_max_size is not None
+            and ARCHIVE_SIZE_PATTERN.match(self.archive_max_size) is None
+        ):
+            raise ValueError(
+                f"Archive max size must be a byte size like 10MB, got {self.archive_max_size!r}."
+            )
+        if self.filter_entropy is not None and (
+            self.filter_entropy <= 0 or self.filter_entropy > MAX_SHANNON_ENTROPY
+        ):
+            raise ValueError(
+                f"Filter entropy must be in (0, {MAX_SHANNON_ENTROPY}], got {self.filter_entropy}."
+            )
+
+    @classmethod
+    def from_args(cls, args: dict[str, Any]) -> "ScannerSettings":
+        """Build and validate the settings from the agent arguments, falling back to the defaults for missing values.
+
+        Raises:
+            ValueError: if an argument value is invalid.
+        """
+        timeouts = dict(DEFAULT_TIMEOUTS)
+        timeouts.update(
+            {
+                input_type: float(timeout)
+                for input_type, timeout in (args.get("scanner_timeouts") or {}).items()
+            }
+        )
+        memory_limit_mb = int(args.get("scanner_memory_limit_mb") or 0)
+        cpu_time_limit = int(args.get("scanner_cpu_time_limit") or 0)
+        concurrency = args.get("scanner_concurrency")
+        archive_max_depth = args.get("archive_max_depth")
+        filter_entropy = args.get("filter_entropy")
+        return cls(
+            timeouts=timeouts,
+            kill_grace_period=float(
+                args.get("scanner_kill_grace_period") or DEFAULT_KILL_GRACE_PERIOD
+            ),
+            memory_limit=memory_limit_mb * MEGABYTE if memory_limit_mb > 0 else None,
+            cpu_time_limit=cpu_time_limit if cpu_time_limit > 0 else None,
+            concurrency=int(concurrency) if concurrency else None,
+            include_detectors=tuple(args.get("include_detectors") or ()),
+            exclude_detectors=tuple(args.get("exclude_detectors") or ()),
+            only_verified=args.get("only_verified") is True,
+            archive_max_depth=int(archive_max_depth) if archive_max_depth else None,
+            archive_max_size=args.get("archive_max_size") or None,
+            filter_entropy=float(filter_entropy) if filter_entropy else None,
+        )
+
+    def flags(self) -> list[str]:
+        """Trufflehog command line flags applying the settings, common to every input type."""
+        flags = []
+        if self.concurrency is not None:
+            flags.append(f"--concurrency={self.concurrency}")
+        if len(self.include_detectors) > 0:
+            flags.append(f"--include-detectors={','.join(self.include_detectors)}")
+        if len(self.exclude_detectors) > 0:
+            flags.append(f"--exclude-detectors={','.join(self.exclude_detectors)}")
+        if self.verify is False:
+            flags.append("--no-verification")
+        elif self.only_verified is True:
+            flags.append("--only-verified")
+        if self.archive_max_depth is not None:
+            flags.append(f"--archive-max-depth={self.archive_max_depth}")
+        if self.archive_max_size is not None:
+            flags.append(f"--archive-max-size={self.archive_max_size}")
+        if self.filter_entropy is not None:
+            flags.append(f"--filter-entropy={self.filter_entropy}")
+        return flags
+
+    def timeout_for(self, input_type: str) -> float | None:
+        """Wall-clock timeout of a scan of the given input type or timeout key, None if it is unbounded."""
+        timeout = self.timeouts.get(input_type)
+        if timeout is None or timeout <= 0:
+            return None
+        return timeout
+
+
+def limited_command(command: list[str], settings: ScannerSettings) -> list[str]:
+    """Wrap the command in `prlimit` to apply the resource limits, the command is unchanged without limits.
+
+    The limits are set by `prlimit` before it executes the scanner, rather than in the forked child, which is unsafe
+    when the scanner is started from several threads.
+    """
+    limits = []
+    if settings.memory_limit is not None:
+        limits.append(f"--data={settings.memory_limit}")
+    if settings.cpu_time_limit is not None:
+        # The soft limit sends SIGXCPU, the hard limit SIGKILL.
+        limits.append(
+            f"--cpu={settings.cpu_time_limit}:{settings.cpu_time_limit + int(settings.kill_grace_period)}"
+        )
+    if len(limits) == 0:
+        return command
+    return ["prlimit", *limits, "--", *command]
+
+
+def run(
+    command: list[str], settings: ScannerSettings, timeout: float | None
+) -> bytes | None:
+    """Run the scanner command under a wall-clock timeout and resource limits.
+
+    The scanner runs in its own session so that it can be stopped along with the git processes it spawns: once the
+    timeout expires the whole process group receives SIGTERM, then SIGKILL after the grace period. Findings written
+    before the scanner was stopped are still returned.
+
+    Args:
+        command: The scanner command line.
+        settings: Limits applied to the scanner process.
+        timeout: Wall-clock timeout in seconds, None to wait forever.
+
+    Returns:
+        The scanner output, None if the scanner failed.
+    """
+    metrics.COUNTERS.increment("scanner.runs")
+    started_at = time.monotonic()
+    busy_token = metrics.SCANNER_BUSY_TIME.start()
+    try:
+        process = subprocess.Popen(
+            limited_command(command, settings),
+            stdout=subprocess.PIPE,
+            start_new_session=True,
+        )
+        output, timed_out = _communicate(process, timeout, settings.kill_grace_period)
+    finally:
+        metrics.SCANNER_BUSY_TIME.finish(busy_token)
+        metrics.COUNTERS.increment(
+            "scanner.busy_milliseconds", int((time.monotonic() - started_at) * 1000)
+        )
+        metrics.COUNTERS.increment("scanner.completed")
+    if timed_out is True:
+        logger.error(
+            "Scanner timed out after %s seconds, parsing the partial output.", timeout
+        )
+        return _complete_lines(output)
+    if process.returncode < 0:
+        metrics.COUNTERS.increment("scanner.signaled")
+        logger.error(
+            "Scanner stopped by signal %s, parsing the partial output.",
+            -process.returncode,
+        )
+        return _complete_lines(output)
+    if process.returncode != 0:
+        metrics.COUNTERS.increment("scanner.failures")
+        logger.error("Scanner exited with status %s.", process.returncode)
+        return None
+    return output
+
+
+def _communicate(
+    process: subprocess.Popen[bytes], timeout: float | None, kill_grace_period: float
+) -> tuple[bytes, bool]:
+    """Read the scanner output until it exits, stop its process group once the timeout expires.
+
+    Returns:
+        The scanner output and whether the timeout expired.
+    """
+    try:
+        output, _ = process.communicate(timeout=timeout)
+        return output, False
+    except subprocess.TimeoutExpired:
+        metrics.COUNTERS.increment("scanner.timeouts")
+    except BaseException:
+        _signal_group(process.pid, signal.SIGKILL)
+        process.wait()
+        raise
+    _signal_group(process.pid, signal.SIGTERM)
+    try:
+        output, _ = process.communicate(timeout=kill_grace_period)
+    except subprocess.TimeoutExpired:
+        metrics.COUNTERS.increment("scanner.kills")
+        logger.warning("Scanner did not stop after SIGTERM, killing it.")
+        _signal_group(process.pid, signal.SIGKILL)
+        output, _ = process.communicate()
+    return output, True
+
+
+def _signal_group(pid: int, signal_number: int) -> None:
+    try:
+        os.killpg(pid, signal_number)
+    except ProcessLookupError:
+        pass
+
+
+def _complete_lines(output: bytes | None) -> bytes | None:
+    """Drop the trailing partial line of an interrupted scanner output."""
+    if output is None:
+        return None
+    return output[: output.rfind(b"\n") + 1]
@@ -0,0 +1,151 @@
+"""Scheduling of long-running scans off the message thread."""
+
+import collections
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+
+from agent import metrics
+
+logger = logging.getLogger(__name__)
+
+# Selectors whose scans can take minutes, lower values are picked first by the long-running lane workers.
+LONG_RUNNING_SELECTOR_PRIORITIES = {
+    "v3.asset.file.repository_archive": 0,
+    "v3.asset.repository": 0,
+    "v3.asset.link": 1,
+}
+JOIN_POLL_INTERVAL = 0.1
+
+Job = Callable[[], None]
+
+
+def is_long_running(selector: str) -> bool:
+    """Report whether messages of the selector are scheduled on the long-running lane."""
+    return selector in LONG_RUNNING_SELECTOR_PRIORITIES
+
+
+class Scheduler:
+    """Runs long-running scans on a bounded pool of worker threads.
+
+    Interactive selectors (files, captures, logs) keep running inline on the message thread, while repository and
+    git link scans are queued on the long-running lane so they do not hold the message thread for their whole
+    duration. The lane queue is bounded: once full, submitting blocks the message thread, which applies back pressure
+    on the bus.
+    """
+
+    def __init__(self, workers: int, queue_size: int) -> None:
+        """Construct the scheduler.
+
+        Args:
+            workers: Number of long-running lane workers, 0 runs every scan inline.
+            queue_size: Maximum number of long-running scans waiting for a worker.
+        """
+        self._workers = workers
+        self._queue: queue.PriorityQueue[tuple[int, int, str, float, Job]] = (
+            queue.PriorityQueue(maxsize=max(queue_size, 1))
+        )
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._pending: collections.Counter[str] = collections.Counter()
+        self._stopping = threading.Event()
+        self._threads = [
+            threading.Thread(
+                target=self._work_forever,
+                name=f"trufflehog-long-running-{index}",
+                daemon=True,
+            )
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether long-running scans are scheduled off the message thread."""
+        return self._workers > 0
+
+    def submit(self, selector: str, job: Job) -> bool:
+        """Queue the job on the long-running lane if the selector belongs to it.
+
+        Args:
+            selector: Selector of the message the job processes.
+            job: The job to run.
+
+        Returns:
+            True if the job was queued, False if the caller should run it inline.
+        """
+        if self.enabled is False or is_long_running(selector) is False:
+            return False
+        with self._lock:
+            self._pending[selector] += 1
+        self._queue.put(
+            (
+                LONG_RUNNING_SELECTOR_PRIORITIES[selector],
+                next(self._sequence),
+                selector,
+                time.monotonic(),
+                job,
+            )
+        )
+        return True
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait for the queued and running jobs to complete.
+
+        Args:
+            timeout: Maximum number of seconds to wait, None waits forever.
+
+        Returns:
+            True if all jobs completed, False if the timeout expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks > 0:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(JOIN_POLL_INTERVAL)
+        return True
+
+    def stop(self) -> None:
+        """Stop starting queued jobs, running jobs complete and queued ones are discarded."""
+        self._stopping.set()
+
+    def pending(self) -> dict[str, int]:
+        """Number of queued or running jobs per selector."""
+        with self._lock:
+            return {
+                selector: count
+                for selector, count in self._pending.items()
+                if count > 0
+            }
+
+    def _work_forever(self) -> None:
+        while True:
+            _, _, selector, queued_at, job = self._queue.get()
+            if self._stopping.is_set() is True:
+                logger.info("Discarding queued long-running %s job.", selector)
+                with self._lock:
+                    self._pending[selector] -= 1
+                self._queue.task_done()
+                continue
+            started_at = time.monotonic()
+            metrics.COUNTERS.increment("scheduler.started_jobs")
+            metrics.COUNTERS.increment(
+                "scheduler.wait_milliseconds", int((started_at - queued_at) * 1000)
+            )
+            try:
+                job()
+            except Exception:
+                logger.exception("Long-running %s job failed.", selector)
+            finally:
+                logger.info(
+                    "Long-running %s job completed in %.1f seconds.",
+                    selector,
+                    time.monotonic() - started_at,
+                )
+                with self._lock:
+                    self._pending[selector] -= 1
+                self._queue.task_done()
@@ -0,0 +1,87 @@
+"""Scoring of parsed findings on how likely they are to be real secrets, before they are verified.
+
+The score is in [0, 1]: the Shannon entropy of the secret relative to the entropy of typical keys, lowered when the
+secret looks like a placeholder or a test value, and when it was found under a test, documentation or example path.
+"""
+
+import re
+from collections.abc import Iterable
+
+from agent import finding
+from agent import utils
+
+# Entropy in bits per character from which a secret gets the full entropy score, random base64 keys are around 5.
+TARGET_ENTROPY = 4.5
+PLACEHOLDER_FACTOR = 0.2
+NON_PRODUCTION_PATH_FACTOR = 0.5
+PLACEHOLDER_PATTERN = re.compile(
+    r"x{4,}|0{6,}|\*{3,}|(.)\1{5,}|1234567|abcdef|<[^>]*>|\$\{"
+    r"|example|sample|dummy|placeholder|changeme|change_me|your[_-]|test|fake|redacted",
+    re.IGNORECASE,
+)
+NON_PRODUCTION_PATH_PATTERN = re.compile(
+    r"(^|/)(tests?|specs?|__tests__|testdata|docs?|examples?|samples?|fixtures?|mocks?)(/|$)"
+    r"|[._-](test|spec)s?\.[a-z0-9]+$",
+    re.IGNORECASE,
+)
+
+
+def score(raw: str, path: str | None = None) -> float:
+    """Score a secret found at the given path.
+
+    Args:
+        raw: The secret.
+        path: Path of the file the secret was found in, if known.
+
+    Returns:
+        The score, from 0 for an obvious placeholder to 1 for a high entropy secret in production code.
+    """
+    value = min(utils.shannon_entropy(raw) / TARGET_ENTROPY, 1.0)
+    if PLACEHOLDER_PATTERN.search(raw) is not None:
+        value *= PLACEHOLDER_FACTOR
+    if path is not None and NON_PRODUCTION_PATH_PATTERN.search(path) is not None:
+        value *= NON_PRODUCTION_PATH_FACTOR
+    return round(value, 3)
+
+
+def score_findings(
+    findings: Iterable[finding.Finding], default_path: str | None = None
+) -> None:
+    """Score a batch of findings in place, the secrets repeated in the batch are scored once.
+
+    Args:
+        findings: The findings to score.
+        default_path: Path used for the findings without a file path, like the path of a scanned file message.
+    """
+    scores: dict[tuple[str, str | None], float] = {}
+    for secret in findings:
+        key = (secret.raw or secret.redacted or "", secret.file_path or default_path)
+        if key not in scores:
+            scores[key] = score(*key)
+        secret.score = scores[key]
+
+
+def prioritize(
+    findings: list[finding.Finding],
+    threshold: float = 0.0,
+    default_path: str | None = None,
+) -> list[finding.Finding]:
+    """Score the findings, drop the unverified ones below the threshold and order the rest by decreasing score.
+
+    Findings already verified are never dropped, they are known to be live secrets whatever their score.
+
+    Args:
+        findings: The findings to prioritize.
+        threshold: Minimum score of the kept unverified findings.
+        default_path: Path used for the findings without a file path.
+
+    Returns:
+        The kept findings, highest scores first.
+    """
+    score_findings(findings, default_path)
+    kept_findings = [
+        secret
+        for secret in findings
+        if secret.verified is True or (secret.score or 0.0) >= threshold
+    ]
+    return sorted(kept_findings, key=lambda secret: secret.score or 0.0, reverse=True)
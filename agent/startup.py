@@ -0,0 +1,109 @@
+"""Startup profiling and warm-up of the agent dependencies.
+
+Run `python -m agent.startup` to print the modules that take the longest to import when the agent starts.
+"""
+
+import dataclasses
+import logging
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+from agent import scanner
+from agent import utils
+
+logger = logging.getLogger(__name__)
+
+AGENT_MODULE = "agent.trufflehog_agent"
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+WARM_UP_CONTENT = b"trufflehog agent warm up"
+PROFILE_TOP_MODULES = 25
+
+
+@dataclasses.dataclass(frozen=True)
+class ImportTime:
+    """Import time of a module as reported by `python -X importtime`, in microseconds."""
+
+    module: str
+    self_time: int
+    cumulative_time: int
+    depth: int
+
+
+def parse_import_times(output: str) -> list[ImportTime]:
+    """Parse the `-X importtime` report written on stderr."""
+    import_times = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+        if match is None:
+            continue
+        import_times.append(
+            ImportTime(
+                module=match.group(4),
+                self_time=int(match.group(1)),
+                cumulative_time=int(match.group(2)),
+                depth=len(match.group(3)) // 2,
+            )
+        )
+    return import_times
+
+
+def profile_imports(module: str = AGENT_MODULE) -> list[ImportTime]:
+    """Import a module in a fresh interpreter and measure the import time of every module it loads."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return parse_import_times(result.stderr)
+
+
+def warm_up(settings: scanner.ScannerSettings) -> dict[str, float]:
+    """Load the libmagic database and run the scanner once so that the first message does not pay for it.
+
+    Args:
+        settings: The scanner settings of the agent.
+
+    Returns:
+        The duration in seconds of every warm-up step.
+    """
+    durations = {}
+    started_at = time.monotonic()
+    utils.get_file_type(filename="warm_up", file_content=WARM_UP_CONTENT)
+    durations["libmagic"] = time.monotonic() - started_at
+
+    started_at = time.monotonic()
+    with tempfile.NamedTemporaryFile() as warm_up_file:
+        warm_up_file.write(WARM_UP_CONTENT)
+        warm_up_file.flush()
+        try:
+            scanner.run(
+                ["trufflehog", "filesystem", warm_up_file.name, "--json"],
+                settings=settings,
+                timeout=settings.timeout_for("filesystem"),
+            )
+        except OSError as e:
+            logger.warning("Could not warm up the scanner: %s", e)
+    durations["scanner"] = time.monotonic() - started_at
+    return durations
+
+
+def main() -> None:
+    """Print the slowest imports of the agent module."""
+    import_times = profile_imports()
+    total_time = max(import_time.cumulative_time for import_time in import_times)
+    print(f"{AGENT_MODULE} imported in {total_time / 1000:.1f} ms.")
+    for import_time in sorted(
+        import_times, key=lambda import_time: import_time.cumulative_time, reverse=True
+    )[:PROFILE_TOP_MODULES]:
+        print(
+            f"{import_time.cumulative_time / 1000:8.1f} ms {import_time.self_time / 1000:8.1f} ms "
+            f"{'  ' * import_time.depth}{import_time.module}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,23 @@
 """Trufflehog agent."""
 
+import asyncio
+import contextlib
+import dataclasses
+import functools
+import hashlib
 import json
 import logging
 import pathlib
-import subprocess
+import sys
 import tempfile
+import threading
+import time
+import uuid
 
+from collections.abc import Callable
 from typing import Any
 from urllib import parse
-import tenacity
+import redis
 
 from ostorlab.agent import agent
 from ostorlab.agent.kb import kb
@@ -25,8 +34,28 @@ from ostorlab.assets import repository_archive as repository_archive_asset
 from ostorlab.agent import definitions as agent_definitions
 from ostorlab.runtimes import definitions as runtime_definitions
 
+from agent import archives
+from agent import checkpoints
+from agent import decoders
+from agent import exchanges
+from agent import finding
+from agent import fingerprints
+from agent import git_history
 from agent import input_type_handler
+from agent import log_batches
+from agent import metrics
+from agent import partitioning
+from agent import pipeline
+from agent import profiling
+from agent import reporting
+from agent import results
+from agent import saturation
+from agent import scanner
+from agent import scoring
+from agent import scheduler
+from agent import startup
 from agent import utils
+from agent import verification
 
 BLACKLISTED_FILE_TYPES = [
     "image",
@@ -38,14 +67,20 @@ BLACKLISTED_FILE_TYPES = [
     "ipa",
     "irrelevant",
 ]
-LOGS_LOCK_KEY = "trufflehog_logs_lock"
 LOGS_SET_KEY = "trufflehog_logs"
 MAX_LOGS_BATCH_SIZE = 1000
-LOCK_RETRIES = 3
-LOCK_RETRY_DELAY = 2
 REPOSITORY_CODE_PATH = "/code"
 REPOSITORY_SELECTOR = "v3.asset.repository"
+FILE_SELECTOR = "v3.asset.file"
 REPOSITORY_ARCHIVE_SELECTOR = "v3.asset.file.repository_archive"
+SCAN_DONE_SELECTOR = "v3.report.event.scan.done"
+REPORT_FLUSH_TIMEOUT = 10
+REQUEST_RESPONSE_PARTS_KEY = "trufflehog_request_response_parts"
+MAX_PATHS_PER_SCANNER_RUN = 500
+SCANNED_FILE_NAME = "content"
+REQUEST_RESPONSE_SELECTOR = "v3.capture.request_response"
+# Metadata values longer than this number of characters are represented in the DNA by their SHA-256 digest.
+DNA_MAX_METADATA_VALUE_LENGTH = 1024
 
 
 logging.basicConfig(
@@ -59,15 +94,91 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def _process_file(content: bytes) -> bytes | None:
+def _process_file(content: bytes, scan: Callable[[str], bytes | None]) -> bytes | None:
     with tempfile.NamedTemporaryFile() as target_file:
         target_file.write(content)
         target_file.seek(0)
         input_file = target_file.name
-        cmd_output = TruffleHogAgent.run_scanner("filesystem", input_file)
+        cmd_output = scan(input_file)
     return cmd_output
 
 
+def _write_archive_entries(
+    content: bytes,
+    directory: str,
+    decode_binary_files: bool = False,
+    fingerprint_index: fingerprints.FingerprintIndex | None = None,
+    max_entry_size: int = archives.MAX_ENTRY_SIZE,
+    exclude_path_regexes: list[str] | None = None,
+) -> int:
+    """Write the relevant entries of an APK, XAPK or IPA archive to a directory, to scan them in a single run.
+
+    Entries are streamed from the archive and filtered by path and type, only the surviving ones are written.
+
+    Args:
+        content: The archive bytes.
+        directory: The directory the entries are written to.
+        decode_binary_files: Convert binary XML and plist entries to text before scanning them.
+        fingerprint_index: Known library builds that are not scanned.
+        max_entry_size: Entries larger than this number of bytes are not scanned.
+        exclude_path_regexes: Patterns of the entry paths that are not scanned.
+
+    Returns:
+        The number of written entries.
+    """
+    written_entries = 0
+    for entry_path, entry_content in archives.iter_entries(
+        content,
+        max_entry_size=max_entry_size,
+        exclude_path_regexes=exclude_path_regexes,
+    ):
+        entry_type = utils.get_file_type(
+            filename=entry_path, file_content=entry_content
+        )
+        if entry_type in BLACKLISTED_FILE_TYPES:
+            continue
+        if (
+            fingerprint_index is not None
+            and fingerprint_index.should_skip(entry_type, entry_content) is True
+        ):
+            continue
+        if decode_binary_files is True:
+            entry_content = decoders.decode(entry_type, entry_content)
+        relative_path = archives.safe_relative_path(entry_path)
+        if relative_path == pathlib.Path():
+            continue
+        target_path = pathlib.Path(directory) / relative_path
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        target_path.write_bytes(entry_content)
+        written_entries += 1
+    return written_entries
+
+
+@dataclasses.dataclass
+class _PreparedFile:
+    """A file message whose content was written to a temporary directory, ready to be scanned."""
+
+    message: m.Message
+    directory: tempfile.TemporaryDirectory[str]
+    target: str
+    # Directory the finding paths are relative to, set for archives whose entries are reported individually.
+    scanned_path: str | None = None
+    control_message: m.Message | None = None
+    # Checkpoint of the message, released once the file is reported.
+    job_id: str | None = None
+
+
+@dataclasses.dataclass(frozen=True)
+class _PendingExchange:
+    """A request/response exchange waiting for its batch to be scanned."""
+
+    message: m.Message
+    content: bytes
+    control_message: m.Message | None
+    # Digests of the exchange parts, marked as seen once the exchange is scanned.
+    part_digests: list[str]
+
+
 def _prepare_vulnerability_location(
     message: m.Message,
     file_path: str | None,
@@ -125,8 +236,7 @@ def _prepare_vulnerability_location(
                 )
             )
     elif (
-        message.selector == "v3.capture.logs"
-        or message.selector == "v3.report.event.scan.done"
+        message.selector == "v3.capture.logs" or message.selector == SCAN_DONE_SELECTOR
     ):
         if content is not None:
             metadata.append(
@@ -164,24 +274,6 @@ def _prepare_vulnerability_location(
     )
 
 
-def _get_repository_file_path(vuln: dict[str, Any]) -> str | None:
-    """Extract the file path TruffleHog reports for a repository finding."""
-    source_data = vuln.get("SourceMetadata", {}).get("Data", {})
-    source_details = source_data.get("Filesystem")
-    if isinstance(source_details, dict) is False:
-        return None
-    file_path = source_details.get("file")
-    if isinstance(file_path, str) is True and file_path != "":
-        path = pathlib.Path(file_path)
-        if path.is_absolute() is True:
-            try:
-                return str(path.relative_to(REPOSITORY_CODE_PATH))
-            except ValueError:
-                return str(file_path)
-        return str(file_path)
-    return None
-
-
 class TruffleHogAgent(
     agent.Agent,
     agent_persist_mixin.AgentPersistMixin,
@@ -198,117 +290,1037 @@ class TruffleHogAgent(
         agent_settings: runtime_definitions.AgentSettings,
     ) -> None:
         """Construct necessary attributes of the TruffleHogAgent Agent instance."""
+        self._constructed_at = time.monotonic()
         super().__init__(agent_definition, agent_settings)
         agent_persist_mixin.AgentPersistMixin.__init__(self, agent_settings)
-
-    @tenacity.retry(
-        stop=tenacity.stop_after_attempt(LOCK_RETRIES),
-        wait=tenacity.wait_fixed(LOCK_RETRY_DELAY),
-    )
-    def _acquire_lock(self) -> bool:
-        """Attempt to acquire Redis lock."""
-        return self.set_add(LOGS_LOCK_KEY, "locked") is True
+        # Client of the Redis shared by the replicas, for the structures the persist mixin does not expose.
+        self._redis = redis.Redis.from_url(str(agent_settings.redis_url))
+        self._log_batches = log_batches.LogBatches(self._redis, LOGS_SET_KEY)
+        self._readable_dna = self.args.get("readable_dna") is True
+        self._reporting_policy = reporting.ReportingPolicy.from_args(self.args)
+        self._unverified_rate_limiter = reporting.DetectorRateLimiter(
+            self._reporting_policy.unverified_reports_per_minute
+        )
+        # Control messages of the messages being processed by their raw message, see `process_message`.
+        self._control_messages: dict[bytes, list[m.Message]] = {}
+        self._control_messages_lock = threading.Lock()
+        self._report_buffer = reporting.ReportBuffer(
+            emit=self._emit_reports,
+            max_pending=int(self.args.get("report_batch_size") or 1),
+            background=self.args.get("report_sender_thread") is True,
+        )
+        self._scheduler = scheduler.Scheduler(
+            workers=int(self.args.get("long_running_scan_workers") or 0),
+            queue_size=int(self.args.get("long_running_scan_queue_size") or 1),
+        )
+        self._scanner_settings = scanner.ScannerSettings.from_args(self.args)
+        self._file_pipeline = self._build_file_pipeline()
+        self._git_history_bounds = git_history.HistoryBounds.from_args(self.args)
+        self._finding_scoring = self.args.get("finding_scoring") is True
+        self._finding_score_threshold = float(
+            self.args.get("finding_score_threshold") or 0
+        )
+        # Key of the HMACs stored in place of the secrets, by the verification cache and the result store.
+        self._secret_salt = (
+            self.args.get("verification_cache_salt") or verification.DEFAULT_SALT
+        )
+        self._verification_cache = self._build_verification_cache()
+        self._verifier = verification.ScannerVerifier(self._scanner_settings)
+        self._only_verified = self._scanner_settings.only_verified
+        if self._verification_cache is not None:
+            # Scans skip verification, the cache verifies the secrets it does not know.
+            self._scanner_settings = dataclasses.replace(
+                self._scanner_settings, verify=False
+            )
+        self._expand_archives = self.args.get("expand_archives") is True
+        self._archive_max_entry_size = int(
+            self.args.get("archive_max_entry_size") or archives.MAX_ENTRY_SIZE
+        )
+        self._decode_binary_files = self.args.get("decode_binary_files") is not False
+        self._fingerprint_index = fingerprints.FingerprintIndex.from_file(
+            pathlib.Path(
+                self.args.get("known_library_fingerprints_file")
+                or fingerprints.KNOWN_LIBRARIES_PATH
+            )
+        )
+        for digest in self.args.get("known_library_fingerprints") or []:
+            self._fingerprint_index.add(digest)
+        self._request_response_batch_size = max(
+            int(self.args.get("request_response_batch_size") or 1), 1
+        )
+        max_body_size = int(self.args.get("request_response_max_body_size") or 0)
+        self._request_response_max_body_size = (
+            max_body_size if max_body_size > 0 else None
+        )
+        # Swapped by the message threads, the drain and read by the saturation publisher.
+        self._pending_exchanges_lock = threading.Lock()
+        self._pending_exchanges: list[_PendingExchange] = []
+        self._endpoint_history: exchanges.EndpointHistory | None = None
+        if self.args.get("request_response_differential_scanning") is True:
+            similarity_threshold = self.args.get(
+                "request_response_similarity_threshold"
+            )
+            self._endpoint_history = exchanges.EndpointHistory(
+                similarity_threshold=float(
+                    similarity_threshold
+                    if similarity_threshold is not None
+                    else exchanges.DEFAULT_SIMILARITY_THRESHOLD
+                ),
+                max_endpoints=int(
+                    self.args.get("request_response_history_size")
+                    or exchanges.DEFAULT_MAX_ENDPOINTS
+                ),
+            )
+        self._repository_shards = max(int(self.args.get("repository_shards") or 1), 1)
+        self._warm_up = self.args.get("warm_up") is True
+        self._ready = threading.Event()
+        self.time_to_ready: float | None = None
+        result_store_path = self.args.get("result_store_path")
+        self._result_store = (
+            results.ResultStore(result_store_path) if result_store_path else None
+        )
+        self._result_store_export_path = self.args.get("result_store_export_path")
+        self._profiler = profiling.MessageProfiler.from_args(self.args)
+        self._saturation_publisher = self._build_saturation_publisher()
+        self._draining = threading.Event()
+        self._drain_thread: threading.Thread | None = None
+        self._drain_timeout = float(self.args.get("drain_timeout") or 0)
+        # Queued long-running scans and pipelined files are acknowledged before they run, they are checkpointed so a
+        # shutdown does not lose them.
+        self._checkpoints = (
+            checkpoints.JobCheckpoints(self._redis)
+            if self.args.get("checkpoint_jobs") is True
+            or self._scheduler.enabled
+            or self._file_pipeline is not None
+            else None
+        )
+        self._long_running_scan_timeout = (
+            float(self.args.get("long_running_scan_timeout") or 0) or None
+        )
 
     def _process_logs(
         self, log_content: bytes | None, force_process: bool = False
     ) -> tuple[bytes | None, bytes | None]:
-        """Process logs with Redis synchronization.
+        """Add the log to the batch shared by the replicas and scan the batch once it is full.
 
         Args:
             log_content: The log content to add (empty if forcing processing)
             force_process: Whether to force processing regardless of batch size
 
         Returns:
-            The scanner output if logs were processed, None otherwise
+            The scanner output and the scanned logs if logs were processed, None otherwise
         """
         try:
-            if self._acquire_lock():
-                try:
-                    if log_content is not None:
-                        self.set_add(LOGS_SET_KEY, log_content)
-
-                    if (
-                        force_process is True
-                        or self.set_len(LOGS_SET_KEY) >= MAX_LOGS_BATCH_SIZE
-                    ):
-                        logs = self.set_members(LOGS_SET_KEY)
-                        if logs is not None and len(logs) > 0:
-                            combined_content = b"\n".join([log for log in logs])
-                            cmd_output = _process_file(combined_content)
-                            self.delete(LOGS_SET_KEY)
-                            return cmd_output, combined_content
-                finally:
-                    self.delete(LOGS_LOCK_KEY)
-        except Exception as e:
+            logs: list[bytes] = []
+            if log_content is not None:
+                logs = self._log_batches.add(log_content, MAX_LOGS_BATCH_SIZE)
+            if force_process is True and len(logs) == 0:
+                logs = self._log_batches.take()
+        except redis.exceptions.RedisError as e:
             logger.error(f"Failed to process logs: {e}")
             raise
-
-        return None, None
+        if len(logs) == 0:
+            return None, None
+        combined_content = b"\n".join(logs)
+        try:
+            cmd_output = _process_file(
+                combined_content, functools.partial(self._scan, "filesystem")
+            )
+        except Exception:
+            self._log_batches.restore(logs)
+            raise
+        return cmd_output, combined_content
 
     def _report_vulnz(
-        self, vulnz: list[dict[str, Any]], message: m.Message, content: bytes | None
+        self,
+        vulnz: list[finding.Finding],
+        message: m.Message,
+        content: bytes | None,
+        use_finding_path: bool = False,
+        control_message: m.Message | None = None,
     ) -> None:
+        """Buffer a report for every verified secret, and aggregated reports of the unverified ones the policy accepts.
+
+        Args:
+            vulnz: The parsed trufflehog findings.
+            message: The message that was scanned.
+            content: The scanned content, reported as metadata of log findings.
+            use_finding_path: Report the path of the findings relative to the scanned directory instead of the path
+                of the message.
+            control_message: The control message of the scanned message, the reports are emitted with its agents.
+        """
+        locations: dict[str | None, vuln_mixin.VulnerabilityLocation | None] = {}
+        unverified_secrets: dict[
+            tuple[str | None, str | None], list[tuple[str, float | None]]
+        ] = {}
         for vuln in vulnz:
-            secret_token = vuln.get("Raw") or vuln.get("Redacted")
+            secret_token = vuln.raw or vuln.redacted
             if secret_token is None:
                 logger.error("Trying to emit a vulnerability with no secret: %s", vuln)
                 continue
+            if (
+                vuln.verified is not True
+                and self._reporting_policy.accepts_unverified(vuln) is False
+            ):
+                continue
             secret_token = utils.escape_backtick(secret_token)
-            logger.info("Secret found : %s.", vuln["Redacted"])
+            logger.info("Secret found : %s.", vuln.redacted)
             technical_detail = f"""Secret `{secret_token}` """
-            secret_type = vuln.get("DetectorName")
+            secret_type = vuln.detector_name
             if secret_type is not None:
                 technical_detail += f"""of type `{secret_type}` """
-            path = message.data.get("path")
-            if (
-                message.selector == REPOSITORY_SELECTOR
-                or message.selector == REPOSITORY_ARCHIVE_SELECTOR
-            ):
-                path = _get_repository_file_path(vuln)
+            if use_finding_path is True:
+                path = vuln.file_path
+            else:
+                path = message.data.get("path")
 
             if path is not None:
                 technical_detail += f"""found in file `{path}`."""
-            vulnerability_location = _prepare_vulnerability_location(
-                message=message,
-                file_path=path,
-                content=content,
+            if vuln.score is not None:
+                technical_detail += f""" Score: `{vuln.score:.2f}`."""
+            if path not in locations:
+                locations[path] = _prepare_vulnerability_location(
+                    message=message,
+                    file_path=path,
+                    content=content,
+                )
+            vulnerability_location = locations[path]
+            dna = _compute_dna(
+                vuln_title=kb.KB.SECRETS_REVIEW.title,
+                vuln_location=vulnerability_location,
+                secret_token=secret_token,
+                readable=self._readable_dna,
             )
+            if (
+                self._result_store is not None
+                and self._result_store.add(
+                    results.StoredFinding(
+                        dna=dna,
+                        secret_hash=verification.hash_secret(
+                            self._secret_salt, secret_token
+                        ),
+                        detector=vuln.detector_name,
+                        asset=_asset_key(vulnerability_location),
+                        path=path,
+                        line=vuln.line,
+                        verified=vuln.verified,
+                    )
+                )
+                is False
+            ):
+                logger.debug("Secret %s was already reported.", vuln.redacted)
+                continue
+            if vuln.verified is not True:
+                unverified_secrets.setdefault((vuln.detector_name, path), []).append(
+                    (secret_token, vuln.score)
+                )
+                continue
 
-            if vuln.get("Verified") is True:
-                self.report_vulnerability(
+            self._report_buffer.add(
+                reporting.PendingReport(
                     entry=kb.KB.SECRETS_REVIEW,
                     risk_rating=vuln_mixin.RiskRating.HIGH,
                     technical_detail=technical_detail,
                     vulnerability_location=vulnerability_location,
-                    dna=_compute_dna(
-                        vuln_title=kb.KB.SECRETS_REVIEW.title,
-                        vuln_location=vulnerability_location,
-                        secret_token=secret_token,
-                    ),
+                    dna=dna,
+                    control_message=control_message,
                 )
+            )
+        self._report_unverified(unverified_secrets, locations, control_message)
 
-    def _process_scanner_output(self, output: bytes) -> list[dict[str, Any]]:
-        secrets = utils.load_newline_json(output)
-        secrets = utils.prune_reports(secrets)
-        return secrets
+    def _report_unverified(
+        self,
+        unverified_secrets: dict[
+            tuple[str | None, str | None], list[tuple[str, float | None]]
+        ],
+        locations: dict[str | None, vuln_mixin.VulnerabilityLocation | None],
+        control_message: m.Message | None = None,
+    ) -> None:
+        """Buffer aggregated reports of unverified secrets with a lower risk rating, rate limited per detector.
 
-    @staticmethod
-    def run_scanner(input_type: str, input_media: str) -> bytes | None:
-        try:
-            cmd_output = subprocess.check_output(
-                ["trufflehog", input_type, input_media, "--json"]
+        Args:
+            unverified_secrets: The escaped unverified secrets and their score by detector and path.
+            locations: The vulnerability location of every path.
+            control_message: The control message of the scanned message.
+        """
+        secrets_per_report = self._reporting_policy.unverified_secrets_per_report
+        for (detector, path), scored_tokens in unverified_secrets.items():
+            for start in range(0, len(scored_tokens), secrets_per_report):
+                reported_secrets = scored_tokens[start : start + secrets_per_report]
+                reported_tokens = [secret_token for secret_token, _ in reported_secrets]
+                if self._unverified_rate_limiter.allow(detector or "") is False:
+                    metrics.COUNTERS.increment(
+                        "reporting.unverified_rate_limited", len(reported_tokens)
+                    )
+                    continue
+                technical_detail = "Unverified secrets "
+                if detector is not None:
+                    technical_detail += f"of type `{detector}` "
+                if path is not None:
+                    technical_detail += f"found in file `{path}`"
+                technical_detail = (
+                    technical_detail.rstrip()
+                    + ":\n\n"
+                    + "\n".join(
+                        f"- `{secret_token}`"
+                        + (f" (score `{score:.2f}`)" if score is not None else "")
+                        for secret_token, score in reported_secrets
+                    )
+                )
+                self._report_buffer.add(
+                    reporting.PendingReport(
+                        entry=kb.KB.SECRETS_REVIEW,
+                        risk_rating=vuln_mixin.RiskRating.POTENTIALLY,
+                        technical_detail=technical_detail,
+                        vulnerability_location=locations[path],
+                        dna=_compute_dna(
+                            vuln_title=kb.KB.SECRETS_REVIEW.title,
+                            vuln_location=locations[path],
+                            secret_token="\n".join(sorted(reported_tokens)),
+                            readable=self._readable_dna,
+                        ),
+                        control_message=control_message,
+                    )
+                )
+
+    def _scan_exchanges(self, timeout: float | None = None) -> None:
+        """Scan the pending request/response exchanges in a single scanner run.
+
+        Every exchange is written to its own file so that findings are reported against the message they come from.
+
+        Args:
+            timeout: Wall-clock timeout of the scanner run, defaults to the filesystem scan timeout.
+        """
+        pending_exchanges = self._take_pending_exchanges()
+        if len(pending_exchanges) == 0:
+            return
+        logger.info("Scanning %d request/response exchanges.", len(pending_exchanges))
+        with tempfile.TemporaryDirectory() as directory:
+            for index, exchange in enumerate(pending_exchanges):
+                (pathlib.Path(directory) / str(index)).write_bytes(exchange.content)
+            cmd_output = self._scan("filesystem", directory, timeout=timeout)
+        if cmd_output is None:
+            return
+        part_digests = [
+            digest for exchange in pending_exchanges for digest in exchange.part_digests
+        ]
+        if len(part_digests) > 0:
+            self.set_add(REQUEST_RESPONSE_PARTS_KEY, *part_digests)
+        secrets_per_exchange: dict[int, list[finding.Finding]] = {}
+        for secret in self._process_scanner_output(cmd_output, directory):
+            file_path = secret.file_path
+            if file_path is None or file_path.isdigit() is False:
+                logger.error("Finding outside of the scanned exchanges: %s", file_path)
+                continue
+            secrets_per_exchange.setdefault(int(file_path), []).append(secret)
+        for index, secrets in secrets_per_exchange.items():
+            exchange = pending_exchanges[index]
+            self._report_vulnz(
+                secrets,
+                exchange.message,
+                None,
+                control_message=exchange.control_message,
+            )
+
+    def _is_seen_exchange_part(self, digest: str) -> bool:
+        """Whether an exchange part was scanned in the scan or waits to be scanned in the pending batch."""
+        with self._pending_exchanges_lock:
+            if any(
+                digest in exchange.part_digests for exchange in self._pending_exchanges
+            ):
+                return True
+        return self.set_is_member(REQUEST_RESPONSE_PARTS_KEY, digest)
+
+    def _take_pending_exchanges(self) -> list[_PendingExchange]:
+        with self._pending_exchanges_lock:
+            pending_exchanges = self._pending_exchanges
+            self._pending_exchanges = []
+        return pending_exchanges
+
+    def _scan_repository_shards(
+        self,
+        message: m.Message,
+        repository_path: pathlib.Path,
+        control_message: m.Message | None = None,
+    ) -> None:
+        """Scan and report the repository shards this replica claims, until all shards are claimed.
+
+        Args:
+            message: The repository message, identical for all the replicas.
+            repository_path: The repository code directory.
+            control_message: The control message of the repository message.
+        """
+        claims = partitioning.ShardClaims(
+            self._redis,
+            partitioning.repository_key(message),
+            self._repository_shards,
+        )
+        shards: list[list[pathlib.Path]] | None = None
+        # Shards this replica failed to scan, they stay unscanned for the other replicas to claim them.
+        failed_shards: set[int] = set()
+        while (shard := claims.claim_next(skipped=failed_shards)) is not None:
+            if shards is None:
+                shards = partitioning.partition(
+                    repository_path, self._repository_shards
+                )
+            paths = shards[shard]
+            logger.info(
+                "Scanning repository shard %d/%d of %d files.",
+                shard + 1,
+                self._repository_shards,
+                len(paths),
+            )
+            try:
+                with claims.scanning(shard):
+                    self._scan_repository_shard(message, paths, claims, control_message)
+            except partitioning.ShardScanError as e:
+                logger.error("Could not scan repository shard %d: %s", shard + 1, e)
+                failed_shards.add(shard)
+
+    def _scan_repository_shard(
+        self,
+        message: m.Message,
+        paths: list[pathlib.Path],
+        claims: partitioning.ShardClaims,
+        control_message: m.Message | None,
+    ) -> None:
+        """Scan and report the files of a claimed repository shard.
+
+        Raises:
+            ShardScanError: if the scanner failed on some of the files.
+        """
+        for start in range(0, len(paths), MAX_PATHS_PER_SCANNER_RUN):
+            cmd_output = self._scan(
+                "filesystem",
+                [
+                    str(path)
+                    for path in paths[start : start + MAX_PATHS_PER_SCANNER_RUN]
+                ],
+                timeout=self._long_running_scan_timeout,
+                timeout_key=scanner.REPOSITORY_TIMEOUT_KEY,
             )
-        except subprocess.CalledProcessError as e:
-            logger.error("Error : %s", e)
+            if cmd_output is None:
+                raise partitioning.ShardScanError(
+                    f"scanner failed on files {start} to {start + MAX_PATHS_PER_SCANNER_RUN}"
+                )
+            secrets = [
+                secret
+                for secret in self._process_scanner_output(
+                    cmd_output, REPOSITORY_CODE_PATH
+                )
+                if claims.claim_finding(secret) is True
+            ]
+            self._report_vulnz(
+                secrets,
+                message,
+                None,
+                use_finding_path=True,
+                control_message=control_message,
+            )
+
+    def _build_verification_cache(self) -> verification.VerificationCache | None:
+        """Build the verification cache on the configured backend, None if the cache is disabled.
+
+        Raises:
+            ValueError: if the backend is unknown.
+        """
+        backend_name = self.args.get("verification_cache_backend") or ""
+        backend: verification.CacheBackend
+        if backend_name == "":
             return None
+        elif backend_name == "redis":
+            backend = verification.PersistBackend(self)
+        elif backend_name == "sqlite":
+            backend = verification.SqliteBackend(
+                self.args.get("verification_cache_path")
+                or verification.DEFAULT_SQLITE_PATH
+            )
+        else:
+            raise ValueError(f"Unknown verification cache backend {backend_name!r}.")
+        return verification.VerificationCache(
+            backend,
+            salt=self._secret_salt,
+            verified_ttl=float(
+                self.args.get("verification_cache_verified_ttl")
+                or verification.DEFAULT_VERIFIED_TTL
+            ),
+            unverified_ttl=float(
+                self.args.get("verification_cache_unverified_ttl")
+                or verification.DEFAULT_UNVERIFIED_TTL
+            ),
+        )
+
+    def _emit_reports(self, reports: list[reporting.PendingReport]) -> None:
+        """Emit a batch of vulnerability reports on the bus, each with the agents of the message it reports on.
+
+        When the event loop runs on another thread, the whole batch is published in a single round trip to the loop
+        instead of one round trip per report. A report failing to be emitted does not prevent the others from being
+        emitted.
+        """
+        messages: list[tuple[str, bytes]] = []
+        for report in reports:
+            try:
+                raw_message = reporting.vulnerability_message(report, self.name)
+            except Exception:
+                logger.exception(
+                    "Failed to prepare vulnerability report %s.", report.dna
+                )
+                continue
+            messages.append(
+                (f"{reporting.VULNERABILITY_SELECTOR}.{uuid.uuid4()}", raw_message)
+            )
+        if self._loop.is_running() is False:
+            for key, raw_message in messages:
+                try:
+                    self.mq_send_message(key, raw_message)
+                except Exception:
+                    logger.exception("Failed to emit vulnerability report.")
+            return
+        errors = asyncio.run_coroutine_threadsafe(
+            self._publish(messages), self._loop
+        ).result()
+        for error in errors:
+            if error is not None:
+                logger.error("Failed to emit vulnerability report: %s", error)
+
+    async def _publish(
+        self, messages: list[tuple[str, bytes]]
+    ) -> list[BaseException | None]:
+        """Publish the messages concurrently, returning the error of every message or None if it was published."""
+        return await asyncio.gather(
+            *(self.async_mq_send_message(key, raw) for key, raw in messages),
+            return_exceptions=True,
+        )
+
+    def process_message(self, selector: str, message: bytes) -> None:
+        """Process a message received on the bus, keeping its control message until it is processed.
+
+        Messages are processed by several threads while the agent only keeps the control message of the last received
+        one, the reports of a message are emitted with its own control message instead, see `_received_control_message`.
+        """
+        control_message = m.Message.from_raw("v3.control", message)
+        raw_message = control_message.data["message"]
+        with self._control_messages_lock:
+            self._control_messages.setdefault(raw_message, []).append(control_message)
+        try:
+            super().process_message(selector, message)
+        finally:
+            with self._control_messages_lock:
+                control_messages = self._control_messages[raw_message]
+                control_messages.remove(control_message)
+                if len(control_messages) == 0:
+                    del self._control_messages[raw_message]
+
+    def _received_control_message(self, message: m.Message) -> m.Message | None:
+        """Control message a message was received with, None if it was not received from the bus."""
+        with self._control_messages_lock:
+            control_messages = self._control_messages.get(message.raw)
+            if not control_messages:
+                return None
+            return control_messages[-1]
+
+    def _process_scanner_output(
+        self,
+        output: bytes,
+        base_path: str | None = None,
+        message_path: str | None = None,
+    ) -> list[finding.Finding]:
+        """Parse the scanner output into unique findings, prioritized by score when scoring is enabled.
+
+        When the scan skipped verification, the findings were verified by `_scan` and take their status from the
+        verification cache, before scoring.
+
+        Args:
+            output: The scanner output.
+            base_path: The scanned directory the finding paths are made relative to.
+            message_path: Path of the scanned file message, used to score the findings without a path.
+        """
+        findings = utils.prune_findings(utils.iter_findings(output, base_path))
+        if self._verification_cache is not None and len(findings) > 0:
+            self._verification_cache.apply(findings)
+            if self._only_verified is True:
+                findings = [secret for secret in findings if secret.verified is True]
+        if self._finding_scoring is True:
+            findings = scoring.prioritize(
+                findings,
+                threshold=self._finding_score_threshold,
+                default_path=message_path,
+            )
+        return findings
+
+    def _scan(
+        self,
+        input_type: str,
+        input_media: str | list[str],
+        timeout: float | None = None,
+        flags: list[str] | None = None,
+        timeout_key: str | None = None,
+    ) -> bytes | None:
+        """Run trufflehog with the agent settings, see `run_scanner`.
+
+        With the verification cache, the scan skips verification and the secrets it finds are verified while the
+        target still exists: first bare, then by scanning the target again with verification for the secrets the
+        bare verification does not confirm. The outcomes are read back from the cache when the output is parsed.
+
+        Returns:
+            The scanner output, None if the scanner failed.
+        """
+
+        def _run(settings: scanner.ScannerSettings) -> bytes | None:
+            return self.run_scanner(
+                input_type,
+                input_media,
+                timeout=timeout,
+                settings=settings,
+                flags=flags,
+                timeout_key=timeout_key,
+            )
+
+        cmd_output = _run(self._scanner_settings)
+        if cmd_output is None or self._verification_cache is None:
+            return cmd_output
+        findings = utils.prune_findings(utils.iter_findings(cmd_output))
+        if len(findings) > 0:
+            self._verification_cache.resolve(
+                findings,
+                self._verifier,
+                fallback=verification.RescanVerifier(self._scanner_settings, _run),
+            )
         return cmd_output
 
+    @staticmethod
+    def run_scanner(
+        input_type: str,
+        input_media: str | list[str],
+        timeout: float | None = None,
+        settings: scanner.ScannerSettings | None = None,
+        flags: list[str] | None = None,
+        timeout_key: str | None = None,
+    ) -> bytes | None:
+        """Run trufflehog on the input under the scanner execution limits.
+
+        Args:
+            input_type: The trufflehog source, like `filesystem` or `git`.
+            input_media: The path or URL to scan, or a list of paths scanned in a single run.
+            timeout: Wall-clock timeout overriding the one configured for the input type.
+            settings: The scanner execution limits, defaults are used if missing.
+            flags: Source specific flags added to the settings flags.
+            timeout_key: Key of the configured timeout, defaults to the input type.
+
+        Returns:
+            The scanner output, None if the scanner failed.
+        """
+        settings = settings or scanner.ScannerSettings()
+        return scanner.run(
+            [
+                "trufflehog",
+                input_type,
+                *([input_media] if isinstance(input_media, str) else input_media),
+                "--json",
+                *settings.flags(),
+                *(flags or []),
+            ],
+            settings=settings,
+            timeout=timeout or settings.timeout_for(timeout_key or input_type),
+        )
+
     def process(self, message: m.Message) -> None:
+        """
+        Runs the trufflehog tool ont the file/link received and emits the buffered reports.
+
+        Args:
+            message: the message containing the trufflehog tool input file.
+
+        Returns:
+            None.
+        """
+        metrics.COUNTERS.increment("messages.received")
+        metrics.COUNTERS.increment("messages.received_bytes", len(message.raw))
+        control_message = self._received_control_message(message)
+        try:
+            if self._draining.is_set() is True:
+                self._checkpoint_draining_message(message)
+                return
+            if self._file_pipeline is not None and message.selector == FILE_SELECTOR:
+                self._file_pipeline.submit(
+                    (message, control_message, self._checkpoint(message))
+                )
+                return
+            job_id = self._checkpoint(message)
+            if self._scheduler.submit(
+                message.selector,
+                functools.partial(
+                    self._process_job,
+                    message,
+                    job_id,
+                    control_message,
+                ),
+            ):
+                return
+            if message.selector == SCAN_DONE_SELECTOR:
+                if self._scheduler.join(timeout=self._drain_timeout) is False:
+                    logger.warning(
+                        "Processing scan done with running long-running scans."
+                    )
+                if self._file_pipeline is not None:
+                    self._file_pipeline.join()
+            self._process_checkpointed(message, job_id, control_message)
+            if message.selector == SCAN_DONE_SELECTOR:
+                self._export_results()
+                if self._checkpoints is not None:
+                    self._checkpoints.expire()
+        finally:
+            if (
+                self._report_buffer.background is False
+                or message.selector == SCAN_DONE_SELECTOR
+            ):
+                self._report_buffer.flush()
+
+    def _process_job(
+        self,
+        message: m.Message,
+        job_id: str | None = None,
+        control_message: m.Message | None = None,
+    ) -> None:
+        """Process a message scheduled on the long-running lane and emit its reports."""
+        try:
+            self._process_checkpointed(message, job_id, control_message)
+        finally:
+            if self._report_buffer.background is False:
+                self._report_buffer.flush()
+
+    def _checkpoint(self, message: m.Message) -> str | None:
+        """Checkpoint the scans acknowledged before they run, so they are resumed if the agent stops first.
+
+        These are the long-running scans and, when the file pipeline is enabled, the files.
+        """
+        is_pipelined_file = (
+            self._file_pipeline is not None and message.selector == FILE_SELECTOR
+        )
+        if self._checkpoints is None or (
+            scheduler.is_long_running(message.selector) is False
+            and is_pipelined_file is False
+        ):
+            return None
+        return self._checkpoints.save(message)
+
+    def _process_checkpointed(
+        self,
+        message: m.Message,
+        job_id: str | None,
+        control_message: m.Message | None = None,
+    ) -> None:
+        """Process the message and release its checkpoint, unless the agent exits while the message is processed."""
+        profile = (
+            self._profiler.profile(message.selector)
+            if self._profiler is not None
+            else contextlib.nullcontext()
+        )
+        try:
+            with profile:
+                self._process(message, control_message)
+        except Exception:
+            self._release_checkpoint(job_id)
+            raise
+        self._release_checkpoint(job_id)
+
+    def _release_checkpoint(self, job_id: str | None) -> None:
+        if self._checkpoints is not None and job_id is not None:
+            self._checkpoints.release(job_id)
+
+    def _checkpoint_draining_message(self, message: m.Message) -> None:
+        """Keep the messages received while draining for the next agent instead of processing them."""
+        if self._checkpoints is None:
+            logger.warning("Agent is draining, dropping %s message.", message.selector)
+            return
+        logger.info("Agent is draining, checkpointing %s message.", message.selector)
+        self._checkpoints.save(message)
+
+    def _export_results(self) -> None:
+        """Export the findings of the scan from the result store, then store the findings of the next scan."""
+        if self._result_store is None:
+            return
+        if self._result_store_export_path:
+            self._result_store.export(self._result_store_export_path)
+        self._result_store.start_scan()
+
+    def start(self) -> None:
+        """Warm up the dependencies, then resume the jobs checkpointed by agents that stopped before completing them."""
+        if self._warm_up is True:
+            durations = startup.warm_up(self._scanner_settings)
+            logger.info(
+                "Warmed up libmagic in %.2f seconds and the scanner in %.2f seconds.",
+                durations["libmagic"],
+                durations["scanner"],
+            )
+        self.time_to_ready = time.monotonic() - self._constructed_at
+        self._ready.set()
+        if self._saturation_publisher is not None:
+            self._saturation_publisher.start()
+        logger.info(
+            "Agent ready %.2f seconds after its construction.", self.time_to_ready
+        )
+        if self._checkpoints is None:
+            return
+        for job_id, message in self._checkpoints.pending():
+            if self._checkpoints.release(job_id) is False:
+                continue
+            logger.info("Resuming checkpointed %s job.", message.selector)
+            self.process(message)
+
+    def is_healthy(self) -> bool:
+        """The agent is healthy once started and warmed up."""
+        return self._ready.is_set()
+
+    def at_exit(self) -> None:
+        """Drain the in-flight work and give the buffered reports a last chance to be emitted before the agent exits.
+
+        New messages are no longer processed, running long-running scans and batched exchanges are given until the
+        drain timeout to complete. Checkpointed scans that did not complete are resumed by the next agent.
+
+        Reports are sent by the event loop. When called on the thread running the loop, like by the SIGTERM handler,
+        the drain runs on a separate thread that stops the loop once done, instead of blocking the loop it waits on.
+        """
+        if self._runs_event_loop() is False:
+            self._drain()
+            return
+        self._drain_thread = threading.Thread(
+            target=self._drain_and_stop_loop, name="trufflehog-drain"
+        )
+        self._drain_thread.start()
+
+    def _handle_signal(self, *args: Any) -> None:
+        """Drain on SIGTERM, the agent exits once the event loop is stopped when the drain does not block it."""
+        self.at_exit()
+        if self._drain_thread is None:
+            sys.exit()
+
+    def _runs_event_loop(self) -> bool:
+        """Whether the calling thread runs the event loop of the agent."""
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _drain_and_stop_loop(self) -> None:
+        try:
+            self._drain()
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _drain(self) -> None:
+        self._draining.set()
+        self._scheduler.stop()
+        deadline = time.monotonic() + self._drain_timeout
+        if self._scheduler.join(timeout=self._drain_timeout) is False:
+            logger.warning("Exiting with running long-running scans.")
+        if self._file_pipeline is not None:
+            self._file_pipeline.stop()
+            if (
+                self._file_pipeline.join(timeout=max(deadline - time.monotonic(), 0))
+                is False
+            ):
+                logger.warning("Exiting with files in the file pipeline.")
+        remaining_time = deadline - time.monotonic()
+        if remaining_time > 0:
+            self._scan_exchanges(timeout=remaining_time)
+        else:
+            self._checkpoint_pending_exchanges()
+        if self._report_buffer.flush(timeout=REPORT_FLUSH_TIMEOUT) is False:
+            logger.warning("Exiting with unsent vulnerability reports.")
+        if self._result_store is not None:
+            self._result_store.close()
+        if self._saturation_publisher is not None:
+            self._saturation_publisher.stop()
+
+    def _checkpoint_pending_exchanges(self) -> None:
+        """Keep the exchanges there is no time left to scan for the next agent."""
+        pending_exchanges = self._take_pending_exchanges()
+        if len(pending_exchanges) == 0:
+            return
+        if self._checkpoints is None:
+            logger.warning(
+                "Exiting with %d unscanned exchanges.", len(pending_exchanges)
+            )
+            return
+        logger.info("Checkpointing %d unscanned exchanges.", len(pending_exchanges))
+        for exchange in pending_exchanges:
+            self._checkpoints.save(exchange.message)
+
+    def _prepare_file(
+        self, message: m.Message, control_message: m.Message | None = None
+    ) -> _PreparedFile | None:
+        """Filter, decode and write the content of a file message to a temporary directory.
+
+        Args:
+            message: The file message.
+            control_message: The control message of the file message, for the reports of the file pipeline.
+
+        Returns:
+            The prepared file, None if the file is not scanned.
+        """
+        path = message.data.get("path", "")
+        if (
+            utils.should_exclude_path(path, self.args.get("exclude_path_regexes"))
+            is True
+        ):
+            return None
+        content = message.data.get("content", b"")
+        file_type = utils.get_file_type(filename=path, file_content=content)
+        if self._expand_archives is True and file_type in archives.ARCHIVE_FILE_TYPES:
+            logger.info("Processing archive %s with type %s", path, file_type)
+            directory = tempfile.TemporaryDirectory()
+            written_entries = _write_archive_entries(
+                content,
+                directory.name,
+                self._decode_binary_files,
+                self._fingerprint_index,
+                max_entry_size=self._archive_max_entry_size,
+                exclude_path_regexes=self.args.get("exclude_path_regexes"),
+            )
+            logger.info("Scanning %d archive entries.", written_entries)
+            if written_entries == 0:
+                directory.cleanup()
+                return None
+            return _PreparedFile(
+                message, directory, directory.name, directory.name, control_message
+            )
+        if file_type in BLACKLISTED_FILE_TYPES:
+            logger.debug("Skipping file %s with blacklisted type %s", path, file_type)
+            return None
+        if self._fingerprint_index.should_skip(file_type, content) is True:
+            logger.info("Skipping file %s matching a known library build", path)
+            return None
+        logger.info("Processing file %s with type %s", path, file_type)
+        if self._decode_binary_files is True:
+            content = decoders.decode(file_type, content)
+        directory = tempfile.TemporaryDirectory()
+        target = pathlib.Path(directory.name) / SCANNED_FILE_NAME
+        target.write_bytes(content)
+        return _PreparedFile(
+            message, directory, str(target), control_message=control_message
+        )
+
+    def _prepare_pipelined_file(
+        self, submitted: tuple[m.Message, m.Message | None, str | None]
+    ) -> _PreparedFile | None:
+        """Prepare a file submitted to the file pipeline, releasing its checkpoint if it is not scanned."""
+        message, control_message, job_id = submitted
+        try:
+            prepared_file = self._prepare_file(message, control_message)
+        except Exception:
+            self._release_checkpoint(job_id)
+            raise
+        if prepared_file is None:
+            self._release_checkpoint(job_id)
+            return None
+        prepared_file.job_id = job_id
+        return prepared_file
+
+    def _scan_prepared_file(self, prepared_file: _PreparedFile) -> bytes | None:
+        """Scan a prepared file and remove its temporary directory."""
+        try:
+            return self._scan("filesystem", prepared_file.target)
+        except Exception:
+            self._release_checkpoint(prepared_file.job_id)
+            raise
+        finally:
+            prepared_file.directory.cleanup()
+
+    def _report_prepared_file(
+        self, prepared_file: _PreparedFile, cmd_output: bytes | None
+    ) -> None:
+        """Report the secrets found in a file scanned by the file pipeline and release its checkpoint."""
+        try:
+            if cmd_output is None:
+                return
+            secrets = self._process_scanner_output(
+                cmd_output,
+                prepared_file.scanned_path,
+                message_path=prepared_file.message.data.get("path"),
+            )
+            self._report_vulnz(
+                secrets,
+                prepared_file.message,
+                None,
+                use_finding_path=prepared_file.scanned_path is not None,
+                control_message=prepared_file.control_message,
+            )
+            if self._report_buffer.background is False:
+                self._report_buffer.flush()
+        finally:
+            self._release_checkpoint(prepared_file.job_id)
+
+    def _build_file_pipeline(
+        self,
+    ) -> (
+        pipeline.Pipeline[
+            tuple[m.Message, m.Message | None, str | None],
+            _PreparedFile,
+            bytes | None,
+        ]
+        | None
+    ):
+        """Build the file pipeline overlapping the preparation of files with their scans, None if it is disabled."""
+        prepare_workers = int(self.args.get("file_pipeline_workers") or 0)
+        if prepare_workers == 0:
+            return None
+        return pipeline.Pipeline(
+            prepare=self._prepare_pipelined_file,
+            scan=self._scan_prepared_file,
+            report=self._report_prepared_file,
+            discard=lambda prepared_file: prepared_file.directory.cleanup(),
+            prepare_workers=prepare_workers,
+            scan_workers=int(self.args.get("file_pipeline_scan_workers") or 1),
+            queue_size=int(
+                self.args.get("file_pipeline_queue_size") or pipeline.DEFAULT_QUEUE_SIZE
+            ),
+        )
+
+    def _build_saturation_publisher(self) -> saturation.SaturationPublisher | None:
+        """Build the publisher of the saturation signals, None if it is disabled."""
+        path = self.args.get("saturation_signals_path")
+        if not path:
+            return None
+        # The message thread, the long-running lane workers and the file pipeline scan threads each run a scanner.
+        scanner_slots = 1 + int(self.args.get("long_running_scan_workers") or 0)
+        if self._file_pipeline is not None:
+            scanner_slots += int(self.args.get("file_pipeline_scan_workers") or 1)
+        return saturation.SaturationPublisher(
+            pathlib.Path(path),
+            gauges=self._saturation_gauges,
+            scanner_slots=scanner_slots,
+            interval=float(
+                self.args.get("saturation_signals_interval")
+                or saturation.DEFAULT_INTERVAL
+            ),
+        )
+
+    def _saturation_gauges(self) -> saturation.Gauges:
+        """Messages waiting or being processed per selector, and the logs waiting for their batch."""
+        queue_depths = self._scheduler.pending()
+        if self._file_pipeline is not None:
+            queue_depths[FILE_SELECTOR] = self._file_pipeline.in_flight()
+        with self._pending_exchanges_lock:
+            pending_exchanges = len(self._pending_exchanges)
+        if pending_exchanges > 0:
+            queue_depths[REQUEST_RESPONSE_SELECTOR] = pending_exchanges
+        try:
+            pending_logs: int | None = self._log_batches.pending()
+        except redis.exceptions.RedisError as e:
+            logger.warning("Could not read the pending logs: %s", e)
+            pending_logs = None
+        return saturation.Gauges(queue_depths=queue_depths, pending_logs=pending_logs)
+
+    def _process(
+        self, message: m.Message, control_message: m.Message | None = None
+    ) -> None:
         """
         Runs the trufflehog tool ont the file/link received.
 
         Args:
             message: the message containing the trufflehog tool input file.
+            control_message: the control message the message was received with.
 
         Returns:<
             None.
@@ -317,13 +1329,35 @@ class TruffleHogAgent(
 
         cmd_output: bytes | None = None
         combined_content: bytes | None = b""
+        scanned_path: str | None = None
         if message.selector.startswith("v3.asset.link"):
             link = message.data.get("url", "")
             link_type = input_type_handler.get_link_type(link)
             if link_type is None:
                 return
             logger.info("Processing link %s of type %s", link, link_type)
-            cmd_output = self.run_scanner(link_type, link)
+            if self._git_history_bounds.requires_clone(link_type) is True:
+                cmd_output = git_history.scan(
+                    link,
+                    self._git_history_bounds,
+                    run_scanner=lambda target, flags: self._scan(
+                        "git",
+                        target,
+                        timeout=self._long_running_scan_timeout,
+                        flags=flags,
+                    ),
+                    clone_timeout=self._long_running_scan_timeout
+                    or self._scanner_settings.timeout_for("git"),
+                )
+            else:
+                cmd_output = self._scan(
+                    link_type,
+                    link,
+                    timeout=self._long_running_scan_timeout,
+                    flags=self._git_history_bounds.flags()
+                    if link_type == "git"
+                    else None,
+                )
         elif (
             message.selector == REPOSITORY_SELECTOR
             or message.selector == REPOSITORY_ARCHIVE_SELECTOR
@@ -340,31 +1374,32 @@ class TruffleHogAgent(
                 message.selector,
                 REPOSITORY_CODE_PATH,
             )
-            cmd_output = self.run_scanner("filesystem", REPOSITORY_CODE_PATH)
-        elif message.selector.startswith("v3.asset.file"):
-            path = message.data.get("path", "")
-            if (
-                utils.should_exclude_path(path, self.args.get("exclude_path_regexes"))
-                is True
-            ):
+            if self._repository_shards > 1:
+                self._scan_repository_shards(message, repository_path, control_message)
                 return
-            content = message.data.get("content", b"")
-            file_type = utils.get_file_type(filename=path, file_content=content)
-            if file_type in BLACKLISTED_FILE_TYPES:
-                logger.debug(
-                    "Skipping file %s with blacklisted type %s", path, file_type
-                )
+            cmd_output = self._scan(
+                "filesystem",
+                REPOSITORY_CODE_PATH,
+                timeout=self._long_running_scan_timeout,
+                timeout_key=scanner.REPOSITORY_TIMEOUT_KEY,
+            )
+        elif message.selector.startswith("v3.asset.file"):
+            prepared_file = self._prepare_file(message)
+            if prepared_file is None:
                 return
-            logger.info("Processing file %s with type %s", path, file_type)
-            cmd_output = _process_file(content)
+            cmd_output = self._scan_prepared_file(prepared_file)
+            scanned_path = prepared_file.scanned_path
         elif message.selector.startswith("v3.capture.logs"):
             content = message.data.get("message", "")
             if content is not None:
                 cmd_output, combined_content = self._process_logs(
                     content.encode("utf-8"), force_process=False
                 )
-        elif message.selector == "v3.report.event.scan.done":
+        elif message.selector == SCAN_DONE_SELECTOR:
             logger.info("Processing scan done message.")
+            self._scan_exchanges()
+            if self.exists(REQUEST_RESPONSE_PARTS_KEY) is True:
+                self.delete(REQUEST_RESPONSE_PARTS_KEY)
             cmd_output, combined_content = self._process_logs(
                 log_content=None, force_process=True
             )
@@ -375,61 +1410,142 @@ class TruffleHogAgent(
                 "Processing request and response content for url %s",
                 request.get("url", ""),
             )
-            content = response.get("body", b"") + b"\n" + request.get("body", b"")
-            cmd_output = _process_file(content)
+            content, part_digests = exchanges.scannable_content(
+                request,
+                response,
+                is_seen_part=self._is_seen_exchange_part,
+                max_body_size=self._request_response_max_body_size,
+            )
+            if self._endpoint_history is not None and content != b"":
+                content = self._endpoint_history.delta(
+                    exchanges.endpoint_key(request), content
+                )
+            if content == b"":
+                logger.debug("Exchange has no new content to scan.")
+                return
+            with self._pending_exchanges_lock:
+                self._pending_exchanges.append(
+                    _PendingExchange(
+                        message,
+                        content,
+                        control_message,
+                        part_digests,
+                    )
+                )
+                is_batch_full = (
+                    len(self._pending_exchanges) >= self._request_response_batch_size
+                )
+            if is_batch_full is True:
+                self._scan_exchanges()
+            return
         if cmd_output is None:
             return
 
         logger.debug("Parsing trufflehog output.")
 
-        secrets = self._process_scanner_output(cmd_output)
+        if (
+            message.selector == REPOSITORY_SELECTOR
+            or message.selector == REPOSITORY_ARCHIVE_SELECTOR
+        ):
+            scanned_path = REPOSITORY_CODE_PATH
+        secrets = self._process_scanner_output(
+            cmd_output, scanned_path, message_path=message.data.get("path")
+        )
+
+        self._report_vulnz(
+            secrets,
+            message,
+            combined_content,
+            use_finding_path=scanned_path is not None,
+            control_message=control_message,
+        )
 
-        self._report_vulnz(secrets, message, combined_content)
+
+def _asset_key(vuln_location: vuln_mixin.VulnerabilityLocation | None) -> str:
+    """Canonical representation of the asset of a vulnerability location, used to query the result store."""
+    if vuln_location is None:
+        return ""
+    return json.dumps(
+        {
+            key: value
+            for key, value in vuln_location.to_dict().items()
+            if key != "metadata"
+        },
+        sort_keys=True,
+    )
 
 
 def _compute_dna(
     vuln_title: str,
     vuln_location: vuln_mixin.VulnerabilityLocation | None,
     secret_token: str,
+    readable: bool = False,
 ) -> str:
-    """Compute a deterministic, debuggable DNA representation for a vulnerability.
+    """Compute a deterministic DNA for a vulnerability.
+
+    The DNA is the SHA-256 digest of a canonical JSON representation of the vulnerability, which keeps it compact and
+    avoids embedding the raw secret. The canonical form itself can be returned for debugging. Large metadata values,
+    like the content of logs, are hashed separately and only their digest is serialized, escaping them to JSON costs
+    more than hashing them.
+
     Args:
         vuln_title: The title of the vulnerability.
         vuln_location: The location of the vulnerability.
         secret_token: The founded secret.
+        readable: Return the canonical JSON representation instead of its digest.
     Returns:
-        A deterministic JSON representation of the vulnerability DNA.
+        The hex digest of the vulnerability DNA, or its canonical JSON representation if `readable` is set.
     """
     dna_data: dict[str, Any] = {"title": vuln_title}
 
     if vuln_location is not None:
-        location_dict: dict[str, Any] = vuln_location.to_dict()
-        sorted_location_dict = _sort_dict(location_dict)
-        dna_data["location"] = sorted_location_dict
+        location = vuln_location.to_dict()
+        for metadata in location.get("metadata", []):
+            value = metadata.get("value")
+            if isinstance(value, str) and len(value) > DNA_MAX_METADATA_VALUE_LENGTH:
+                metadata["value"] = (
+                    "sha256:" + hashlib.sha256(value.encode()).hexdigest()
+                )
+        dna_data["location"] = location
 
     if secret_token is not None:
         dna_data["secret_token"] = secret_token
 
-    return json.dumps(dna_data, sort_keys=True)
+    canonical_dna = _canonical_json(dna_data)
+    if readable is True:
+        return canonical_dna
+    return hashlib.sha256(canonical_dna.encode()).hexdigest()
 
 
-def _sort_dict(dictionary: dict[str, Any] | list[Any]) -> dict[str, Any] | list[Any]:
-    """Recursively sort dictionary keys and lists within.
+def _canonical_json(value: Any) -> str:
+    """Serialize a value to JSON with sorted dictionary keys and sorted lists.
+
+    Every list element is serialized exactly once, the serialized form is used both as the sort key and as the output,
+    so nested structures are never dumped twice.
+
     Args:
-        dictionary: The dictionary to sort.
+        value: The value to serialize.
     Returns:
-        A sorted dictionary or list.
+        The canonical JSON representation of the value.
     """
-    if isinstance(dictionary, dict):
-        return {k: _sort_dict(v) for k, v in sorted(dictionary.items())}
-    if isinstance(dictionary, list):
-        return sorted(
-            dictionary,
-            key=lambda x: (
-                json.dumps(x, sort_keys=True) if isinstance(x, dict) else str(x)
-            ),
+    if isinstance(value, dict):
+        items = (
+            f"{json.dumps(key)}: {_canonical_json(item)}"
+            for key, item in sorted(value.items())
         )
-    return dictionary
+        return "{" + ", ".join(items) + "}"
+    if isinstance(value, list):
+        elements = [
+            (
+                serialized if isinstance(element, dict) else str(element),
+                serialized,
+            )
+            for element in value
+            for serialized in (json.dumps(element, sort_keys=True),)
+        ]
+        elements.sort(key=lambda element: element[0])
+        return "[" + ", ".join(serialized for _, serialized in elements) + "]"
+    return json.dumps(value)
 
 
 if __name__ == "__main__":
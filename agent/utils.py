@@ -1,14 +1,20 @@
 """Helper functions for the Trufflehog agent"""
 
+import collections
 import json
 import logging
+import math
 import re
+from collections.abc import Iterable, Iterator
 from typing import Any
 
-import magic
+from agent import finding
+from agent import metrics
 
 logger = logging.getLogger(__name__)
 
+JSON_DECODER = json.JSONDecoder()
+
 
 def should_exclude_path(
     path: str | None, exclude_path_regexes: list[str] | None
@@ -51,38 +57,94 @@ IRRELEVANT_FILE_PATHS = [
 ]
 
 
-def load_newline_json(byte_data: bytes) -> list[dict[str, Any]]:
-    """Convertes bytes to a list of dictionaries.
+def is_irrelevant_path(path: str) -> bool:
+    """Report whether the path belongs to resources that never hold secrets, like drawables and layouts.
 
     Args:
-        result: the message to be parsed into a list of dictionaries.
+        path: The file path.
 
     Returns:
-        A list of dictionaries.
+        True if the path contains one of the irrelevant path fragments.
+    """
+    return any(irrelevant_path in path for irrelevant_path in IRRELEVANT_FILE_PATHS)
+
+
+def iter_newline_json(byte_data: bytes) -> Iterator[dict[str, Any]]:
+    """Iterate over the JSON objects of a newline delimited JSON buffer.
+
+    Lines are decoded one at a time, the buffer is never decoded or split as a whole. Lines that are not valid UTF-8 are decoded with
+    replacement characters, malformed or partial lines are skipped and counted instead of failing the whole output.
+
+    Args:
+        byte_data: The newline delimited JSON output.
+
+    Yields:
+        The decoded JSON objects.
+    """
+    start = 0
+    while start < len(byte_data):
+        end = byte_data.find(b"\n", start)
+        if end == -1:
+            end = len(byte_data)
+        line = byte_data[start:end]
+        start = end + 1
+        if line == b"" or line.isspace() is True:
+            continue
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError:
+            metrics.COUNTERS.increment("scanner_output.invalid_utf8_lines")
+            text = line.decode("utf-8", errors="replace")
+        try:
+            element = JSON_DECODER.decode(text)
+        except json.JSONDecodeError:
+            element = None
+        if isinstance(element, dict) is False:
+            metrics.COUNTERS.increment("scanner_output.malformed_lines")
+            logger.debug("Skipping malformed scanner output line: %r", line[:100])
+            continue
+        yield element
+
+
+def iter_findings(
+    byte_data: bytes, base_path: str | None = None
+) -> Iterator[finding.Finding]:
+    """Iterate over the trufflehog findings of a newline delimited JSON buffer, projected on the used fields.
+
+    Args:
+        byte_data: The newline delimited JSON scanner output.
+        base_path: The scanned directory the finding paths are made relative to.
     """
-    string = byte_data.decode("utf-8")
-    data_list = string.split("\n")
-    return list(json.loads(element) for element in data_list if element != "")
+    for element in iter_newline_json(byte_data):
+        yield finding.Finding.from_dict(element, base_path)
 
 
-def prune_reports(
-    reports: list[dict[str, Any]],
-) -> list[dict[str, Any]]:
-    """Prune the list of dictionaries from duplicates.
+def prune_findings(findings: Iterable[finding.Finding]) -> list[finding.Finding]:
+    """Prune duplicated secrets from the findings, keeping the first finding of every secret.
 
     Args:
-        reports: list of secrets found by trufflehog.
+        findings: The findings of a scan.
 
     Returns:
-        A list of unique secret dictionaries.
+        The unique findings.
     """
-    dedup_set = set()
-    unique_reports = []
-    for secret in reports:
-        if secret.get("Raw", "") not in dedup_set:
-            unique_reports.append(secret)
-        dedup_set.add(secret["Raw"])
-    return unique_reports
+    seen_keys = set()
+    unique_findings = []
+    for secret in findings:
+        if secret.dedup_key not in seen_keys:
+            unique_findings.append(secret)
+            seen_keys.add(secret.dedup_key)
+    return unique_findings
+
+
+def shannon_entropy(text: str) -> float:
+    """Shannon entropy of the characters of the text, in bits per character."""
+    if text == "":
+        return 0.0
+    counts = collections.Counter(text)
+    return -sum(
+        count / len(text) * math.log2(count / len(text)) for count in counts.values()
+    )
 
 
 def escape_backtick(text: str) -> str:
@@ -104,10 +166,13 @@ def get_file_type(filename: str, file_content: bytes) -> str:
     Returns:
         File type as a string.
     """
+    if is_irrelevant_path(filename) is True:
+        return "irrelevant"
+    # Imported on first use, the libmagic bindings are only needed by file messages.
+    import magic
+
     magic_type = magic.from_buffer(file_content)
     magic_mime_type = magic.from_buffer(file_content, mime=True)
-    if any(irrelevant_path in filename for irrelevant_path in IRRELEVANT_FILE_PATHS):
-        return "irrelevant"
     if (
         magic_type == "Android binary XML"
         and filename.endswith("AndroidManifest.xml") is True
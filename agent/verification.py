@@ -0,0 +1,326 @@
+"""Cache of the secret verification outcomes, shared across scans."""
+
+import dataclasses
+import hashlib
+import hmac
+import json
+import logging
+import pathlib
+import sqlite3
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from typing import Protocol
+
+from ostorlab.agent.mixins import agent_persist_mixin
+
+from agent import finding
+from agent import metrics
+from agent import scanner
+from agent import utils
+
+logger = logging.getLogger(__name__)
+
+VERIFICATION_CACHE_KEY = "trufflehog_verification_cache"
+DEFAULT_VERIFIED_TTL = 24 * 3600
+DEFAULT_UNVERIFIED_TTL = 3600
+DEFAULT_SQLITE_PATH = "/tmp/trufflehog_verification_cache.db"
+DEFAULT_SALT = "trufflehog-verification-cache"
+
+VerificationKey = tuple[str | None, str]
+
+
+@dataclasses.dataclass(frozen=True)
+class CachedOutcome:
+    """Verification outcome of a secret and the time it expires at."""
+
+    verified: bool
+    expires_at: float
+
+
+class CacheBackend(Protocol):
+    """Storage of the cached outcomes by cache key."""
+
+    def get(self, key: str) -> CachedOutcome | None: ...
+
+    def set(self, key: str, outcome: CachedOutcome) -> None: ...
+
+
+class Verifier(Protocol):
+    """Verifies secrets against their provider."""
+
+    def verify(
+        self, findings: list[finding.Finding]
+    ) -> dict[VerificationKey, bool] | None:
+        """Verify the findings.
+
+        Returns:
+            The outcome of the secrets by detector and raw secret, missing secrets are not verified. None if the
+            verification failed.
+        """
+        ...
+
+
+class PersistBackend:
+    """Outcomes stored in a hash of the agent persistence, shared by all the agents using the same Redis."""
+
+    def __init__(self, persist: agent_persist_mixin.AgentPersistMixin) -> None:
+        self._persist = persist
+
+    def get(self, key: str) -> CachedOutcome | None:
+        value = self._persist.hash_get(VERIFICATION_CACHE_KEY, key)
+        if value is None:
+            return None
+        return CachedOutcome(**json.loads(value))
+
+    def set(self, key: str, outcome: CachedOutcome) -> None:
+        self._persist.hash_add(
+            VERIFICATION_CACHE_KEY, {key: json.dumps(dataclasses.asdict(outcome))}
+        )
+
+
+class SqliteBackend:
+    """Outcomes stored in a local SQLite database."""
+
+    def __init__(self, path: str | pathlib.Path) -> None:
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS verification_cache "
+            "(key TEXT PRIMARY KEY, verified INTEGER NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str) -> CachedOutcome | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT verified, expires_at FROM verification_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        return CachedOutcome(verified=row[0] == 1, expires_at=row[1])
+
+    def set(self, key: str, outcome: CachedOutcome) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO verification_cache (key, verified, expires_at) VALUES (?, ?, ?)",
+                (key, int(outcome.verified), outcome.expires_at),
+            )
+
+
+def _verification_settings(
+    settings: scanner.ScannerSettings, findings: list[finding.Finding]
+) -> scanner.ScannerSettings:
+    """Settings of a scan verifying the findings, restricted to their detectors."""
+    detectors = tuple(
+        sorted({secret.detector_name for secret in findings if secret.detector_name})
+    )
+    return dataclasses.replace(
+        settings,
+        verify=True,
+        only_verified=False,
+        include_detectors=detectors,
+        exclude_detectors=(),
+    )
+
+
+def _outcomes(output: bytes | None) -> dict[VerificationKey, bool] | None:
+    """Verification outcomes of the secrets found by a verifying scan."""
+    if output is None:
+        return None
+    return {
+        (secret.detector_name, secret.raw): secret.verified
+        for secret in utils.iter_findings(output)
+        if secret.raw is not None
+    }
+
+
+class ScannerVerifier:
+    """Verifies secrets by running trufflehog with verification on a file holding only the secrets to verify."""
+
+    def __init__(self, settings: scanner.ScannerSettings) -> None:
+        self._settings = settings
+
+    def verify(
+        self, findings: list[finding.Finding]
+    ) -> dict[VerificationKey, bool] | None:
+        settings = _verification_settings(self._settings, findings)
+        with tempfile.NamedTemporaryFile() as secrets_file:
+            for secret in findings:
+                secrets_file.write(
+                    (secret.raw_v2 or secret.raw or "").encode("utf-8") + b"\n"
+                )
+            secrets_file.flush()
+            output = scanner.run(
+                [
+                    "trufflehog",
+                    "filesystem",
+                    secrets_file.name,
+                    "--json",
+                    *settings.flags(),
+                ],
+                settings=settings,
+                timeout=settings.timeout_for("filesystem"),
+            )
+        return _outcomes(output)
+
+
+class RescanVerifier:
+    """Verifies secrets by scanning their original target again with trufflehog's own verification.
+
+    Slower than verifying the bare secrets, it is the fallback for the secrets detectors only match with their
+    context, like an AWS key id next to its secret key.
+    """
+
+    def __init__(
+        self,
+        settings: scanner.ScannerSettings,
+        rescan: Callable[[scanner.ScannerSettings], bytes | None],
+    ) -> None:
+        self._settings = settings
+        self._rescan = rescan
+
+    def verify(
+        self, findings: list[finding.Finding]
+    ) -> dict[VerificationKey, bool] | None:
+        return _outcomes(self._rescan(_verification_settings(self._settings, findings)))
+
+
+def verify_findings(
+    findings: list[finding.Finding],
+    verifier: Verifier,
+    fallback: Verifier | None = None,
+) -> list[finding.Finding] | None:
+    """Verify the findings and set their verification status.
+
+    The verifier scans the bare secrets, without the context some detectors need to match or verify them. The secrets
+    it does not confirm as verified are verified by the fallback, when given. A secret no verifier detects again is
+    left unresolved and keeps the status of the scan, a detector miss is not a failed verification.
+
+    Args:
+        findings: The findings to verify, updated in place.
+        verifier: Verifier of the secrets.
+        fallback: Verifier of the secrets the verifier does not confirm.
+
+    Returns:
+        The resolved findings, None if the verification failed.
+    """
+    outcomes = verifier.verify(findings)
+    if outcomes is None:
+        logger.error("Could not verify %d secrets.", len(findings))
+        return None
+    unconfirmed_findings = [
+        secret
+        for secret in findings
+        if outcomes.get((secret.detector_name, secret.raw or "")) is not True
+    ]
+    if fallback is not None and len(unconfirmed_findings) > 0:
+        fallback_outcomes = fallback.verify(unconfirmed_findings)
+        if fallback_outcomes is None:
+            logger.error(
+                "Could not verify %d secrets in their target.",
+                len(unconfirmed_findings),
+            )
+        else:
+            outcomes = {**outcomes, **fallback_outcomes}
+    resolved_findings = []
+    for secret in findings:
+        outcome = outcomes.get((secret.detector_name, secret.raw or ""))
+        if outcome is None:
+            metrics.COUNTERS.increment("verification.unresolved")
+            continue
+        secret.verified = outcome
+        resolved_findings.append(secret)
+    return resolved_findings
+
+
+def hash_secret(salt: str, secret: str) -> str:
+    """HMAC of a secret keyed by the salt, stored in place of the secret."""
+    return hmac.new(salt.encode(), secret.encode(), hashlib.sha256).hexdigest()
+
+
+class VerificationCache:
+    """Verification outcomes by detector and salted hash of the raw secret, with a TTL per outcome.
+
+    Secrets are never stored, cache keys are HMACs of the detector and the raw secret keyed by a salt.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        salt: str,
+        verified_ttl: float = DEFAULT_VERIFIED_TTL,
+        unverified_ttl: float = DEFAULT_UNVERIFIED_TTL,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._backend = backend
+        self._salt = salt
+        self._verified_ttl = verified_ttl
+        self._unverified_ttl = unverified_ttl
+        self._clock = clock
+
+    def key(self, detector: str | None, raw: str) -> str:
+        """Cache key of a secret."""
+        return hash_secret(self._salt, f"{detector or ''}\0{raw}")
+
+    def get(self, detector: str | None, raw: str) -> bool | None:
+        """Cached outcome of a secret, None if it is not cached or expired."""
+        outcome = self._backend.get(self.key(detector, raw))
+        if outcome is None or outcome.expires_at <= self._clock():
+            return None
+        return outcome.verified
+
+    def set(self, detector: str | None, raw: str, verified: bool) -> None:
+        """Cache the outcome of a secret."""
+        ttl = self._verified_ttl if verified is True else self._unverified_ttl
+        self._backend.set(
+            self.key(detector, raw),
+            CachedOutcome(verified=verified, expires_at=self._clock() + ttl),
+        )
+
+    def apply(self, findings: list[finding.Finding]) -> None:
+        """Set the verification status of the cached findings, the others keep their status.
+
+        Args:
+            findings: Findings of a scan run without verification, updated in place.
+        """
+        for secret in findings:
+            if secret.raw is None:
+                continue
+            cached_outcome = self.get(secret.detector_name, secret.raw)
+            if cached_outcome is not None:
+                secret.verified = cached_outcome
+
+    def resolve(
+        self,
+        findings: list[finding.Finding],
+        verifier: Verifier,
+        fallback: Verifier | None = None,
+    ) -> None:
+        """Set the verification status of the findings from the cache, verifying only the secrets it misses.
+
+        Secrets no verifier detects again are left unresolved and are not cached.
+
+        Args:
+            findings: Findings of a scan run without verification, updated in place.
+            verifier: Verifier of the secrets missing from the cache.
+            fallback: Verifier of the secrets the verifier does not confirm, see `verify_findings`.
+        """
+        uncached_findings = []
+        for secret in findings:
+            if secret.raw is None:
+                continue
+            cached_outcome = self.get(secret.detector_name, secret.raw)
+            if cached_outcome is None:
+                uncached_findings.append(secret)
+                continue
+            metrics.COUNTERS.increment("verification_cache.hits")
+            secret.verified = cached_outcome
+        if len(uncached_findings) == 0:
+            return
+        metrics.COUNTERS.increment("verification_cache.misses", len(uncached_findings))
+        resolved_findings = verify_findings(uncached_findings, verifier, fallback)
+        for secret in resolved_findings or []:
+            self.set(secret.detector_name, secret.raw or "", secret.verified)
@@ -0,0 +1,104 @@
+"""Unittest for the mobile application archives expansion."""
+
+import io
+import pathlib
+import zipfile
+
+import pytest
+
+from agent import archives
+
+
+def _zip(entries: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in entries.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def testIterEntries_whenArchiveHasIrrelevantPaths_skipThem() -> None:
+    content = _zip(
+        {
+            "assets/config.json": b'{"key": "value"}',
+            "res/drawable/icon.xml": b"<xml/>",
+        }
+    )
+
+    entries = list(archives.iter_entries(content))
+
+    assert entries == [("assets/config.json", b'{"key": "value"}')]
+
+
+def testIterEntries_whenArchiveHasNestedApk_expandIt() -> None:
+    nested_apk = _zip({"assets/config.json": b"nested"})
+    content = _zip({"base.apk": nested_apk, "manifest.json": b"{}"})
+
+    entries = list(archives.iter_entries(content))
+
+    assert entries == [
+        ("base.apk!/assets/config.json", b"nested"),
+        ("manifest.json", b"{}"),
+    ]
+
+
+def testIterEntries_whenContentIsNotAZip_yieldNothing() -> None:
+    assert list(archives.iter_entries(b"not a zip")) == []
+
+
+def testSafeRelativePath_whenEntryEscapesDirectory_stripParentReferences() -> None:
+    assert archives.safe_relative_path("../../etc/passwd") == pathlib.Path("etc/passwd")
+    assert archives.safe_relative_path("/abs/file.txt") == pathlib.Path("abs/file.txt")
+
+
+def testIterEntries_whenEntryIsTooLarge_skipIt(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    nested_apk = _zip({"assets/config.json": b"nested"})
+    content = _zip({"base.apk": nested_apk, "assets/large.bin": b"x" * 1024})
+
+    entries = list(archives.iter_entries(content, max_entry_size=len(nested_apk)))
+
+    assert entries == [("base.apk!/assets/config.json", b"nested")]
+    assert "Skipping archive entry assets/large.bin of 1024 bytes" in caplog.text
+
+
+def testIterEntries_whenNestedArchiveIsTooLarge_skipIt(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    nested_apk = _zip({"assets/config.json": b"nested" * 64})
+    content = _zip({"base.apk": nested_apk, "assets/keys.json": b"keys"})
+
+    entries = list(archives.iter_entries(content, max_entry_size=len(nested_apk) - 1))
+
+    assert entries == [("assets/keys.json", b"keys")]
+    assert "Skipping archive entry base.apk of" in caplog.text
+
+
+def testIterEntries_whenEntryIsCorrupted_skipItAndReadTheOthers(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    content = bytearray(
+        _zip({"assets/broken.json": b"broken", "assets/keys.json": b"keys"})
+    )
+    broken_offset = content.index(b"broken")
+    content[broken_offset : broken_offset + 6] = b"BROKEN"
+
+    entries = list(archives.iter_entries(bytes(content)))
+
+    assert entries == [("assets/keys.json", b"keys")]
+    assert "Skipping unreadable archive entry assets/broken.json" in caplog.text
+
+
+def testIterEntries_whenEntryPathIsExcluded_skipIt() -> None:
+    nested_apk = _zip({"assets/config.json": b"nested", "assets/keys.json": b"keys"})
+    content = _zip({"base.apk": nested_apk, "assets/keys.json": b"keys"})
+
+    entries = list(
+        archives.iter_entries(content, exclude_path_regexes=[r"^base\.apk!/.*config"])
+    )
+
+    assert entries == [
+        ("base.apk!/assets/keys.json", b"keys"),
+        ("assets/keys.json", b"keys"),
+    ]
@@ -0,0 +1,67 @@
+"""Unittest for the persisted job checkpoints."""
+
+import fakeredis
+from ostorlab.agent.message import message
+
+from agent import checkpoints
+
+
+def testJobCheckpoints_whenJobIsNotReleased_returnItAsPending(
+    redis_client_mock: fakeredis.FakeRedis,
+    repository_asset_message: message.Message,
+) -> None:
+    job_checkpoints = checkpoints.JobCheckpoints(redis_client_mock)
+    completed_job_id = job_checkpoints.save(repository_asset_message)
+    pending_job_id = job_checkpoints.save(repository_asset_message)
+    job_checkpoints.release(completed_job_id)
+
+    pending = job_checkpoints.pending()
+
+    assert len(pending) == 1
+    assert pending[0][0] == pending_job_id
+    assert pending[0][1].selector == repository_asset_message.selector
+    assert pending[0][1].data == repository_asset_message.data
+
+
+def testJobCheckpoints_whenReleasedTwice_onlyFirstReleaseSucceeds(
+    redis_client_mock: fakeredis.FakeRedis,
+    repository_asset_message: message.Message,
+) -> None:
+    job_checkpoints = checkpoints.JobCheckpoints(redis_client_mock)
+    job_id = job_checkpoints.save(repository_asset_message)
+
+    assert job_checkpoints.release(job_id) is True
+    assert job_checkpoints.release(job_id) is False
+    assert job_checkpoints.pending() == []
+
+
+def testJobCheckpoints_whenReleased_deleteCheckpoint(
+    redis_client_mock: fakeredis.FakeRedis,
+    repository_asset_message: message.Message,
+) -> None:
+    job_checkpoints = checkpoints.JobCheckpoints(redis_client_mock)
+    job_id = job_checkpoints.save(repository_asset_message)
+
+    job_checkpoints.release(job_id)
+
+    assert redis_client_mock.exists(checkpoints.CHECKPOINTS_KEY) == 0
+
+
+def testJobCheckpoints_whenScanIsDone_expireCheckpoints(
+    redis_client_mock: fakeredis.FakeRedis,
+    repository_asset_message: message.Message,
+) -> None:
+    job_checkpoints = checkpoints.JobCheckpoints(redis_client_mock)
+    job_checkpoints.save(repository_asset_message)
+    assert (
+        redis_client_mock.ttl(checkpoints.CHECKPOINTS_KEY)
+        > checkpoints.SCAN_DONE_CHECKPOINTS_TTL
+    )
+
+    job_checkpoints.expire()
+
+    assert (
+        0
+        < redis_client_mock.ttl(checkpoints.CHECKPOINTS_KEY)
+        <= checkpoints.SCAN_DONE_CHECKPOINTS_TTL
+    )
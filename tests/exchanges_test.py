@@ -0,0 +1,134 @@
+"""Unittest for the extraction of scannable request/response content."""
+
+import hashlib
+
+import pytest
+
+from agent import exchanges
+
+
+@pytest.mark.parametrize(
+    "content_type, expected",
+    [
+        (None, True),
+        ("text/html; charset=utf-8", True),
+        ("application/json", True),
+        ("application/vnd.api+json", True),
+        ("application/javascript", True),
+        ("image/png", False),
+        ("application/octet-stream", False),
+        ("font/woff2", False),
+    ],
+)
+def testIsTextContentType_always_matchTextTypes(
+    content_type: str | None, expected: bool
+) -> None:
+    assert exchanges.is_text_content_type(content_type) is expected
+
+
+def testScannableContent_always_includeHeadersAndBodies() -> None:
+    content, _ = exchanges.scannable_content(
+        request={
+            "headers": [{"name": "Authorization", "value": "Bearer token"}],
+            "body": b"user=admin",
+        },
+        response={"body": b'{"key": "value"}'},
+        is_seen_part=lambda digest: False,
+    )
+
+    assert content == b'Authorization: Bearer token\nuser=admin\n{"key": "value"}'
+
+
+def testScannableContent_whenPartsWereSeen_dropThem() -> None:
+    seen: set[str] = set()
+
+    _, part_digests = exchanges.scannable_content(
+        request={"body": b"first"},
+        response={"body": b"app.js"},
+        is_seen_part=seen.__contains__,
+    )
+    seen.update(part_digests)
+    content, part_digests = exchanges.scannable_content(
+        request={"body": b"second"},
+        response={"body": b"app.js"},
+        is_seen_part=seen.__contains__,
+    )
+
+    assert content == b"second"
+    assert part_digests == [hashlib.sha256(b"second").hexdigest()]
+
+
+def testScannableContent_whenBodyIsBinaryOrTooLarge_dropIt() -> None:
+    content, _ = exchanges.scannable_content(
+        request={"body": b"x" * 11},
+        response={
+            "headers": [{"name": "Content-Type", "value": "image/png"}],
+            "body": b"\x89PNG",
+        },
+        is_seen_part=lambda digest: False,
+        max_body_size=10,
+    )
+
+    assert content == b"Content-Type: image/png"
+
+
+@pytest.mark.parametrize(
+    "request_data, expected_key",
+    [
+        (
+            {"url": "https://Host/api/users/42?page=1"},
+            "GET https://host/api/users/{id}",
+        ),
+        (
+            {
+                "method": "post",
+                "url": "https://host/items/3f2b6c1e-8a9d-4c3e-9f1a-2b3c4d5e6f70/",
+            },
+            "POST https://host/items/{id}",
+        ),
+    ],
+)
+def testEndpointKey_always_normalizeMethodAndPath(
+    request_data: dict[str, str], expected_key: str
+) -> None:
+    assert exchanges.endpoint_key(request_data) == expected_key
+
+
+def testEndpointHistory_whenCaptureIsSimilar_returnChangedRegionsOnly() -> None:
+    history = exchanges.EndpointHistory(similarity_threshold=0.5)
+    lines = [f"line {index}".encode() for index in range(50)]
+    changed_lines = list(lines)
+    changed_lines[25] = b"token=ghp_new"
+
+    first_delta = history.delta("GET https://host/api", b"\n".join(lines))
+    second_delta = history.delta("GET https://host/api", b"\n".join(changed_lines))
+
+    assert first_delta == b"\n".join(lines)
+    assert second_delta == b"line 24\ntoken=ghp_new\nline 26"
+
+
+def testEndpointHistory_whenCaptureIsDissimilar_returnWholeContent() -> None:
+    history = exchanges.EndpointHistory(similarity_threshold=0.5)
+    history.delta("GET https://host/api", b"\n".join(b"a%d" % i for i in range(50)))
+    content = b"\n".join(b"b%d" % i for i in range(50))
+
+    assert history.delta("GET https://host/api", content) == content
+
+
+def testEndpointHistory_whenCaptureIsUnchanged_returnEmptyContent() -> None:
+    history = exchanges.EndpointHistory()
+    content = b"\n".join(b"a%d" % i for i in range(50))
+    history.delta("GET https://host/api", content)
+
+    assert history.delta("GET https://host/api", content) == b""
+
+
+def testEndpointHistory_whenMaxEndpointsIsReached_evictLeastRecentEndpoint() -> None:
+    history = exchanges.EndpointHistory(max_endpoints=2)
+    content = b"\n".join(b"a%d" % i for i in range(50))
+    history.delta("GET https://host/1", content)
+    history.delta("GET https://host/2", content)
+    history.delta("GET https://host/3", content)
+
+    assert len(history) == 2
+    assert history.delta("GET https://host/1", content) == content
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Fake trufflehog executable mimicking the command line and `--json` output of the scanner, for load testing.
+
+The behaviour is configured through environment variables so that it can be changed without touching the agent:
+
+    FAKE_TRUFFLEHOG_LATENCY: Seconds to wait before writing the output.
+    FAKE_TRUFFLEHOG_FINDING_RATE: Probability of a finding in every scanned file, or mean findings per git target.
+    FAKE_TRUFFLEHOG_OUTPUT_SIZE: Bytes of extra data padded into every finding.
+    FAKE_TRUFFLEHOG_CRASH_RATE: Probability of exiting with an error after writing half of the findings.
+    FAKE_TRUFFLEHOG_HANG_RATE: Probability of hanging after writing half of the findings.
+    FAKE_TRUFFLEHOG_SEED: Seed of the random decisions, combined with the scanned targets.
+
+Findings are deterministic for a given seed and content, so that repeated runs report the same secrets.
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+import random
+import sys
+import time
+from collections.abc import Iterator
+from typing import Any
+
+DETECTORS = ("AWS", "Github", "Slack", "URI", "PrivateKey")
+SOURCES = ("filesystem", "git", "gitlab", "github")
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name) or default)
+
+
+def _iter_files(targets: list[str]) -> Iterator[pathlib.Path]:
+    for target in targets:
+        path = pathlib.Path(target)
+        if path.is_file() is True:
+            yield path
+        elif path.is_dir() is True:
+            yield from sorted(
+                child for child in path.rglob("*") if child.is_file() is True
+            )
+
+
+def _finding(
+    detector: str,
+    secret_seed: bytes,
+    verified: bool,
+    source_metadata: dict[str, Any],
+    output_size: int,
+) -> dict[str, Any]:
+    secret = hashlib.sha256(secret_seed).hexdigest()[:32]
+    finding: dict[str, Any] = {
+        "SourceMetadata": {"Data": source_metadata},
+        "SourceName": "trufflehog - fake",
+        "DetectorName": detector,
+        "Verified": verified,
+        "Raw": f"{detector.lower()}_{secret}",
+        "Redacted": f"{detector.lower()}_{secret[:4]}****",
+    }
+    if output_size > 0:
+        finding["ExtraData"] = {"padding": "x" * output_size}
+    return finding
+
+
+def _findings(
+    source: str,
+    targets: list[str],
+    verified: bool,
+    rng: random.Random,
+    finding_rate: float,
+    output_size: int,
+) -> list[dict[str, Any]]:
+    findings = []
+    if source == "filesystem":
+        for path in _iter_files(targets):
+            content = path.read_bytes()
+            file_rng = random.Random(hashlib.sha256(content).digest())
+            if file_rng.random() >= finding_rate:
+                continue
+            findings.append(
+                _finding(
+                    file_rng.choice(DETECTORS),
+                    content,
+                    verified,
+                    {"Filesystem": {"file": str(path), "line": 1}},
+                    output_size,
+                )
+            )
+        return findings
+    for target in targets:
+        for index in range(int(finding_rate) + (rng.random() < finding_rate % 1)):
+            findings.append(
+                _finding(
+                    rng.choice(DETECTORS),
+                    f"{target}:{index}".encode(),
+                    verified,
+                    {"Git": {"repository": target, "file": f"file_{index}", "line": 1}},
+                    output_size,
+                )
+            )
+    return findings
+
+
+def main(argv: list[str]) -> int:
+    if len(argv) == 0 or argv[0] not in SOURCES:
+        sys.stderr.write(
+            f"usage: trufflehog {{{','.join(SOURCES)}}} TARGET... --json\n"
+        )
+        return 2
+    source = argv[0]
+    targets = [arg for arg in argv[1:] if arg.startswith("--") is False]
+    flags = [arg for arg in argv[1:] if arg.startswith("--") is True]
+    if "--json" not in flags:
+        sys.stderr.write("The fake scanner only supports the --json output.\n")
+        return 2
+    rng = random.Random(
+        f"{os.environ.get('FAKE_TRUFFLEHOG_SEED', '0')}:{source}:{targets}"
+    )
+    time.sleep(_env_float("FAKE_TRUFFLEHOG_LATENCY", 0))
+    findings = _findings(
+        source,
+        targets,
+        verified="--no-verification" not in flags,
+        rng=rng,
+        finding_rate=_env_float("FAKE_TRUFFLEHOG_FINDING_RATE", 0.5),
+        output_size=int(_env_float("FAKE_TRUFFLEHOG_OUTPUT_SIZE", 0)),
+    )
+    crashes = rng.random() < _env_float("FAKE_TRUFFLEHOG_CRASH_RATE", 0)
+    hangs = rng.random() < _env_float("FAKE_TRUFFLEHOG_HANG_RATE", 0)
+    if crashes is True or hangs is True:
+        findings = findings[: len(findings) // 2]
+    for finding in findings:
+        sys.stdout.write(json.dumps(finding) + "\n")
+    sys.stdout.flush()
+    if hangs is True:
+        while True:
+            time.sleep(60)
+    if crashes is True:
+        sys.stderr.write("fake scanner crashed\n")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,47 @@
+"""Unittest for the known library fingerprint index."""
+
+import hashlib
+import pathlib
+
+import pytest
+
+from agent import fingerprints
+from agent import metrics
+
+LODASH_CONTENT = b"/*! lodash v4.17.21 */ var a = 1;"
+
+
+def testFromFile_always_loadDigestsAndSkipComments(tmp_path: pathlib.Path) -> None:
+    digest = hashlib.sha256(LODASH_CONTENT).hexdigest()
+    digests_path = tmp_path / "known.sha256"
+    digests_path.write_text(f"# header\n\n{digest.upper()}  lodash 4.17.21\n")
+
+    index = fingerprints.FingerprintIndex.from_file(digests_path)
+
+    assert len(index) == 1
+    assert index.is_known(LODASH_CONTENT) is True
+    assert index.is_known(b"var secret = 1;") is False
+
+
+def testFromFile_whenDigestIsInvalid_raiseValueError(tmp_path: pathlib.Path) -> None:
+    digests_path = tmp_path / "known.sha256"
+    digests_path.write_text("not-a-digest lodash\n")
+
+    with pytest.raises(ValueError):
+        fingerprints.FingerprintIndex.from_file(digests_path)
+
+
+def testFromFile_whenShippedFile_loadWithoutError() -> None:
+    fingerprints.FingerprintIndex.from_file(fingerprints.KNOWN_LIBRARIES_PATH)
+
+
+def testShouldSkip_whenContentIsKnownLibrary_countSkippedBytes() -> None:
+    metrics.COUNTERS.reset()
+    index = fingerprints.FingerprintIndex()
+    index.add_content(LODASH_CONTENT)
+
+    assert index.should_skip("js", LODASH_CONTENT) is True
+    assert index.should_skip("json", LODASH_CONTENT) is False
+    assert index.should_skip("js", b"var secret = 1;") is False
+    assert metrics.COUNTERS.get("fingerprints.skipped_files") == 1
+    assert metrics.COUNTERS.get("fingerprints.skipped_bytes") == len(LODASH_CONTENT)
@@ -0,0 +1,149 @@
+"""Unittest for the bounded and parallel scans of git links, run against local repositories."""
+
+import pathlib
+import threading
+
+import pytest
+from pytest_mock import plugin
+
+from agent import git_history
+
+
+def testHistoryBounds_whenOnlyRemoteBoundsAreSet_scanTheLinkDirectly() -> None:
+    bounds = git_history.HistoryBounds.from_args(
+        {"git_max_depth": 100, "git_branches": ["develop"]}
+    )
+
+    assert bounds.requires_clone("git") is False
+    assert bounds.requires_clone("gitlab") is True
+    assert bounds.flags() == ["--max-depth=100", "--branch=develop"]
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        {"git_since_date": "2024-01-01"},
+        {"git_branches": ["main", "develop"]},
+        {"git_parallel_branches": 4},
+    ],
+)
+def testHistoryBounds_whenBoundsNeedTheHistory_requireClone(
+    args: dict[str, object],
+) -> None:
+    assert git_history.HistoryBounds.from_args(args).requires_clone("git") is True
+
+
+def testHistoryBounds_byDefault_keepTheFullHistoryScan() -> None:
+    bounds = git_history.HistoryBounds.from_args({})
+
+    assert bounds.requires_clone("git") is False
+    assert bounds.flags() == []
+
+
+@pytest.mark.parametrize(
+    "args",
+    [{"git_since_date": "last week"}, {"git_max_depth": -1}, {"git_branches": [""]}],
+)
+def testHistoryBounds_whenArgumentIsInvalid_raiseValueError(
+    args: dict[str, object],
+) -> None:
+    with pytest.raises(ValueError):
+        git_history.HistoryBounds.from_args(args)
+
+
+def testListBranches_always_returnLocalBranches(
+    git_repository: pathlib.Path, tmp_path: pathlib.Path
+) -> None:
+    git_history.clone(str(git_repository), str(tmp_path / "clone"))
+
+    assert sorted(git_history.list_branches(str(tmp_path / "clone"))) == [
+        "feature",
+        "main",
+    ]
+
+
+def testLastCommitBefore_always_returnNewestOlderCommit(
+    git_repository: pathlib.Path,
+) -> None:
+    commit = git_history.last_commit_before(str(git_repository), "main", "2023-03-01")
+
+    assert commit is not None
+    assert (
+        commit
+        == git_history._git(
+            ["-C", str(git_repository), "rev-list", "--grep=2023-01-01", "main"]
+        ).strip()
+    )
+    assert (
+        git_history.last_commit_before(str(git_repository), "main", "2022-01-01")
+        is None
+    )
+
+
+def testScan_always_scanEveryBranchOfASingleCloneInParallel(
+    git_repository: pathlib.Path,
+) -> None:
+    scans: list[tuple[str, list[str]]] = []
+    both_branches_running = threading.Barrier(2, timeout=5)
+
+    def _run_scanner(target: str, flags: list[str]) -> bytes:
+        scans.append((target, flags))
+        both_branches_running.wait()
+        return b'{"Raw":"shared"}\n'
+
+    output = git_history.scan(
+        str(git_repository),
+        git_history.HistoryBounds(max_depth=10, parallel_branches=2),
+        _run_scanner,
+    )
+
+    assert output == b'{"Raw":"shared"}\n{"Raw":"shared"}\n'
+    assert len({target for target, _ in scans}) == 1
+    assert scans[0][0].startswith("file://") is True
+    assert sorted(flags for _, flags in scans) == [
+        ["--branch=feature", "--max-depth=10"],
+        ["--branch=main", "--max-depth=10"],
+    ]
+
+
+def testScan_whenSinceDateIsSet_scanFromLastCommitBeforeTheDate(
+    git_repository: pathlib.Path,
+) -> None:
+    scans: list[list[str]] = []
+
+    def _run_scanner(target: str, flags: list[str]) -> bytes:
+        scans.append(flags)
+        return b""
+
+    git_history.scan(
+        str(git_repository),
+        git_history.HistoryBounds(since_date="2024-01-01", branches=("main",)),
+        _run_scanner,
+    )
+
+    assert len(scans) == 1
+    assert scans[0][0] == "--branch=main"
+    assert scans[0][1].startswith("--since-commit=") is True
+
+
+def testScan_whenRepositoryCannotBeCloned_returnNone(tmp_path: pathlib.Path) -> None:
+    output = git_history.scan(
+        str(tmp_path / "missing"),
+        git_history.HistoryBounds(parallel_branches=2),
+        lambda target, flags: b"",
+    )
+
+    assert output is None
+
+
+def testClone_always_passUrlAfterOptionsEndAndTimeout(
+    mocker: plugin.MockerFixture,
+) -> None:
+    git_mock = mocker.patch("agent.git_history._git", return_value="")
+
+    git_history.clone("-uhttps://host/repo.git", "/tmp/clone", timeout=42)
+
+    git_mock.assert_called_once_with(
+        ["clone", "--bare", "--quiet", "--", "-uhttps://host/repo.git", "/tmp/clone"],
+        timeout=42,
+    )
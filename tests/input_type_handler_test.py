@@ -15,6 +15,8 @@ from agent import input_type_handler
         ("https://github.com/Ostorlab/agent_trufflehog.git", "git"),
         ("https://gitlab.com/open-source-projects-lambda/cpython_mirror.git", "gitlab"),
         ("https://www.example.edu/ball/box.html", None),
+        ("--upload-pack=touch /tmp/pwned;https://github.com/user/repo.git", None),
+        ("file:///tmp/https://github.com/user/repo.git", None),
     ],
 )
 def testProcessLink_alwyas_returnsCorrectType(
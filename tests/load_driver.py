@@ -0,0 +1,285 @@
+"""Load driver feeding the agent with generated messages of every input selector, run against the fake scanner.
+
+Run it from the repository root against a Redis server, the fake scanner is configured by its environment variables:
+
+    FAKE_TRUFFLEHOG_FINDING_RATE=0.5 python -m tests.load_driver --messages 100 --arg report_batch_size=10
+"""
+
+import argparse
+import dataclasses
+import json
+import math
+import os
+import pathlib
+import random
+import stat
+import sys
+import tempfile
+import time
+from typing import Any
+
+from ostorlab.agent import definitions as agent_definitions
+from ostorlab.agent.message import message
+from ostorlab.agent.message import serializer
+from ostorlab.runtimes import definitions as runtime_definitions
+from ostorlab.utils import definitions as utils_definitions
+
+from agent import trufflehog_agent
+
+FAKE_TRUFFLEHOG_PATH = pathlib.Path(__file__).parent / "fake_trufflehog.py"
+AGENT_DEFINITION_PATH = pathlib.Path(__file__).parent.parent / "ostorlab.yaml"
+DEFAULT_REDIS_URL = "redis://localhost:6379"
+REPOSITORY_FILES = 5
+
+
+@dataclasses.dataclass
+class LoadReport:
+    """Throughput and latency of the processed messages."""
+
+    duration: float
+    latencies: dict[str, list[float]]
+
+    @property
+    def message_count(self) -> int:
+        return sum(len(latencies) for latencies in self.latencies.values())
+
+    @property
+    def throughput(self) -> float:
+        """Processed messages per second."""
+        return self.message_count / self.duration if self.duration > 0 else 0.0
+
+    def percentile(self, percentile: float, selector: str | None = None) -> float:
+        """Latency in seconds under which the given percentage of the messages were processed."""
+        if selector is None:
+            latencies = sorted(
+                latency
+                for selector_latencies in self.latencies.values()
+                for latency in selector_latencies
+            )
+        else:
+            latencies = sorted(self.latencies.get(selector, []))
+        if len(latencies) == 0:
+            return 0.0
+        return latencies[max(math.ceil(percentile / 100 * len(latencies)) - 1, 0)]
+
+    def summary(self) -> str:
+        """Human readable summary, one line per selector."""
+        lines = [
+            (
+                f"{self.message_count} messages in {self.duration:.2f}s, "
+                f"{self.throughput:.1f} messages/s, p50 {self.percentile(50) * 1000:.1f}ms, "
+                f"p99 {self.percentile(99) * 1000:.1f}ms"
+            )
+        ]
+        for selector, latencies in sorted(self.latencies.items()):
+            lines.append(
+                f"  {selector}: {len(latencies)} messages, "
+                f"p50 {self.percentile(50, selector) * 1000:.1f}ms, "
+                f"p99 {self.percentile(99, selector) * 1000:.1f}ms, "
+                f"max {max(latencies) * 1000:.1f}ms"
+            )
+        return "\n".join(lines)
+
+
+def install_fake_scanner(directory: pathlib.Path) -> str:
+    """Install the fake scanner as a `trufflehog` executable in the directory.
+
+    Returns:
+        The PATH value putting the fake scanner ahead of any real one.
+    """
+    executable = directory / "trufflehog"
+    executable.write_text(
+        f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_TRUFFLEHOG_PATH}" "$@"\n'
+    )
+    executable.chmod(executable.stat().st_mode | stat.S_IXUSR)
+    return f"{directory}{os.pathsep}{os.environ.get('PATH', '')}"
+
+
+def in_selectors() -> list[str]:
+    """Input selectors declared in the agent definition."""
+    with AGENT_DEFINITION_PATH.open() as definition:
+        return list(
+            agent_definitions.AgentDefinition.from_yaml(definition).in_selectors
+        )
+
+
+def supported_selectors() -> list[str]:
+    """Input selectors whose messages can be serialized with the installed message definitions."""
+    rng = random.Random(0)
+    selectors = []
+    for selector in in_selectors():
+        try:
+            generate_message(selector, 0, rng)
+        except serializer.NoMatchingPackageNameError:
+            continue
+        selectors.append(selector)
+    return selectors
+
+
+def _random_text(rng: random.Random, lines: int) -> bytes:
+    return b"\n".join(
+        f"line {index} value={rng.getrandbits(64):016x}".encode()
+        for index in range(lines)
+    )
+
+
+def generate_message(selector: str, index: int, rng: random.Random) -> message.Message:
+    """Build a message of the selector with random content.
+
+    Raises:
+        ValueError: if the selector is not an input selector of the agent.
+    """
+    if selector == "v3.asset.file":
+        data: dict[str, object] = {
+            "content": _random_text(rng, 20),
+            "path": f"files/file_{index}.txt",
+        }
+    elif selector == trufflehog_agent.REPOSITORY_ARCHIVE_SELECTOR:
+        data = {"content_url": f"https://github.com/org/repo_{index}/archive/main.zip"}
+    elif selector == trufflehog_agent.REPOSITORY_SELECTOR:
+        data = {
+            "repository_url": f"https://github.com/org/repo_{index}.git",
+            "commit_hash": f"{rng.getrandbits(160):040x}",
+            "provider": "GITHUB",
+        }
+    elif selector == "v3.asset.link":
+        data = {"url": f"https://github.com/org/repo_{index}.git"}
+    elif selector == "v3.capture.logs":
+        data = {"message": _random_text(rng, 10).decode()}
+    elif selector == "v3.capture.request_response":
+        data = {
+            "request": {
+                "url": f"https://host/api/items/{index}",
+                "headers": [{"name": "X-Request-Id", "value": str(index)}],
+            },
+            "response": {
+                "headers": [{"name": "Content-Type", "value": "application/json"}],
+                "body": _random_text(rng, 10),
+            },
+        }
+    elif selector == trufflehog_agent.SCAN_DONE_SELECTOR:
+        data = {}
+    else:
+        raise ValueError(f"No message generator for selector {selector}.")
+    return message.Message.from_data(selector, data=data)
+
+
+def generate_messages(
+    messages_per_selector: int, seed: int = 0
+) -> list[message.Message]:
+    """Messages of every supported input selector interleaved, followed by a single scan done message."""
+    rng = random.Random(seed)
+    selectors = [
+        selector
+        for selector in supported_selectors()
+        if selector != trufflehog_agent.SCAN_DONE_SELECTOR
+    ]
+    messages = [
+        generate_message(selector, index, rng)
+        for index in range(messages_per_selector)
+        for selector in selectors
+    ]
+    messages.append(generate_message(trufflehog_agent.SCAN_DONE_SELECTOR, 0, rng))
+    return messages
+
+
+def run(
+    agent: trufflehog_agent.TruffleHogAgent, messages: list[message.Message]
+) -> LoadReport:
+    """Process the messages one after the other and measure the latency of every message."""
+    latencies: dict[str, list[float]] = {}
+    started_at = time.perf_counter()
+    for msg in messages:
+        message_started_at = time.perf_counter()
+        agent.process(msg)
+        latencies.setdefault(msg.selector, []).append(
+            time.perf_counter() - message_started_at
+        )
+    return LoadReport(duration=time.perf_counter() - started_at, latencies=latencies)
+
+
+class _LoadAgent(trufflehog_agent.TruffleHogAgent):
+    """Agent counting the messages it emits instead of sending them on the bus."""
+
+    emitted_messages = 0
+
+    def mq_send_message(
+        self, key: str, message: bytes, message_priority: int | None = None
+    ) -> None:
+        self.emitted_messages += 1
+
+
+def build_agent(redis_url: str, args: dict[str, Any]) -> _LoadAgent:
+    """Build an agent configured with the arguments, typed after the agent definition, that does not use the bus."""
+    with AGENT_DEFINITION_PATH.open() as definition_file:
+        definition = agent_definitions.AgentDefinition.from_yaml(definition_file)
+    arg_types = {arg["name"]: arg["type"] for arg in definition.args}
+    settings = runtime_definitions.AgentSettings(
+        key="agent/ostorlab/trufflehog",
+        bus_url="NA",
+        bus_exchange_topic="NA",
+        args=[
+            utils_definitions.Arg(
+                name=name, type=arg_types[name], value=json.dumps(value).encode()
+            )
+            for name, value in args.items()
+        ],
+        healthcheck_port=0,
+        redis_url=redis_url,
+    )
+    return _LoadAgent(definition, settings)
+
+
+def _parse_arg(value: str) -> tuple[str, Any]:
+    name, separator, raw_value = value.partition("=")
+    if separator == "":
+        raise argparse.ArgumentTypeError(f"Expected NAME=JSON, got {value!r}.")
+    try:
+        return name, json.loads(raw_value)
+    except json.JSONDecodeError as e:
+        raise argparse.ArgumentTypeError(f"Invalid JSON value of {name}: {e}") from e
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--messages",
+        type=int,
+        default=3,
+        help="Messages generated per input selector.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the generated messages."
+    )
+    parser.add_argument(
+        "--redis-url",
+        default=DEFAULT_REDIS_URL,
+        help="Redis server used by the agent persistence.",
+    )
+    parser.add_argument(
+        "--arg",
+        type=_parse_arg,
+        action="append",
+        default=[],
+        metavar="NAME=JSON",
+        help="Agent argument, can be repeated.",
+    )
+    options = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as directory:
+        bin_path = pathlib.Path(directory) / "bin"
+        bin_path.mkdir()
+        os.environ["PATH"] = install_fake_scanner(bin_path)
+        repository_path = pathlib.Path(directory) / "code"
+        repository_path.mkdir()
+        for index in range(REPOSITORY_FILES):
+            (repository_path / f"config_{index}.env").write_text(f"TOKEN={index}\n")
+        trufflehog_agent.REPOSITORY_CODE_PATH = str(repository_path)
+        agent = build_agent(options.redis_url, dict(options.arg))
+        report = run(agent, generate_messages(options.messages, options.seed))
+    print(report.summary())
+    print(f"{agent.emitted_messages} messages emitted")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,115 @@
+"""Load tests of the agent against the fake trufflehog scanner, exercising the real scanner processes and I/O.
+
+Set TRUFFLEHOG_LOAD_MESSAGES to increase the number of messages generated per selector.
+"""
+
+import os
+import pathlib
+import re
+
+import pytest
+from ostorlab.agent.message import message
+
+from agent import scanner
+from agent import trufflehog_agent
+from tests import load_driver
+
+MESSAGES_PER_SELECTOR = int(os.environ.get("TRUFFLEHOG_LOAD_MESSAGES") or 3)
+
+
+@pytest.fixture
+def fake_scanner_path(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> pathlib.Path:
+    """Put the fake scanner on the PATH and a repository on the shared volume path."""
+    bin_path = tmp_path / "bin"
+    bin_path.mkdir()
+    monkeypatch.setenv("PATH", load_driver.install_fake_scanner(bin_path))
+    repository_path = tmp_path / "code"
+    repository_path.mkdir()
+    for index in range(5):
+        (repository_path / f"config_{index}.env").write_text(f"TOKEN={index}\n")
+    monkeypatch.setattr(trufflehog_agent, "REPOSITORY_CODE_PATH", str(repository_path))
+    return bin_path
+
+
+def testLoadDriver_always_processEveryInputSelector(
+    fake_scanner_path: pathlib.Path,
+    trufflehog_agent_file: trufflehog_agent.TruffleHogAgent,
+    agent_mock: list[message.Message],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("FAKE_TRUFFLEHOG_FINDING_RATE", "1")
+    messages = load_driver.generate_messages(MESSAGES_PER_SELECTOR)
+
+    report = load_driver.run(trufflehog_agent_file, messages)
+
+    summary = report.summary().splitlines()
+    assert set(report.latencies) == set(load_driver.supported_selectors())
+    assert summary[0].startswith(f"{len(messages)} messages in ")
+    assert [line.split(":")[0].strip() for line in summary[1:]] == sorted(
+        report.latencies
+    )
+    assert report.message_count == len(messages)
+    assert report.throughput > 0
+    assert report.percentile(50) <= report.percentile(99)
+    assert len(agent_mock) > 0
+
+
+def testLoadDriverMain_always_printSummaryOfTheRun(
+    fake_scanner_path: pathlib.Path,
+    agent_persist_mock: dict[str | bytes, str | bytes],
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    monkeypatch.setenv("FAKE_TRUFFLEHOG_FINDING_RATE", "1")
+
+    exit_code = load_driver.main(["--messages", "1", "--arg", "report_batch_size=5"])
+
+    output = capsys.readouterr().out
+    messages_count = len(load_driver.generate_messages(1))
+    emitted = re.search(r"^(\d+) messages emitted$", output, re.MULTILINE)
+    assert exit_code == 0
+    assert re.search(rf"^{messages_count} messages in ", output, re.MULTILINE)
+    assert emitted is not None
+    assert int(emitted.group(1)) > 0
+
+
+def testFakeTrufflehog_whenScannerCrashes_reportNothing(
+    fake_scanner_path: pathlib.Path,
+    trufflehog_agent_file: trufflehog_agent.TruffleHogAgent,
+    agent_mock: list[message.Message],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("FAKE_TRUFFLEHOG_FINDING_RATE", "1")
+    monkeypatch.setenv("FAKE_TRUFFLEHOG_CRASH_RATE", "1")
+
+    trufflehog_agent_file.process(
+        message.Message.from_data(
+            "v3.asset.file", data={"content": b"TOKEN=1", "path": "config.env"}
+        )
+    )
+
+    assert len(agent_mock) == 0
+
+
+def testFakeTrufflehog_whenScannerHangs_stopItAtTheTimeout(
+    fake_scanner_path: pathlib.Path,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setenv("FAKE_TRUFFLEHOG_FINDING_RATE", "1")
+    monkeypatch.setenv("FAKE_TRUFFLEHOG_HANG_RATE", "1")
+    scanned_path = tmp_path / "scanned"
+    scanned_path.mkdir()
+    for index in range(4):
+        (scanned_path / str(index)).write_text(f"TOKEN={index}")
+
+    output = scanner.run(
+        ["trufflehog", "filesystem", str(scanned_path), "--json"],
+        scanner.ScannerSettings(kill_grace_period=1),
+        timeout=1,
+    )
+
+    assert output is not None
+    assert output.count(b"\n") == 2
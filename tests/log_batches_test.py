@@ -0,0 +1,68 @@
+"""Unittest for the batching of captured logs in Redis."""
+
+import fakeredis
+import redis
+from pytest_mock import plugin
+
+from agent import log_batches
+
+
+def testLogBatchesAdd_whenBatchIsNotFull_keepLogsPending() -> None:
+    client = fakeredis.FakeRedis()
+    batches = log_batches.LogBatches(client, "logs")
+
+    assert batches.add(b"first", batch_size=3) == []
+    assert batches.add(b"second", batch_size=3) == []
+    assert client.scard("logs") == 2
+
+
+def testLogBatchesAdd_whenBatchIsFull_takeAndRemovePendingLogs() -> None:
+    client = fakeredis.FakeRedis()
+    batches = log_batches.LogBatches(client, "logs")
+    batches.add(b"first", batch_size=2)
+
+    assert batches.add(b"second", batch_size=2) == [b"first", b"second"]
+    assert client.exists("logs") == 0
+
+
+def testLogBatchesTake_whenReplicasShareTheSet_neverTakeTheSameLogs() -> None:
+    server = fakeredis.FakeServer()
+    first_replica = log_batches.LogBatches(fakeredis.FakeRedis(server=server), "logs")
+    second_replica = log_batches.LogBatches(fakeredis.FakeRedis(server=server), "logs")
+    first_replica.add(b"first", batch_size=10)
+    second_replica.add(b"second", batch_size=10)
+
+    assert first_replica.take() == [b"first", b"second"]
+    assert second_replica.take() == []
+
+
+def testLogBatchesRestore_always_putLogsBack() -> None:
+    client = fakeredis.FakeRedis()
+    batches = log_batches.LogBatches(client, "logs")
+
+    batches.restore([b"first", b"second"])
+
+    assert batches.take() == [b"first", b"second"]
+
+
+def testLogBatchesAdd_whenConnectionFailsOnce_retryWithBackoff(
+    mocker: plugin.MockerFixture,
+) -> None:
+    client = fakeredis.FakeRedis()
+    batches = log_batches.LogBatches(client, "logs")
+    mocker.patch.object(
+        client,
+        "pipeline",
+        side_effect=[redis.exceptions.ConnectionError("reset"), client.pipeline()],
+    )
+
+    assert batches.add(b"first", batch_size=2) == []
+    assert client.scard("logs") == 1
+
+
+def testLogBatchesPending_always_countPendingLogs() -> None:
+    batches = log_batches.LogBatches(fakeredis.FakeRedis(), "logs")
+    batches.add(b"first", batch_size=3)
+    batches.add(b"second", batch_size=3)
+
+    assert batches.pending() == 2
@@ -0,0 +1,141 @@
+"""Unittest for the partitioning of repository scans between replicas."""
+
+import pathlib
+import time
+
+import fakeredis
+import pytest
+from ostorlab.agent.message import message
+
+from agent import finding
+from agent import partitioning
+
+
+def testShardOf_always_returnStableShardInRange() -> None:
+    shards = [partitioning.shard_of(f"src/file_{index}.py", 4) for index in range(200)]
+
+    assert all(0 <= shard < 4 for shard in shards)
+    assert set(shards) == {0, 1, 2, 3}
+    assert partitioning.shard_of("src/file_0.py", 4) == shards[0]
+
+
+def testPartition_always_assignEveryFileToOneShard(tmp_path: pathlib.Path) -> None:
+    for index in range(20):
+        (tmp_path / f"dir_{index % 3}").mkdir(exist_ok=True)
+        (tmp_path / f"dir_{index % 3}" / f"file_{index}").write_text("content")
+
+    shards = partitioning.partition(tmp_path, 3)
+
+    all_paths = [path for shard in shards for path in shard]
+    assert len(all_paths) == 20
+    assert set(all_paths) == set(tmp_path.rglob("file_*"))
+
+
+def testShardClaims_whenReplicasClaim_shareShardsAndFindings(
+    repository_asset_message: message.Message,
+) -> None:
+    server = fakeredis.FakeServer()
+    key = partitioning.repository_key(repository_asset_message)
+    first_replica = partitioning.ShardClaims(fakeredis.FakeRedis(server=server), key, 3)
+    second_replica = partitioning.ShardClaims(
+        fakeredis.FakeRedis(server=server), key, 3
+    )
+    secret = finding.Finding(
+        detector_name="AWS", raw="AKIA", file_path="a", line=1, verified=True
+    )
+
+    claimed = [first_replica.claim_next(), second_replica.claim_next()]
+    with first_replica.scanning(0), second_replica.scanning(1):
+        pass
+    claimed.append(first_replica.claim_next())
+    with first_replica.scanning(2):
+        pass
+    claimed.append(second_replica.claim_next())
+
+    assert claimed == [0, 1, 2, None]
+    assert first_replica.claim_finding(secret) is True
+    assert second_replica.claim_finding(secret) is False
+
+
+def testShardClaims_whenReplicaStopsRenewingItsLease_claimShardAgain(
+    repository_asset_message: message.Message,
+) -> None:
+    server = fakeredis.FakeServer()
+    key = partitioning.repository_key(repository_asset_message)
+    stopped_replica = partitioning.ShardClaims(
+        fakeredis.FakeRedis(server=server), key, 1, lease_time=0.2
+    )
+    replica = partitioning.ShardClaims(
+        fakeredis.FakeRedis(server=server), key, 1, poll_interval=0.05
+    )
+
+    assert stopped_replica.claim_next() == 0
+    assert replica.claim_next() == 0
+
+
+def testShardClaims_whileShardIsScanned_renewItsLease(
+    repository_asset_message: message.Message,
+) -> None:
+    client = fakeredis.FakeRedis()
+    key = partitioning.repository_key(repository_asset_message)
+    replica = partitioning.ShardClaims(client, key, 1, lease_time=0.3)
+    shard = replica.claim_next()
+
+    with replica.scanning(0):
+        time.sleep(0.6)
+        lease_exists = client.exists(f"{partitioning.SHARD_CLAIMS_KEY_PREFIX}:{key}:0")
+
+    assert shard == 0
+    assert lease_exists == 1
+    assert replica.claim_next() is None
+
+
+def testShardClaims_whenLeaseWasTakenOver_doNotRenewIt(
+    repository_asset_message: message.Message,
+) -> None:
+    client = fakeredis.FakeRedis()
+    key = partitioning.repository_key(repository_asset_message)
+    replica = partitioning.ShardClaims(client, key, 1, lease_time=0.3)
+    lease_key = f"{partitioning.SHARD_CLAIMS_KEY_PREFIX}:{key}:0"
+    assert replica.claim_next() == 0
+    client.set(lease_key, b"other_replica", px=300)
+
+    with replica.scanning(0):
+        time.sleep(0.2)
+        lease_time_to_live = client.pttl(lease_key)
+
+    assert lease_time_to_live < 150
+
+
+def testShardClaims_whenShardAndFindingAreClaimed_expireTheirKeys(
+    repository_asset_message: message.Message,
+) -> None:
+    client = fakeredis.FakeRedis()
+    key = partitioning.repository_key(repository_asset_message)
+    replica = partitioning.ShardClaims(client, key, 1, claims_ttl=60)
+
+    with replica.scanning(replica.claim_next() or 0):
+        replica.claim_finding(finding.Finding(detector_name="AWS", raw="AKIA"))
+
+    assert 0 < client.ttl(f"{partitioning.SHARD_CLAIMS_KEY_PREFIX}:{key}") <= 60
+    assert 0 < client.ttl(f"{partitioning.FINDINGS_KEY_PREFIX}:{key}") <= 60
+
+
+def testShardClaims_whenShardScanFails_leaveShardToBeClaimedAgain(
+    repository_asset_message: message.Message,
+) -> None:
+    server = fakeredis.FakeServer()
+    key = partitioning.repository_key(repository_asset_message)
+    failing_replica = partitioning.ShardClaims(
+        fakeredis.FakeRedis(server=server), key, 1
+    )
+    replica = partitioning.ShardClaims(fakeredis.FakeRedis(server=server), key, 1)
+
+    shard = failing_replica.claim_next()
+    with pytest.raises(partitioning.ShardScanError):
+        with failing_replica.scanning(0):
+            raise partitioning.ShardScanError("scanner failed")
+
+    assert shard == 0
+    assert failing_replica.claim_next(skipped={0}) is None
+    assert replica.claim_next() == 0
@@ -0,0 +1,120 @@
+"""Unittest for the staged processing pipeline."""
+
+import threading
+import time
+
+import pytest
+
+from agent import pipeline
+
+
+def testPipeline_always_prepareScanAndReportEveryItem() -> None:
+    reported: list[tuple[int, int]] = []
+    file_pipeline: pipeline.Pipeline[int, int, int] = pipeline.Pipeline(
+        prepare=lambda item: item * 10,
+        scan=lambda prepared: prepared + 1,
+        report=lambda prepared, output: reported.append((prepared, output)),
+        discard=lambda prepared: None,
+        prepare_workers=2,
+    )
+
+    for item in range(5):
+        file_pipeline.submit(item)
+
+    assert file_pipeline.join(timeout=5) is True
+    assert sorted(reported) == [(0, 1), (10, 11), (20, 21), (30, 31), (40, 41)]
+    assert file_pipeline.in_flight() == 0
+
+
+def testPipeline_whenItemIsSkippedOrFails_countItAsDone() -> None:
+    reported: list[int] = []
+
+    def _scan(prepared: int) -> int:
+        if prepared == 2:
+            raise RuntimeError("scanner failed")
+        return prepared
+
+    file_pipeline: pipeline.Pipeline[int, int, int] = pipeline.Pipeline(
+        prepare=lambda item: None if item == 1 else item,
+        scan=_scan,
+        report=lambda prepared, output: reported.append(output),
+        discard=lambda prepared: None,
+        prepare_workers=1,
+    )
+
+    for item in range(4):
+        file_pipeline.submit(item)
+
+    assert file_pipeline.join(timeout=5) is True
+    assert sorted(reported) == [0, 3]
+
+
+def testPipeline_always_overlapPreparationWithScans() -> None:
+    scanning = threading.Event()
+    prepared_while_scanning: list[int] = []
+
+    def _prepare(item: int) -> int:
+        if scanning.is_set() is True:
+            prepared_while_scanning.append(item)
+        return item
+
+    def _scan(prepared: int) -> int:
+        scanning.set()
+        time.sleep(0.05)
+        scanning.clear()
+        return prepared
+
+    file_pipeline: pipeline.Pipeline[int, int, int] = pipeline.Pipeline(
+        prepare=_prepare,
+        scan=_scan,
+        report=lambda prepared, output: None,
+        discard=lambda prepared: None,
+        prepare_workers=1,
+    )
+
+    for item in range(3):
+        file_pipeline.submit(item)
+        time.sleep(0.01)
+
+    assert file_pipeline.join(timeout=5) is True
+    assert len(prepared_while_scanning) > 0
+
+
+def testPipeline_whenStopped_discardWaitingItems() -> None:
+    release_scan = threading.Event()
+    discarded: list[int] = []
+    scanned: list[int] = []
+
+    def _scan(prepared: int) -> int:
+        release_scan.wait(5)
+        scanned.append(prepared)
+        return prepared
+
+    file_pipeline: pipeline.Pipeline[int, int, int] = pipeline.Pipeline(
+        prepare=lambda item: item,
+        scan=_scan,
+        report=lambda prepared, output: None,
+        discard=discarded.append,
+        prepare_workers=1,
+    )
+    for item in range(3):
+        file_pipeline.submit(item)
+    time.sleep(0.1)
+
+    file_pipeline.stop()
+    release_scan.set()
+
+    assert file_pipeline.join(timeout=5) is True
+    assert scanned == [0]
+    assert sorted(discarded) == [1, 2]
+
+
+def testPipeline_whenWorkersAreNotPositive_raiseValueError() -> None:
+    with pytest.raises(ValueError):
+        pipeline.Pipeline(
+            prepare=lambda item: item,
+            scan=lambda prepared: prepared,
+            report=lambda prepared, output: None,
+            discard=lambda prepared: None,
+            prepare_workers=0,
+        )
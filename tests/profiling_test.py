@@ -0,0 +1,70 @@
+"""Unittest for the sampling profiler of the message processing."""
+
+import pathlib
+import time
+
+import pytest
+
+from agent import profiling
+
+
+def _slow_function() -> None:
+    time.sleep(0.1)
+
+
+def testMessageProfiler_whenMessageIsSlow_writeCollapsedStacks(
+    tmp_path: pathlib.Path,
+) -> None:
+    profiler = profiling.MessageProfiler(
+        tmp_path, latency_threshold=0.05, interval=0.001
+    )
+
+    with profiler.profile("v3.asset.file"):
+        _slow_function()
+
+    profiles = list(tmp_path.glob("*.folded"))
+    assert len(profiles) == 1
+    assert "v3.asset.file" in profiles[0].name
+    lines = profiles[0].read_text().splitlines()
+    assert len(lines) > 0
+    assert all(line.rsplit(" ", 1)[1].isdigit() is True for line in lines)
+    assert any("_slow_function (tests/profiling_test.py" in line for line in lines)
+
+
+def testMessageProfiler_whenMessageIsFast_writeNothing(
+    tmp_path: pathlib.Path,
+) -> None:
+    profiler = profiling.MessageProfiler(tmp_path, latency_threshold=10)
+
+    with profiler.profile("v3.asset.file"):
+        _slow_function()
+
+    assert list(tmp_path.glob("*.folded")) == []
+
+
+def testMessageProfiler_whenMaxProfilesIsReached_deleteOldestProfiles(
+    tmp_path: pathlib.Path,
+) -> None:
+    profiler = profiling.MessageProfiler(
+        tmp_path, latency_threshold=0, interval=0.001, max_profiles=2
+    )
+
+    for selector in ("first", "second", "third"):
+        with profiler.profile(selector):
+            _slow_function()
+
+    assert sorted(profile.name.split("-")[1] for profile in tmp_path.iterdir()) == [
+        "second",
+        "third",
+    ]
+
+
+def testMessageProfilerFromArgs_whenEnvironmentVariableIsSet_enableProfiling(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    assert profiling.MessageProfiler.from_args({}) is None
+
+    monkeypatch.setenv(profiling.PROFILING_DIRECTORY_ENV, str(tmp_path / "profiles"))
+
+    assert profiling.MessageProfiler.from_args({}) is not None
+    assert (tmp_path / "profiles").is_dir() is True
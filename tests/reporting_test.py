@@ -0,0 +1,163 @@
+"""Unittest for the vulnerability report buffer."""
+
+import dataclasses
+
+import pytest
+from ostorlab.agent.kb import kb
+from ostorlab.agent.message import message
+from ostorlab.agent.mixins import agent_report_vulnerability_mixin as vuln_mixin
+
+from agent import finding
+from agent import reporting
+
+
+def _report(dna: str) -> reporting.PendingReport:
+    return reporting.PendingReport(
+        entry=kb.KB.SECRETS_REVIEW,
+        risk_rating=vuln_mixin.RiskRating.HIGH,
+        technical_detail="Secret `secret`",
+        vulnerability_location=None,
+        dna=dna,
+    )
+
+
+def testReportBuffer_whenReportsShareDna_emitOnce() -> None:
+    emitted: list[reporting.PendingReport] = []
+    buffer = reporting.ReportBuffer(emit=emitted.extend, max_pending=10)
+
+    buffer.add(_report("dna1"))
+    buffer.add(_report("dna1"))
+    buffer.add(_report("dna2"))
+    buffer.flush()
+
+    assert [report.dna for report in emitted] == ["dna1", "dna2"]
+
+
+def testReportBuffer_whenMaxPendingIsReached_emitWithoutFlush() -> None:
+    emitted: list[reporting.PendingReport] = []
+    buffer = reporting.ReportBuffer(emit=emitted.extend, max_pending=2)
+
+    buffer.add(_report("dna1"))
+    assert len(emitted) == 0
+    buffer.add(_report("dna2"))
+
+    assert len(emitted) == 2
+
+
+def testReportBuffer_whenBackgroundSender_flushWaitsForAllReports() -> None:
+    emitted: list[reporting.PendingReport] = []
+    buffer = reporting.ReportBuffer(emit=emitted.extend, max_pending=2, background=True)
+
+    for i in range(10):
+        buffer.add(_report(f"dna{i}"))
+    flushed = buffer.flush(timeout=5)
+
+    assert flushed is True
+    assert len(emitted) == 10
+
+
+def testReportBuffer_whenFlushed_emitPendingReportsInOneBatch() -> None:
+    batches: list[list[reporting.PendingReport]] = []
+    buffer = reporting.ReportBuffer(emit=batches.append, max_pending=10)
+
+    buffer.add(_report("dna1"))
+    buffer.add(_report("dna2"))
+    buffer.flush()
+    buffer.flush()
+
+    assert [[report.dna for report in batch] for batch in batches] == [["dna1", "dna2"]]
+
+
+def testReportBuffer_whenEmitFails_keepEmittingTheNextBatches() -> None:
+    emitted: list[reporting.PendingReport] = []
+
+    def _emit(reports: list[reporting.PendingReport]) -> None:
+        if reports[0].dna == "dna1":
+            raise ConnectionError("Bus is down.")
+        emitted.extend(reports)
+
+    buffer = reporting.ReportBuffer(emit=_emit, max_pending=1)
+
+    buffer.add(_report("dna1"))
+    buffer.add(_report("dna2"))
+
+    assert [report.dna for report in emitted] == ["dna2"]
+
+
+def testVulnerabilityMessage_always_appendAgentToTheAgentsOfTheReportedMessage() -> (
+    None
+):
+    report = dataclasses.replace(
+        _report("dna1"),
+        control_message=message.Message.from_data(
+            "v3.control", {"control": {"agents": ["upstream"]}, "message": b""}
+        ),
+    )
+
+    control_message = message.Message.from_raw(
+        "v3.control", reporting.vulnerability_message(report, "trufflehog")
+    )
+    vulnerability = message.Message.from_raw(
+        reporting.VULNERABILITY_SELECTOR, control_message.data["message"]
+    )
+
+    assert control_message.data["control"]["agents"] == ["upstream", "trufflehog"]
+    assert vulnerability.data["dna"] == "dna1"
+    assert vulnerability.data["risk_rating"] == "HIGH"
+    assert vulnerability.data["title"] == kb.KB.SECRETS_REVIEW.title
+
+
+def testReportingPolicy_whenVerifiedOnly_rejectUnverifiedFindings() -> None:
+    policy = reporting.ReportingPolicy()
+
+    assert (
+        policy.accepts_unverified(
+            finding.Finding(raw="s3cr3tV4lu3", detector_name="URI", verified=False)
+        )
+        is False
+    )
+
+
+def testReportingPolicy_whenUnverifiedAreReported_filterOnDetectorsAndEntropy() -> None:
+    policy = reporting.ReportingPolicy.from_args(
+        {
+            "reporting_policy": "verified_and_unverified",
+            "unverified_detectors": ["URI"],
+            "unverified_min_entropy": 3,
+        }
+    )
+
+    assert (
+        policy.accepts_unverified(
+            finding.Finding(raw="xK9#mQ2$vL7p", detector_name="URI", verified=False)
+        )
+        is True
+    )
+    assert (
+        policy.accepts_unverified(
+            finding.Finding(raw="aaaaaaaaaaaa", detector_name="URI", verified=False)
+        )
+        is False
+    )
+    assert (
+        policy.accepts_unverified(
+            finding.Finding(raw="xK9#mQ2$vL7p", detector_name="Github", verified=False)
+        )
+        is False
+    )
+
+
+def testReportingPolicy_whenModeIsUnknown_raiseValueError() -> None:
+    with pytest.raises(ValueError):
+        reporting.ReportingPolicy.from_args({"reporting_policy": "everything"})
+
+
+def testDetectorRateLimiter_whenBucketIsEmpty_denyUntilRefilled() -> None:
+    now = [0.0]
+    limiter = reporting.DetectorRateLimiter(reports_per_minute=2, clock=lambda: now[0])
+
+    assert [limiter.allow("URI") for _ in range(3)] == [True, True, False]
+    assert limiter.allow("Github") is True
+    now[0] = 30.0
+    assert limiter.allow("URI") is True
+    assert limiter.allow("URI") is False
@@ -0,0 +1,87 @@
+"""Unittest for the scan result store."""
+
+import json
+import pathlib
+import sqlite3
+
+from agent import results
+
+
+def _stored_finding(dna: str, path: str = "a.py") -> results.StoredFinding:
+    return results.StoredFinding(
+        dna=dna,
+        secret_hash=f"hash-{dna}",
+        detector="AWS",
+        asset='{"android_store": {"package_name": "a.b"}}',
+        path=path,
+        line=1,
+        verified=True,
+    )
+
+
+def testResultStore_always_queryAddedFindings(
+    tmp_path: pathlib.Path,
+) -> None:
+    store = results.ResultStore(tmp_path / "results.db")
+
+    assert store.add(_stored_finding("dna-1", path="a.py")) is True
+    assert store.add(_stored_finding("dna-1", path="a.py")) is False
+    assert store.add(_stored_finding("dna-2", path="b.py")) is True
+
+    assert store.contains_dna("dna-1") is True
+    assert store.contains_dna("dna-3") is False
+    assert store.find(path="b.py") == [_stored_finding("dna-2", path="b.py")]
+    assert len(store.find(detector="AWS")) == 2
+
+
+def testResultStore_always_writeFindingsInWalDatabase(
+    tmp_path: pathlib.Path,
+) -> None:
+    store = results.ResultStore(tmp_path / "results.db")
+
+    store.add(_stored_finding("dna-1"))
+    store.add(_stored_finding("dna-2"))
+
+    connection = sqlite3.connect(tmp_path / "results.db")
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    assert connection.execute("SELECT count(*) FROM findings").fetchone() == (2,)
+
+
+def testResultStoreAdd_whenStoresShareTheDatabase_addFindingOnce(
+    tmp_path: pathlib.Path,
+) -> None:
+    """Replicas sharing the database file store a finding once, the second add reports it as known."""
+    store = results.ResultStore(tmp_path / "results.db", scan="scan")
+    other_store = results.ResultStore(tmp_path / "results.db", scan="scan")
+
+    assert store.add(_stored_finding("dna-1")) is True
+    assert other_store.add(_stored_finding("dna-1")) is False
+
+
+def testResultStore_whenExported_writeJsonLines(tmp_path: pathlib.Path) -> None:
+    store = results.ResultStore(tmp_path / "results.db")
+    store.add(_stored_finding("dna-1"))
+
+    exported_count = store.export(tmp_path / "results.jsonl")
+
+    assert exported_count == 1
+    lines = (tmp_path / "results.jsonl").read_text().splitlines()
+    assert [json.loads(line)["dna"] for line in lines] == ["dna-1"]
+
+
+def testResultStore_whenNextScanStarts_storeFindingsAgainForThatScan(
+    tmp_path: pathlib.Path,
+) -> None:
+    store = results.ResultStore(tmp_path / "results.db", scan="first")
+    store.add(_stored_finding("dna-1"))
+
+    store.start_scan("second")
+
+    assert store.contains_dna("dna-1") is False
+    assert store.find() == []
+    store.add(_stored_finding("dna-1"))
+    assert store.contains_dna("dna-1") is True
+    connection = sqlite3.connect(tmp_path / "results.db")
+    assert connection.execute(
+        "SELECT scan, dna FROM findings ORDER BY id"
+    ).fetchall() == [("first", "dna-1"), ("second", "dna-1")]
@@ -0,0 +1,98 @@
+"""Unittest for the saturation signals published for autoscalers."""
+
+import json
+import pathlib
+import time
+
+import pytest
+
+from agent import metrics
+from agent import saturation
+
+
+def _gauges() -> saturation.Gauges:
+    return saturation.Gauges(
+        queue_depths={"v3.asset.link": 3, "v3.asset.file": 2}, pending_logs=7
+    )
+
+
+def testSaturationPublisherSignals_always_computeRatesOverTheInterval(
+    tmp_path: pathlib.Path,
+) -> None:
+    publisher = saturation.SaturationPublisher(
+        tmp_path / "signals.json", gauges=_gauges, scanner_slots=2
+    )
+    time.sleep(0.05)
+    metrics.SCANNER_BUSY_TIME.finish(metrics.SCANNER_BUSY_TIME.start())
+    metrics.COUNTERS.increment("scheduler.started_jobs", 2)
+    metrics.COUNTERS.increment("scheduler.wait_milliseconds", 300)
+    metrics.COUNTERS.increment("pipeline.scanned_items", 2)
+    metrics.COUNTERS.increment("pipeline.wait_milliseconds", 700)
+    metrics.COUNTERS.increment("messages.received", 4)
+    metrics.COUNTERS.increment("messages.received_bytes", 4096)
+
+    signals = publisher.signals()
+
+    assert signals["queue_depths"] == {"v3.asset.link": 3, "v3.asset.file": 2}
+    assert signals["queued_messages"] == 5
+    assert signals["pending_logs"] == 7
+    assert signals["scanner_slots"] == 2
+    assert 0 <= signals["scanner_utilization"] <= 0.1
+    assert signals["average_wait_seconds"] == 0.25
+    assert signals["messages_per_second"] > 0
+    assert signals["bytes_per_second"] > signals["messages_per_second"]
+    assert publisher.signals()["average_wait_seconds"] == 0.0
+
+
+def testSaturationPublisherSignals_whenScanIsRunning_countItsTimeSoFar(
+    tmp_path: pathlib.Path,
+) -> None:
+    publisher = saturation.SaturationPublisher(
+        tmp_path / "signals.json", gauges=_gauges, scanner_slots=2
+    )
+    token = metrics.SCANNER_BUSY_TIME.start()
+    try:
+        time.sleep(0.1)
+
+        signals = publisher.signals()
+    finally:
+        metrics.SCANNER_BUSY_TIME.finish(token)
+
+    assert signals["running_scans"] == 1
+    assert 0.4 <= signals["scanner_utilization"] <= 0.5
+
+
+def testSaturationPublisherPublish_always_replaceJsonFile(
+    tmp_path: pathlib.Path,
+) -> None:
+    path = tmp_path / "autoscaling" / "signals.json"
+    publisher = saturation.SaturationPublisher(path, gauges=_gauges, scanner_slots=1)
+
+    publisher.publish()
+    publisher.publish()
+
+    assert json.loads(path.read_text())["queued_messages"] == 5
+    assert [child.name for child in path.parent.iterdir()] == ["signals.json"]
+
+
+def testSaturationPublisherStop_whenStarted_publishBeforeStopping(
+    tmp_path: pathlib.Path,
+) -> None:
+    path = tmp_path / "signals.json"
+    publisher = saturation.SaturationPublisher(
+        path, gauges=_gauges, scanner_slots=1, interval=60
+    )
+    publisher.start()
+
+    publisher.stop()
+
+    assert json.loads(path.read_text())["pending_logs"] == 7
+
+
+def testSaturationPublisher_whenSlotsAreNotPositive_raiseValueError(
+    tmp_path: pathlib.Path,
+) -> None:
+    with pytest.raises(ValueError):
+        saturation.SaturationPublisher(
+            tmp_path / "signals.json", gauges=_gauges, scanner_slots=0
+        )
@@ -0,0 +1,174 @@
+"""Unittest for the supervised scanner execution."""
+
+import shutil
+from typing import Any
+
+import pytest
+from pytest_mock import plugin
+
+from agent import metrics
+from agent import scanner
+
+
+def testRun_whenCommandSucceeds_returnOutput() -> None:
+    output = scanner.run(
+        ["sh", "-c", 'echo \'{"Raw": "secret"}\''],
+        settings=scanner.ScannerSettings(),
+        timeout=10,
+    )
+
+    assert output == b'{"Raw": "secret"}\n'
+
+
+def testRun_whenCommandFails_returnNone() -> None:
+    output = scanner.run(
+        ["sh", "-c", "exit 3"], settings=scanner.ScannerSettings(), timeout=10
+    )
+
+    assert output is None
+
+
+def testRun_whenTimeoutExpires_stopScannerAndReturnCompleteLines() -> None:
+    timeouts_before = metrics.COUNTERS.get("scanner.timeouts")
+
+    output = scanner.run(
+        ["sh", "-c", 'echo \'{"Raw": "secret"}\'; printf \'{"Raw"\'; sleep 30'],
+        settings=scanner.ScannerSettings(kill_grace_period=5),
+        timeout=0.5,
+    )
+
+    assert output == b'{"Raw": "secret"}\n'
+    assert metrics.COUNTERS.get("scanner.timeouts") == timeouts_before + 1
+
+
+def testRun_whenScannerIgnoresSigterm_killProcessGroup() -> None:
+    kills_before = metrics.COUNTERS.get("scanner.kills")
+
+    output = scanner.run(
+        ["sh", "-c", "trap '' TERM; echo '{\"Raw\": \"secret\"}'; sleep 30"],
+        settings=scanner.ScannerSettings(kill_grace_period=0.5),
+        timeout=0.5,
+    )
+
+    assert output == b'{"Raw": "secret"}\n'
+    assert metrics.COUNTERS.get("scanner.kills") == kills_before + 1
+
+
+def testRun_always_startScannerInItsOwnSessionWithoutPreexecFn(
+    mocker: plugin.MockerFixture,
+) -> None:
+    process = mocker.MagicMock(pid=1234, returncode=0)
+    process.communicate.return_value = (b'{"Raw": "secret"}\n', None)
+    popen_mock = mocker.patch("subprocess.Popen", return_value=process)
+
+    output = scanner.run(["trufflehog"], settings=scanner.ScannerSettings(), timeout=10)
+
+    assert output == b'{"Raw": "secret"}\n'
+    assert popen_mock.call_args.kwargs["start_new_session"] is True
+    assert "preexec_fn" not in popen_mock.call_args.kwargs
+    process.communicate.assert_called_once_with(timeout=10)
+
+
+def testLimitedCommand_whenLimitsAreSet_wrapCommandInPrlimit() -> None:
+    settings = scanner.ScannerSettings(
+        memory_limit=512 * scanner.MEGABYTE, cpu_time_limit=60, kill_grace_period=5
+    )
+
+    command = scanner.limited_command(["trufflehog", "filesystem"], settings)
+
+    assert command == [
+        "prlimit",
+        f"--data={512 * scanner.MEGABYTE}",
+        "--cpu=60:65",
+        "--",
+        "trufflehog",
+        "filesystem",
+    ]
+    assert scanner.limited_command(["trufflehog"], scanner.ScannerSettings()) == [
+        "trufflehog"
+    ]
+
+
+@pytest.mark.skipif(shutil.which("prlimit") is None, reason="prlimit is missing.")
+def testRun_whenCpuTimeLimitIsSet_applyLimitToScanner() -> None:
+    output = scanner.run(
+        ["sh", "-c", "ulimit -t"],
+        settings=scanner.ScannerSettings(cpu_time_limit=60),
+        timeout=10,
+    )
+
+    assert output == b"60\n"
+
+
+def testScannerSettings_whenArgsAreSet_overrideDefaults() -> None:
+    settings = scanner.ScannerSettings.from_args(
+        {
+            "scanner_timeouts": {"git": 120, "filesystem": 0, "repository": 7200},
+            "scanner_memory_limit_mb": 512,
+            "scanner_cpu_time_limit": 60,
+        }
+    )
+
+    assert settings.timeout_for("git") == 120
+    assert settings.timeout_for("gitlab") == scanner.DEFAULT_TIMEOUTS["gitlab"]
+    assert settings.timeout_for("filesystem") is None
+    assert settings.timeout_for(scanner.REPOSITORY_TIMEOUT_KEY) == 7200
+    assert scanner.ScannerSettings().timeout_for(scanner.REPOSITORY_TIMEOUT_KEY) is None
+    assert settings.memory_limit == 512 * 1024 * 1024
+    assert settings.cpu_time_limit == 60
+
+
+def testScannerSettings_whenScannerOptionsAreSet_buildTrufflehogFlags() -> None:
+    settings = scanner.ScannerSettings.from_args(
+        {
+            "scanner_concurrency": 4,
+            "include_detectors": ["AWS", "Github"],
+            "exclude_detectors": ["URI"],
+            "only_verified": True,
+            "archive_max_depth": 2,
+            "archive_max_size": "10MB",
+            "filter_entropy": 3.5,
+        }
+    )
+
+    assert settings.flags() == [
+        "--concurrency=4",
+        "--include-detectors=AWS,Github",
+        "--exclude-detectors=URI",
+        "--only-verified",
+        "--archive-max-depth=2",
+        "--archive-max-size=10MB",
+        "--filter-entropy=3.5",
+    ]
+
+
+def testScannerSettings_whenArgsAreDefaults_buildNoFlags() -> None:
+    settings = scanner.ScannerSettings.from_args(
+        {
+            "scanner_concurrency": 0,
+            "include_detectors": [],
+            "exclude_detectors": [],
+            "only_verified": False,
+            "archive_max_depth": 0,
+            "archive_max_size": "",
+            "filter_entropy": 0,
+        }
+    )
+
+    assert settings.flags() == []
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        {"scanner_concurrency": -1},
+        {"include_detectors": ["AWS"], "exclude_detectors": ["AWS"]},
+        {"include_detectors": [""]},
+        {"archive_max_depth": -2},
+        {"archive_max_size": "ten megabytes"},
+        {"filter_entropy": 9},
+    ],
+)
+def testScannerSettings_whenArgIsInvalid_raiseValueError(args: dict[str, Any]) -> None:
+    with pytest.raises(ValueError):
+        scanner.ScannerSettings.from_args(args)
@@ -0,0 +1,82 @@
+"""Unittest for the long-running scans scheduler."""
+
+import threading
+
+from agent import scheduler
+
+
+def testScheduler_whenSelectorIsInteractive_doNotQueueJob() -> None:
+    job_scheduler = scheduler.Scheduler(workers=1, queue_size=1)
+
+    queued = job_scheduler.submit("v3.asset.file", lambda: None)
+
+    assert queued is False
+
+
+def testScheduler_whenNoWorkers_doNotQueueJob() -> None:
+    job_scheduler = scheduler.Scheduler(workers=0, queue_size=1)
+
+    queued = job_scheduler.submit("v3.asset.repository", lambda: None)
+
+    assert queued is False
+    assert job_scheduler.enabled is False
+
+
+def testScheduler_whenJobsAreQueued_runByPriorityAndJoin() -> None:
+    job_scheduler = scheduler.Scheduler(workers=1, queue_size=10)
+    started = threading.Event()
+    release = threading.Event()
+    completed: list[str] = []
+
+    def _blocking_job() -> None:
+        started.set()
+        release.wait(5)
+
+    job_scheduler.submit("v3.asset.link", _blocking_job)
+    started.wait(5)
+    job_scheduler.submit("v3.asset.link", lambda: completed.append("link"))
+    job_scheduler.submit("v3.asset.repository", lambda: completed.append("repository"))
+
+    assert job_scheduler.pending() == {"v3.asset.link": 2, "v3.asset.repository": 1}
+    assert job_scheduler.join(timeout=0.2) is False
+    release.set()
+
+    assert job_scheduler.join(timeout=5) is True
+    assert completed == ["repository", "link"]
+    assert job_scheduler.pending() == {}
+
+
+def testScheduler_whenJobFails_keepWorkerAlive() -> None:
+    job_scheduler = scheduler.Scheduler(workers=1, queue_size=10)
+    completed: list[str] = []
+
+    def _fail() -> None:
+        raise ValueError("boom")
+
+    job_scheduler.submit("v3.asset.repository", _fail)
+    job_scheduler.submit("v3.asset.repository", lambda: completed.append("done"))
+
+    assert job_scheduler.join(timeout=5) is True
+    assert completed == ["done"]
+
+
+def testScheduler_whenStopped_completeRunningJobAndDiscardQueuedJobs() -> None:
+    job_scheduler = scheduler.Scheduler(workers=1, queue_size=10)
+    started = threading.Event()
+    release = threading.Event()
+    completed: list[str] = []
+
+    def _blocking_job() -> None:
+        started.set()
+        release.wait(5)
+        completed.append("running")
+
+    job_scheduler.submit("v3.asset.repository", _blocking_job)
+    started.wait(5)
+    job_scheduler.submit("v3.asset.repository", lambda: completed.append("queued"))
+    job_scheduler.stop()
+    release.set()
+
+    assert job_scheduler.join(timeout=5) is True
+    assert completed == ["running"]
+    assert job_scheduler.pending() == {}
@@ -0,0 +1,52 @@
+"""Unittest for the startup profiling and warm-up."""
+
+from collections.abc import Callable
+from unittest import mock
+
+from agent import scanner
+from agent import startup
+
+IMPORT_TIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      3014 |      17269 |   tenacity
+import time:      8888 |    1602291 | agent.trufflehog_agent
+"""
+
+
+def testParseImportTimes_always_parseModulesAndDepth() -> None:
+    import_times = startup.parse_import_times(IMPORT_TIME_OUTPUT)
+
+    assert import_times == [
+        startup.ImportTime(module="_io", self_time=120, cumulative_time=120, depth=1),
+        startup.ImportTime(
+            module="tenacity", self_time=3014, cumulative_time=17269, depth=1
+        ),
+        startup.ImportTime(
+            module="agent.trufflehog_agent",
+            self_time=8888,
+            cumulative_time=1602291,
+            depth=0,
+        ),
+    ]
+
+
+def testWarmUp_always_runScannerOnce(
+    scanner_mock: Callable[..., mock.MagicMock],
+) -> None:
+    subprocess_mock = scanner_mock(b"")
+
+    durations = startup.warm_up(scanner.ScannerSettings())
+
+    assert subprocess_mock.call_count == 1
+    assert subprocess_mock.call_args[0][0][:2] == ["trufflehog", "filesystem"]
+    assert set(durations) == {"libmagic", "scanner"}
+
+
+def testWarmUp_whenScannerIsMissing_doNotRaise(
+    scanner_mock: Callable[..., mock.MagicMock],
+) -> None:
+    scanner_mock(side_effect=FileNotFoundError("trufflehog"))
+
+    durations = startup.warm_up(scanner.ScannerSettings())
+
+    assert durations["scanner"] >= 0
@@ -2,10 +2,12 @@
 
 import pytest
 
+from agent import finding
+from agent import metrics
 from agent import utils
 
 
-def testLoadNewLineJson_always_LoadDataCorrectly() -> None:
+def testIterNewlineJson_always_LoadDataCorrectly() -> None:
     input_value = (
         b'{"id": 1,'
         b'"first_name": "Jeanette",'
@@ -41,7 +43,7 @@ def testLoadNewLineJson_always_LoadDataCorrectly() -> None:
         },
     ]
 
-    current_result = utils.load_newline_json(input_value)
+    current_result = list(utils.iter_newline_json(input_value))
 
     assert len(current_result) == len(expected_result)
     assert any(
@@ -50,51 +52,16 @@ def testLoadNewLineJson_always_LoadDataCorrectly() -> None:
     )
 
 
-def testPruneReports_always_dedupCorrectly() -> None:
+def testPruneFindings_always_dedupCorrectly() -> None:
     dups_list = [
-        {
-            "Raw": 1,
-            "first_name": "Jeanette",
-            "last_name": "Penddreth",
-            "email": "jpenddreth0@census.gov",
-            "gender": "Female",
-            "ip_address": "26.58.193.2",
-        },
-        {
-            "Raw": 2,
-            "first_name": "Giavani",
-            "last_name": "Frediani",
-            "email": "gfrediani1@senate.gov",
-            "gender": "Male",
-            "ip_address": "229.179.4.212",
-        },
-        {
-            "Raw": 2,
-            "first_name": "Giavani",
-            "last_name": "Frediani",
-            "email": "gfrediani1@senate.gov",
-            "gender": "Male",
-            "ip_address": "229.179.4.212",
-        },
-        {
-            "Raw": 2,
-            "first_name": "Giavani",
-            "last_name": "Frediani",
-            "email": "gfrediani1@senate.gov",
-            "gender": "Male",
-            "ip_address": "229.179.4.212",
-        },
-        {
-            "Raw": 1,
-            "first_name": "Jeanette",
-            "last_name": "Penddreth",
-            "email": "jpenddreth0@census.gov",
-            "gender": "Female",
-            "ip_address": "26.58.193.2",
-        },
+        finding.Finding(raw="1", detector_name="URI", file_path="a"),
+        finding.Finding(raw="2", detector_name="URI", file_path="a"),
+        finding.Finding(raw="2", detector_name="URI", file_path="b"),
+        finding.Finding(raw="2", detector_name="URI", file_path="c"),
+        finding.Finding(raw="1", detector_name="URI", file_path="b"),
     ]
 
-    deduped_list = utils.prune_reports(dups_list)
+    deduped_list = utils.prune_findings(dups_list)
 
     assert len(deduped_list) == 2
 
@@ -201,3 +168,64 @@ def testShouldExcludePath_whenRegexIsInvalid_shouldSkipPatternAndReturnFalse() -
     result = utils.should_exclude_path("/workspace/a.py", ["[invalid("])
 
     assert result is False
+
+
+def testIterNewlineJson_whenLinesAreMalformed_skipAndCountThem() -> None:
+    metrics.COUNTERS.reset()
+    output = (
+        b'{"Raw": "secret-\xff"}\nnot json\n[1, 2]\n\n{"Raw": "second"}\n{"Raw": "trunc'
+    )
+
+    elements = list(utils.iter_newline_json(output))
+
+    assert elements == [{"Raw": "secret-�"}, {"Raw": "second"}]
+    assert metrics.COUNTERS.get("scanner_output.invalid_utf8_lines") == 1
+    assert metrics.COUNTERS.get("scanner_output.malformed_lines") == 3
+
+
+def testIterFindings_always_projectUsedFields() -> None:
+    output = (
+        b'{"SourceMetadata": {"Data": {"Filesystem": {"file": "/tmp/scan/a/b.py", "line": 3}}},'
+        b' "DetectorName": "AWS", "Verified": true, "Raw": "AKIA", "Redacted": "AK**",'
+        b' "ExtraData": {"account": "1"}}\n'
+    )
+
+    findings = list(utils.iter_findings(output, base_path="/tmp/scan"))
+
+    assert findings == [
+        finding.Finding(
+            raw="AKIA",
+            redacted="AK**",
+            detector_name="AWS",
+            verified=True,
+            file_path="a/b.py",
+            line=3,
+        )
+    ]
+    assert findings[0].dedup_key == "AKIA"
+    assert hasattr(findings[0], "__dict__") is False
+
+
+def testPruneFindings_always_keepFirstFindingOfEverySecret() -> None:
+    findings = [
+        finding.Finding(raw="AKIA", file_path="a"),
+        finding.Finding(raw="AKIA", file_path="b"),
+        finding.Finding(raw="ghp_", file_path="a"),
+    ]
+
+    unique_findings = utils.prune_findings(findings)
+
+    assert [(secret.raw, secret.file_path) for secret in unique_findings] == [
+        ("AKIA", "a"),
+        ("ghp_", "a"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "text,expected_entropy",
+    [("", 0.0), ("aaaa", 0.0), ("abab", 1.0), ("abcd", 2.0)],
+)
+def testShannonEntropy_always_returnBitsPerCharacter(
+    text: str, expected_entropy: float
+) -> None:
+    assert utils.shannon_entropy(text) == pytest.approx(expected_entropy)
@@ -0,0 +1,183 @@
+"""Unittest for the verification outcome cache."""
+
+import pathlib
+from collections.abc import Callable
+from unittest import mock
+
+from agent import finding
+from agent import scanner
+from agent import verification
+
+
+class FakeVerifier:
+    """Verifier returning fixed outcomes and recording the verified secrets."""
+
+    def __init__(self, live_secrets: set[str]) -> None:
+        self.live_secrets = live_secrets
+        self.verified_secrets: list[str | None] = []
+
+    def verify(
+        self, findings: list[finding.Finding]
+    ) -> dict[verification.VerificationKey, bool] | None:
+        self.verified_secrets.extend(secret.raw for secret in findings)
+        return {
+            (secret.detector_name, secret.raw or ""): secret.raw in self.live_secrets
+            for secret in findings
+        }
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _findings() -> list[finding.Finding]:
+    return [
+        finding.Finding(raw="live", detector_name="AWS"),
+        finding.Finding(raw="dead", detector_name="AWS"),
+    ]
+
+
+def testResolve_whenSecretsAreCached_doNotVerifyThemAgain(
+    tmp_path: pathlib.Path,
+) -> None:
+    cache = verification.VerificationCache(
+        verification.SqliteBackend(tmp_path / "cache.db"), salt="salt"
+    )
+    verifier = FakeVerifier(live_secrets={"live"})
+    first_findings = _findings()
+    second_findings = _findings()
+
+    cache.resolve(first_findings, verifier)
+    cache.resolve(second_findings, verifier)
+
+    assert verifier.verified_secrets == ["live", "dead"]
+    assert [secret.verified for secret in first_findings] == [True, False]
+    assert [secret.verified for secret in second_findings] == [True, False]
+
+
+def testResolve_whenOutcomeExpired_verifyAgain(tmp_path: pathlib.Path) -> None:
+    clock = FakeClock()
+    cache = verification.VerificationCache(
+        verification.SqliteBackend(tmp_path / "cache.db"),
+        salt="salt",
+        verified_ttl=100,
+        unverified_ttl=10,
+        clock=clock,
+    )
+    verifier = FakeVerifier(live_secrets={"live"})
+    cache.resolve(_findings(), verifier)
+
+    clock.now += 50
+    cache.resolve(_findings(), verifier)
+
+    assert verifier.verified_secrets == ["live", "dead", "dead"]
+
+
+def testKey_always_hashSecretWithSalt() -> None:
+    cache = verification.VerificationCache(
+        verification.SqliteBackend(":memory:"), salt="salt"
+    )
+    other_cache = verification.VerificationCache(
+        verification.SqliteBackend(":memory:"), salt="other"
+    )
+
+    key = cache.key("AWS", "AKIA")
+
+    assert "AKIA" not in key
+    assert key != cache.key("GCP", "AKIA")
+    assert key != other_cache.key("AWS", "AKIA")
+
+
+def testScannerVerifier_always_verifyOnlyGivenSecrets(
+    scanner_mock: Callable[..., mock.MagicMock],
+) -> None:
+    scanned_contents: list[bytes] = []
+
+    def _run_scanner(command: list[str], **kwargs: object) -> bytes:
+        scanned_contents.append(pathlib.Path(command[2]).read_bytes())
+        assert "--include-detectors=AWS" in command
+        assert "--no-verification" not in command
+        return b'{"DetectorName":"AWS","Verified":true,"Raw":"AKIA","RawV2":"AKIA:secret"}\n'
+
+    scanner_mock(side_effect=_run_scanner)
+    verifier = verification.ScannerVerifier(scanner.ScannerSettings(verify=False))
+
+    outcomes = verifier.verify(
+        [finding.Finding(raw="AKIA", raw_v2="AKIA:secret", detector_name="AWS")]
+    )
+
+    assert scanned_contents == [b"AKIA:secret\n"]
+    assert outcomes == {("AWS", "AKIA"): True}
+
+
+def testResolve_whenDetectorDoesNotMatchBareSecret_keepStatusAndDoNotCache(
+    scanner_mock: Callable[..., mock.MagicMock],
+) -> None:
+    """The URI detector needs the surrounding credentials, the bare secret is not detected again."""
+    scanner_run_mock = scanner_mock(b"")
+    cache = verification.VerificationCache(
+        verification.SqliteBackend(":memory:"), salt="salt"
+    )
+    verifier = verification.ScannerVerifier(scanner.ScannerSettings(verify=False))
+    secret = finding.Finding(raw="password", detector_name="URI", verified=True)
+
+    cache.resolve([secret], verifier)
+    cache.resolve([secret], verifier)
+
+    assert secret.verified is True
+    assert cache.get("URI", "password") is None
+    assert scanner_run_mock.call_count == 2
+
+
+def testResolve_whenBareSecretIsNotDetected_verifyItByScanningItsTarget(
+    scanner_mock: Callable[..., mock.MagicMock],
+) -> None:
+    """The AWS detector needs the key id next to its secret key, the bare secret is verified in its target."""
+    scanner_mock(b"")
+    cache = verification.VerificationCache(
+        verification.SqliteBackend(":memory:"), salt="salt"
+    )
+    settings = scanner.ScannerSettings(verify=False)
+    rescan_settings: list[scanner.ScannerSettings] = []
+
+    def _rescan(settings: scanner.ScannerSettings) -> bytes:
+        rescan_settings.append(settings)
+        return b'{"DetectorName":"AWS","Verified":true,"Raw":"AKIA","RawV2":"AKIA:secret"}\n'
+
+    secret = finding.Finding(raw="AKIA", raw_v2="AKIA:secret", detector_name="AWS")
+
+    cache.resolve(
+        [secret],
+        verification.ScannerVerifier(settings),
+        fallback=verification.RescanVerifier(settings, _rescan),
+    )
+
+    assert secret.verified is True
+    assert cache.get("AWS", "AKIA") is True
+    assert len(rescan_settings) == 1
+    assert rescan_settings[0].verify is True
+    assert rescan_settings[0].include_detectors == ("AWS",)
+
+
+def testResolve_whenRescanDoesNotDetectSecret_keepStatus(
+    scanner_mock: Callable[..., mock.MagicMock],
+) -> None:
+    scanner_mock(b"")
+    cache = verification.VerificationCache(
+        verification.SqliteBackend(":memory:"), salt="salt"
+    )
+    settings = scanner.ScannerSettings(verify=False)
+    secret = finding.Finding(raw="password", detector_name="URI", verified=True)
+
+    cache.resolve(
+        [secret],
+        verification.ScannerVerifier(settings),
+        fallback=verification.RescanVerifier(settings, lambda settings: b""),
+    )
+
+    assert secret.verified is True
+    assert cache.get("URI", "password") is None